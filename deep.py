@@ -1,21 +1,26 @@
-import pandas as pd
 import subprocess
 import json
 from pyvis.network import Network
 import os
+import sys
 
-env = os.environ.copy()
-env['PYTHONIOENCODING'] = 'utf-8'
+# Shared helpers live next to the website's process_data.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'website'))
+from corpus_store import lookup_text
+from llm_client import LLMError, get_backend
+from model_output import parse_graph
+from metrics import begin_trace, record_llm_call, record_trace, span
 
-# Step 1: Read Excel File
+# Stage timings and model call sizes for this run, printed at the end and added to metrics.py's counters
+trace = begin_trace()
+
+# Step 1: Read Excel File (through the memory-mapped cache)
 file_path = "wikileaks_parsed.xlsx"
-data = pd.read_excel(file_path)
-text_data = data['Text']  
-filtered_data = data[data['PDF Path'] == '14.pdf']
-combined_data = " ".join(filtered_data['Text'].dropna())
+with span("read text"):
+    combined_data = lookup_text(file_path, '14.pdf')
 
 # Step 2: Use Ollama to Extract Entities and Relationships
-command = ["ollama", "run", "llama3.2"]
+backend = get_backend()
 prompt = f"""
 Please analyze the following text and summarize the involved entities and the relationships between them in a clear, narrative form. For each entity, provide a brief description of what it is. Then, summarize how the entities are related to each other in terms of their interactions or associations.
 
@@ -72,21 +77,29 @@ Example structure (do not copy it directly):
 """
 
 try:
-    result = subprocess.run(command, input=prompt, capture_output=True, text=True, check=True, env=env)
-    output = result.stdout
+    with span("narrative prompt"):
+        completion = backend.complete(prompt)
+    record_llm_call("narrative", prompt, completion)
+    output = completion["text"]
     #print("Ollama Output:", output)  # Debugging line to examine raw output
     
-    result_2 = subprocess.run(command, input=prompt_2, capture_output=True, text=True, check=True, env=env)
-    output_2 = result_2.stdout
-    output_2 = output_2.strip()
-    output_2 = output_2.strip("`")
-    output_2 = output_2.strip(",")
+    with span("graph prompt"):
+        completion_2 = backend.complete(prompt_2)
+    record_llm_call("graph", prompt_2, completion_2)
+    output_2 = completion_2["text"]
     print("Ollama Output for Prompt 2:", output_2)
     
-    output_2_dict = json.loads(output_2)
+    # Tolerant parse: finds the JSON among any prose/fences and normalizes the key names
+    with span("parse json"):
+        output_2_dict = parse_graph(output_2)
 
 except subprocess.CalledProcessError as e:
     print("Error:", e.stderr)
+    record_trace(trace, "deep", "error")
+    exit()
+except LLMError as e:
+    print("Error:", e)
+    record_trace(trace, "deep", "error")
     exit()
 
 
@@ -110,8 +123,8 @@ if isinstance(output_2_dict, dict):
 
     # Add edges for relationships
     for relationship in relationships:
-        from_node = relationship['from']
-        to_node = relationship['to']
+        from_node = relationship['source']
+        to_node = relationship['target']
 
         # Add missing nodes dynamically
         if from_node not in entity_names:
@@ -125,4 +138,8 @@ if isinstance(output_2_dict, dict):
         net.add_edge(from_node, to_node, title=relationship['description'], label=relationship['description'])
 
     # Show the network
-    net.show("entity_network.html")
+    with span("render html"):
+        net.show("entity_network.html")
+
+record_trace(trace, "deep", "ok" if isinstance(output_2_dict, dict) else "error")
+print("Metrics:", json.dumps(trace.summary(), indent=2))
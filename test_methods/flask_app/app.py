@@ -1,34 +1,35 @@
 import os
-from flask import Flask, render_template, request, jsonify
-import pandas as pd
+from flask import Flask, Response, render_template, request, jsonify
+import sys
 import subprocess
 import json
 from pyvis.network import Network
 
+# Shared helpers live next to the website's process_data.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'website'))
+from corpus_store import ID_COLUMNS, lookup_text
+from llm_client import LLMError, get_backend
+from model_output import parse_graph
+from metrics import get_store, record_llm_call, record_trace, span, start_trace
+
 app = Flask(__name__)
-command = ["ollama", "run", "llama3.2"]
+# One pooled model client shared by every request
+backend = get_backend()
 # Function to check if the file exists in the given Excel
 def check_pdf_or_link(excel_file, identifier):
-    # Read the Excel file
-    data = pd.read_excel(excel_file)
     print(identifier)
     print(excel_file)
-    
 
-    # Check if necessary columns exist
-    if excel_file == "wikileaks_parsed.xlsx" and 'PDF Path' in data.columns:
-        filtered_data = data[data['PDF Path'] == identifier]
-    elif excel_file == "news_excerpts_parsed.xlsx" and 'Link' in data.columns:
-        filtered_data = data[data['Link'] == identifier]
-    else:
+    # Text comes pre-joined from the identifier index built alongside the Excel cache
+    if excel_file not in ID_COLUMNS:
         raise ValueError(f"Column not found for {excel_file} or identifier mismatch.")
-    
-    # Check if the filtered data is empty
-    if filtered_data.empty:
+    combined_data = lookup_text(excel_file, identifier)
+
+    # Check if the identifier was found
+    if combined_data == "":
         raise ValueError(f"No data found for the identifier: {identifier}")
-    
-    
-    return filtered_data['Text'].dropna().to_string(index=False)
+
+    return combined_data
 
 # Function to generate the network graph
 def generate_network_graph(entities, relationships):
@@ -43,8 +44,8 @@ def generate_network_graph(entities, relationships):
 
     # Add edges for relationships
     for relationship in relationships:
-        from_node = relationship['from']
-        to_node = relationship['to']
+        from_node = relationship['source']
+        to_node = relationship['target']
 
         # Add missing nodes dynamically
         if from_node not in entity_names:
@@ -58,7 +59,8 @@ def generate_network_graph(entities, relationships):
         net.add_edge(from_node, to_node, title=relationship['description'], label=relationship['description'])
 
     # Show the network
-    net.show(os.path.join('static', 'entity_network.html'))
+    with span("render html"):
+        net.show(os.path.join('static', 'entity_network.html'))
 
 @app.route('/')
 def index():
@@ -66,16 +68,36 @@ def index():
 
 @app.route('/process', methods=['POST'])
 def process():
+    # Stage timings and model call sizes go into the response and the counters served on /metrics
+    with start_trace() as trace:
+        # Requests that raise are counted as errors too, so /metrics is not biased towards successes
+        status = "error"
+        try:
+            response, status = process_traced()
+        finally:
+            record_trace(trace, "flask", status)
+        summary = trace.summary()
+    if response.is_json:
+        response.set_data(json.dumps({**response.get_json(), "metrics": summary}))
+    # Also readable in the browser's network panel
+    response.headers['Server-Timing'] = ", ".join(
+        f'stage{i};desc="{stage["name"]}";dur={stage["seconds"] * 1000:.1f}' for i, stage in enumerate(summary["stages"])
+    )
+    return response
+
+def process_traced():
+    # Returns (response, outcome)
     excel_file = request.form['excel_choice']
     identifier = request.form['identifier']
     
     # Check the file name and process accordingly
     if excel_file not in ["wikileaks_parsed.xlsx", "news_excerpts_parsed.xlsx"]:
-        return jsonify({"status": "error", "message": "Invalid file selection."})
+        return jsonify({"status": "error", "message": "Invalid file selection."}), "error"
 
     try:
         # Get text data based on the choice
-        combined_data = check_pdf_or_link(excel_file, identifier)
+        with span("read text"):
+            combined_data = check_pdf_or_link(excel_file, identifier)
 
         prompt = f"""
         Please analyze the following text and summarize the involved entities and the relationships between them in a clear, narrative form. For each entity, provide a brief description of what it is. Then, summarize how the entities are related to each other in terms of their interactions or associations.
@@ -132,21 +154,27 @@ def process():
         {combined_data}
         """
 
-        # Call subprocess to run the Ollama commands
-        result = subprocess.run(command, input=prompt, capture_output=True, text=True, check=True)
-        output = result.stdout
+        # Send both prompts to the model server
+        with span("narrative prompt"):
+            completion = backend.complete(prompt)
+        record_llm_call("narrative", prompt, completion)
+        output = completion["text"]
         
-        result_2 = subprocess.run(command, input=prompt_2, capture_output=True, text=True, check=True)
-        output_2 = result_2.stdout
-        output_2 = output_2.strip()
-        output_2 = output_2.strip("`")
+        with span("graph prompt"):
+            completion_2 = backend.complete(prompt_2)
+        record_llm_call("graph", prompt_2, completion_2)
+        output_2 = completion_2["text"]
         print("Ollama Output for Prompt 2:", output_2)
     
-        output_2_dict = json.loads(output_2)
+        # Tolerant parse: finds the JSON among any prose/fences and normalizes the key names
+        with span("parse json"):
+            output_2_dict = parse_graph(output_2)
 
     except subprocess.CalledProcessError as e:
         print("Error:", e.stderr)
         exit()
+    except LLMError as e:
+        return jsonify({"status": "error", "message": str(e)}), "error"
 
     # Generate network graph only if the output is valid
     if isinstance(output_2_dict, dict):
@@ -154,8 +182,14 @@ def process():
         relationships = output_2_dict.get('relationships', [])
         generate_network_graph(entities, relationships)
         
-        return render_template('index.html', graph_url="/static/entity_network.html", identifier='')
+        return Response(render_template('index.html', graph_url="/static/entity_network.html", identifier='')), "ok"
+
+    return jsonify({"status": "error", "message": "No valid data found for the identifier."}), "error"
+
+# Prometheus text format, the same counters as the website's GET /api/metrics
+@app.route('/metrics')
+def metrics():
+    return Response(get_store().render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    return jsonify({"status": "error", "message": "No valid data found for the identifier."})
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,18 +1,23 @@
-import pandas as pd
+import os
+import sys
 import subprocess
 import json
 import networkx as nx
 import matplotlib.pyplot as plt
 
-# Step 1: Read Excel File
+# Shared helpers live next to the website's process_data.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website'))
+from corpus_store import lookup_text
+from llm_client import LLMError, get_backend
+from model_output import parse_graph
+from graph_layout import compute_layout
+
+# Step 1: Read Excel File (through the memory-mapped cache)
 file_path = "wikileaks_parsed.xlsx"
-data = pd.read_excel(file_path)
-text_data = data['Text']  # Replace 'Text' with your column name
-filtered_data = data[data['PDF Path'] == '106.pdf']
-combined_data = " ".join(filtered_data['Text'].dropna())
+combined_data = lookup_text(file_path, '106.pdf')
 
 # Step 2: Use Ollama to Extract Entities and Relationships
-command = ["ollama", "run", "llama3.2"]
+backend = get_backend()
 prompt = f"""
 Please analyze the following text and summarize the involved entities and the relationships between them in a clear, narrative form. For each entity, provide a brief description of what it is. Then, summarize how the entities are related to each other in terms of their interactions or associations.
 
@@ -71,20 +76,20 @@ Example structure (do not copy it directly):
 
 
 try:
-    result = subprocess.run(command, input=prompt, capture_output=True, text=True, check=True)
-    output = result.stdout
+    output = backend.generate(prompt)
     print("Ollama Output:", output)  # Debugging line to examine raw output
-    result_2 = subprocess.run(command, input=prompt_2, capture_output=True, text=True, check=True)
-    output_2 = result_2.stdout
-    output_2 = output_2.strip()
-    output_2 = output_2.strip("`")
+    output_2 = backend.generate(prompt_2)
     print("Ollama Output for Prompt 2:", output_2)
    
-    output_2_dict = json.loads(output_2)
+    # Tolerant parse: finds the JSON among any prose/fences and normalizes the key names
+    output_2_dict = parse_graph(output_2)
 
 except subprocess.CalledProcessError as e:
     print("Error:", e.stderr)
     exit()
+except LLMError as e:
+    print("Error:", e)
+    exit()
 
 # Step 3: Parse and Create Network Graph from Relationships
 if isinstance(output_2_dict, dict):
@@ -103,11 +108,15 @@ if isinstance(output_2_dict, dict):
 
     # Add Edges (Relationships)
     for relationship in relationships:
-        G.add_edge(relationship['from'], relationship['to'], description=relationship['description'])
+        G.add_edge(relationship['source'], relationship['target'], description=relationship['description'])
 
     # Step 3: Visualize the Network Graph
     plt.figure(figsize=(15, 15))
-    pos = nx.kamada_kawai_layout(G, scale=2)  # For better visualization of the graph
+    # Spectral start + force-directed refinement, linear memory unlike kamada_kawai's n x n distances
+    nodes = list(G.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    positions = compute_layout(len(nodes), [(index[a], index[b]) for a, b in G.edges])
+    pos = dict(zip(nodes, positions))
     nx.draw(G, pos, with_labels=True, node_size=3000, node_color='skyblue', font_size=10, font_weight='bold', edge_color='gray', arrows=True)
 
     # Display edge labels (relationship descriptions)
@@ -0,0 +1,221 @@
+# Precomputes extractions for every document in the bundled workbooks.
+#
+#   python batch_extract.py                      # all documents, resumes where the last run stopped
+#   python batch_extract.py --workers 4 --limit 50
+#   python batch_extract.py --retry-failed
+#
+# Results go to data/cache/results.sqlite (one row per document, written as soon as it finishes,
+# which is also the checkpoint), into the extraction cache, so later requests are instant,
+# and into the cross-document graph in graph_store.py.
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from corpus_store import ID_COLUMNS, load_index
+from dedup import clean, corpus_boilerplate
+from extraction import MODES, extract
+from extraction_cache import ExtractionCache
+from graph_store import GraphStore
+from llm_client import DEFAULT_CONCURRENCY, get_backend
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_RESULTS_PATH = os.path.join(DATA_DIR, "cache", "results.sqlite")
+
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_RESULTS_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                source TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                status TEXT NOT NULL,
+                narrative TEXT,
+                graph TEXT,
+                error TEXT,
+                usage TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (source, identifier, mode)
+            );
+        """)
+        self._conn.commit()
+
+    def finished(self, mode, include_failed=True):
+        # (source, identifier) pairs that a resumed run can skip
+        statuses = ("done", "failed") if include_failed else ("done",)
+        rows = self._conn.execute(
+            f"SELECT source, identifier FROM results WHERE mode = ? AND status IN ({','.join('?' * len(statuses))})",
+            (mode, *statuses),
+        ).fetchall()
+        return set(rows)
+
+    def save(self, source, identifier, mode, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    source,
+                    identifier,
+                    mode,
+                    "failed" if error else "done",
+                    result["narrative"] if result else None,
+                    json.dumps(result["graph"]) if result else None,
+                    error,
+                    json.dumps(result["usage"]) if result else None,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def get(self, source, identifier, mode="dual"):
+        row = self._conn.execute(
+            "SELECT status, narrative, graph, error FROM results WHERE source = ? AND identifier = ? AND mode = ?",
+            (source, identifier, mode),
+        ).fetchone()
+        if row is None:
+            return None
+        status, narrative, graph, error = row
+        return {"status": status, "narrative": narrative, "graph": json.loads(graph) if graph else None, "error": error}
+
+    def counts(self):
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM results GROUP BY status").fetchall())
+
+    def close(self):
+        self._conn.close()
+
+
+def iter_documents(sources, skip=frozenset()):
+    # Read one at a time, so a huge corpus is never held in memory
+    for source in sources:
+        name = os.path.basename(source)
+        for identifier, text in load_index(source).items():
+            if text and (name, identifier) not in skip:
+                yield name, identifier, text
+
+
+def count_documents(sources, skip=frozenset()):
+    # Identifiers only, texts are not read (documents without text are skipped later, not counted out here)
+    return sum(
+        1
+        for source in sources
+        for identifier in load_index(source)
+        if (os.path.basename(source), identifier) not in skip
+    )
+
+
+def run_batch(sources, mode="dual", workers=DEFAULT_CONCURRENCY, limit=None, retry_failed=False,
+              store=None, cache=None, graph=None, ner_filter=False, dedup=True):
+    store = store or ResultStore()
+    cache = cache or ExtractionCache()
+    graph = graph or GraphStore()
+    backend = get_backend()
+
+    skip = store.finished(mode, include_failed=not retry_failed)
+    pending = iter_documents(sources, skip)
+    total = count_documents(sources, skip)
+    if limit is not None:
+        pending = itertools.islice(pending, limit)
+        total = min(total, limit)
+    print(f"{len(skip)} documents already finished, {total} to extract with {workers} workers", file=sys.stderr)
+
+    # Boilerplate is found once per workbook, before the workers start
+    boilerplate = {os.path.basename(source): corpus_boilerplate(source) for source in sources} if dedup else {}
+    removed = {"chars": 0, "tokens": 0}
+
+    def work(source, identifier, text):
+        started = time.perf_counter()
+        stats = None
+        try:
+            if dedup:
+                text, stats = clean(text, boilerplate[source])
+            if ner_filter:
+                from ner import prefilter
+                text, _ = prefilter(text)
+            result = extract(text, mode=mode, backend=backend, cache=cache)
+        except Exception as e:
+            store.save(source, identifier, mode, error=f"{type(e).__name__}: {e}")
+            return False, time.perf_counter() - started, stats
+        if isinstance(result["graph"], dict):
+            try:
+                graph.merge_document(source, identifier, result["graph"])
+            except Exception as e:
+                # Failed with its result kept; --retry-failed extracts and merges it again
+                store.save(source, identifier, mode, result=result, error=f"merge: {type(e).__name__}: {e}")
+                return False, time.perf_counter() - started, stats
+        store.save(source, identifier, mode, result=result)
+        return True, time.perf_counter() - started, stats
+
+    # At most 2x workers documents are queued at once, so a huge corpus never piles up in memory
+    max_in_flight = workers * 2
+    in_flight = {}
+    completed = 0
+    failed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    doc = next(pending, None)
+                    if doc is None:
+                        break
+                    in_flight[pool.submit(work, *doc)] = doc
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source, identifier, _ = in_flight.pop(future)
+                    ok, seconds, stats = future.result()
+                    if stats is not None:
+                        removed["chars"] += stats["chars_removed"]
+                        removed["tokens"] += stats["tokens_removed"]
+                    completed += 1
+                    failed += 0 if ok else 1
+                    status = "done" if ok else "FAILED"
+                    print(f"[{completed}/{total}] {source} {identifier} {status} in {seconds:.1f}s", file=sys.stderr)
+        except KeyboardInterrupt:
+            # Everything already saved is kept; the next run picks up from there
+            for future in in_flight:
+                future.cancel()
+            print("Interrupted, progress has been checkpointed", file=sys.stderr)
+            raise
+
+    elapsed = time.perf_counter() - started
+    return {"extracted": completed - failed, "failed": failed, "seconds": elapsed, "store": store.counts(),
+            "dedup_removed": removed if dedup else None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="*", help="workbooks to process (defaults to both bundled ones)")
+    parser.add_argument("--mode", choices=MODES, default="dual")
+    parser.add_argument("--workers", type=int, default=DEFAULT_CONCURRENCY,
+                        help="documents processed at once (keep at or below LLM_CONCURRENCY)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after N documents")
+    parser.add_argument("--retry-failed", action="store_true", help="extract documents that failed last time again")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="results database")
+    parser.add_argument("--ner-filter", action="store_true",
+                        help="send only sentences with two or more NER entities to the LLM (needs torch/transformers)")
+    parser.add_argument("--keep-duplicates", dest="dedup", action="store_false",
+                        default=os.environ.get("DEDUP", "1") != "0", help="do not drop boilerplate headings and repeated sentences before extraction (dedup.py)")
+    args = parser.parse_args()
+
+    sources = args.sources or [os.path.join(DATA_DIR, name) for name in ID_COLUMNS]
+    summary = run_batch(sources, mode=args.mode, workers=max(1, args.workers), limit=args.limit,
+                        retry_failed=args.retry_failed, store=ResultStore(args.results), ner_filter=args.ner_filter,
+                        dedup=args.dedup)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
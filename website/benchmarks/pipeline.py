@@ -0,0 +1,270 @@
+# Times every stage of the analyze pipeline against the stub model server (benchmarks/stub_llm.py).
+#
+#   python benchmarks/pipeline.py                                  # 5 short, 5 medium, 5 long documents
+#   python benchmarks/pipeline.py --per-bucket 20 --latency 0.2 --token-latency 0.005 --memory
+#   python benchmarks/pipeline.py --save baseline.json
+#   python benchmarks/pipeline.py --compare baseline.json          # exits 1 when a stage got slower
+#   python benchmarks/pipeline.py --url http://127.0.0.1:11434     # a real model server instead of the stub
+#
+# Documents come from both workbooks, short to long in --buckets length ranges. Each one goes through the
+# same functions process_data.analyze uses, one stage at a time: load (corpus cache lookup), dedup (boilerplate
+# and repeated sentences, off with --keep-duplicates), chunk, prompt, model, parse (JSON parsing, chunk merging,
+# entity resolution), graph (viewer JSON, analytics and server layout) and render (the pyvis HTML export). Nothing is cached or written outside a temporary directory.
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_store import ID_COLUMNS, load_index, lookup_text
+from dedup import clean_document
+from chunking import DEFAULT_CHUNK_CHARS, merge_graphs, split_text
+from entity_resolution import resolve_graph
+from extraction import MODES, complete_graph, parse_graph_output
+from graph_analytics import annotate_graph_json
+from graph_json import to_graph_json, use_server_layout
+from llm_client import create_backend
+from process_data import DATA_DIR, build_network
+from prompts import graph_prompt, narrative_prompt, single_pass_prompt
+from stub_llm import StubLLM
+
+STAGES = ("load", "dedup", "chunk", "prompt", "model", "parse", "graph", "render")
+# Stages faster than this are left out of --compare, their timings are mostly noise
+COMPARE_MIN_SECONDS = 0.002
+
+
+def percentile(values, fraction):
+    # Nearest rank, no interpolation
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def summary(values):
+    return {
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p99": percentile(values, 0.99),
+        "max": max(values),
+        "total": sum(values),
+    }
+
+
+def pick_documents(per_bucket, buckets):
+    # Every non-empty document of both workbooks, put into `buckets` length ranges of equal ratio
+    # (the short news excerpts far outnumber the long cables, equal-count buckets would all be short);
+    # per_bucket documents are taken evenly spaced from each range
+    documents = []
+    for name in ID_COLUMNS:
+        source = os.path.join(DATA_DIR, name)
+        documents += [(source, identifier, len(text)) for identifier, text in load_index(source).items() if text]
+    documents.sort(key=lambda document: document[2])
+    shortest, longest = documents[0][2], documents[-1][2]
+    picked = []
+    for bucket in range(buckets):
+        low = shortest * (longest / shortest) ** (bucket / buckets)
+        high = shortest * (longest / shortest) ** ((bucket + 1) / buckets)
+        part = [document for document in documents
+                if low <= document[2] < high or (bucket == buckets - 1 and document[2] == longest)]
+        step = max(1, len(part) // per_bucket)
+        picked += [(bucket, *document) for document in part[::step][:per_bucket]]
+    return picked
+
+
+class StageTimer:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.seconds = {}
+        self.peaks = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+            if self.memory:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+
+
+def run_document(source, identifier, backend, mode, chunk_chars, html_path, memory, dedup=True):
+    # The steps of process_data.analyze/extraction.extract, without the cache and the graph store
+    timer = StageTimer(memory)
+    usage = {"calls": 0, "completion_tokens": 0, "removed_tokens": 0}
+    with timer.stage("load"):
+        text = lookup_text(source, identifier)
+    chars = len(text)
+    if dedup:
+        with timer.stage("dedup"):
+            text, stats = clean_document(text, source)
+        usage["removed_tokens"] = stats["tokens_removed"]
+    with timer.stage("chunk"):
+        chunks = split_text(text, chunk_chars) if chunk_chars and len(text) > chunk_chars else [text]
+
+    graphs = []
+    for chunk in chunks:
+        with timer.stage("prompt"):
+            prompts = [single_pass_prompt(chunk)] if mode == "single" else \
+                [narrative_prompt(chunk), graph_prompt(chunk)]
+        with timer.stage("model"):
+            if mode == "dual":
+                backend.complete(prompts[0])
+                usage["calls"] += 1
+            completion = complete_graph(backend, prompts[-1])
+            usage["calls"] += 1
+            usage["completion_tokens"] += completion["completion_tokens"] or 0
+        with timer.stage("parse"):
+            graphs.append(parse_graph_output(completion["text"]))
+    with timer.stage("parse"):
+        graph = resolve_graph(merge_graphs(graphs) if len(graphs) > 1 else graphs[0])
+
+    with timer.stage("graph"):
+        payload = annotate_graph_json(to_graph_json(graph))
+        if use_server_layout("auto", len(payload["nodes"])):
+            from graph_layout import layout_graph_json
+            layout_graph_json(payload)
+    with timer.stage("render"):
+        build_network(graph, html_path, payload)
+    return {"chars": chars, "chunks": len(chunks), "nodes": len(payload["nodes"]), **usage,
+            "seconds": timer.seconds, "peaks": timer.peaks}
+
+
+def report(results, bucket_count, wall, memory):
+    lines = [f"{'stage':<8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'share':>6}"
+             + (f" {'peak MB':>8}" if memory else "")]
+    grand_total = sum(sum(result["seconds"].values()) for result in results) or 1
+    stages = {}
+    for name in STAGES + ("total",):
+        if name == "total":
+            values = [sum(result["seconds"].values()) for result in results]
+        else:
+            values = [result["seconds"].get(name, 0.0) for result in results]
+        stages[name] = summary(values)
+        line = (f"{name:<8} {stages[name]['p50'] * 1000:>9.1f} {stages[name]['p90'] * 1000:>9.1f} "
+                f"{stages[name]['p99'] * 1000:>9.1f} {stages[name]['max'] * 1000:>9.1f} "
+                f"{stages[name]['total'] / grand_total:>6.0%}")
+        if memory and name != "total":
+            stages[name]["peak_bytes"] = max(result["peaks"].get(name, 0) for result in results)
+            line += f" {stages[name]['peak_bytes'] / 2 ** 20:>8.1f}"
+        lines.append(line)
+
+    buckets = {}
+    lines.append("")
+    lines.append(f"{'bucket':<8} {'docs':>5} {'chars p50':>10} {'total p50 ms':>13} {'total p90 ms':>13}")
+    for bucket in range(bucket_count):
+        part = [result for result in results if result["bucket"] == bucket]
+        if not part:
+            continue
+        totals = [sum(result["seconds"].values()) for result in part]
+        buckets[bucket] = {
+            "documents": len(part),
+            "chars_p50": percentile([result["chars"] for result in part], 0.5),
+            "total": summary(totals),
+        }
+        lines.append(f"{bucket:<8} {len(part):>5} {buckets[bucket]['chars_p50']:>10} "
+                     f"{buckets[bucket]['total']['p50'] * 1000:>13.1f} {buckets[bucket]['total']['p90'] * 1000:>13.1f}")
+
+    chars = sum(result["chars"] for result in results)
+    model_seconds = sum(result["seconds"].get("model", 0.0) for result in results)
+    throughput = {
+        "documents_per_second": len(results) / wall,
+        "chars_per_second": chars / wall,
+        "completion_tokens_per_second": sum(result["completion_tokens"] for result in results) / model_seconds
+        if model_seconds else 0.0,
+        "model_calls": sum(result["calls"] for result in results),
+        "dedup_removed_tokens": sum(result["removed_tokens"] for result in results),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    lines.append("")
+    lines.append(f"{len(results)} documents in {wall:.2f}s: {throughput['documents_per_second']:.1f} docs/s, "
+                 f"{throughput['chars_per_second']:.0f} chars/s, {throughput['model_calls']} model calls, "
+                 f"{throughput['dedup_removed_tokens']} tokens deduplicated, "
+                 f"max RSS {throughput['max_rss_mb']:.0f} MB")
+    return {"stages": stages, "buckets": buckets, "throughput": throughput}, "\n".join(lines)
+
+
+def compare(current, baseline, tolerance):
+    # Stages whose p50 grew by more than tolerance (a fraction) over the baseline
+    slower = []
+    for name, stats in baseline["stages"].items():
+        if name not in current["stages"] or stats["p50"] < COMPARE_MIN_SECONDS:
+            continue
+        if current["stages"][name]["p50"] > stats["p50"] * (1 + tolerance):
+            slower.append(f"{name}: p50 {stats['p50'] * 1000:.1f} ms -> {current['stages'][name]['p50'] * 1000:.1f} ms")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--per-bucket", type=int, default=5, help="documents per length bucket")
+    parser.add_argument("--buckets", type=int, default=3, help="length buckets (short to long)")
+    parser.add_argument("--mode", choices=MODES, default="dual")
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub: seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="stub: seconds per streamed piece")
+    parser.add_argument("--entities", type=int, default=12, help="stub: entities per answer")
+    parser.add_argument("--relationships", type=int, default=16, help="stub: relationships per answer")
+    parser.add_argument("--keep-duplicates", dest="dedup", action="store_false",
+                        help="skip the dedup stage, to measure what it saves")
+    parser.add_argument("--url", help="benchmark against this model server instead of the stub")
+    parser.add_argument("--warmup", type=int, default=1, help="documents run first and not counted")
+    parser.add_argument("--memory", action="store_true", help="record peak Python allocations per stage (slower)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--save", help="write the results to this file, for a later --compare")
+    parser.add_argument("--compare", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown per stage")
+    args = parser.parse_args()
+
+    stub = None
+    if args.url:
+        backend = create_backend("http", base_url=args.url)
+    else:
+        stub = StubLLM(latency=args.latency, token_latency=args.token_latency, entities=args.entities,
+                       relationships=args.relationships).start()
+        backend = create_backend("http", base_url=stub.url)
+
+    documents = pick_documents(args.per_bucket, args.buckets)
+    if args.memory:
+        tracemalloc.start()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        html_path = os.path.join(tmp, "entity_network.html")
+        for bucket, source, identifier, _ in documents[:args.warmup]:
+            run_document(source, identifier, backend, args.mode, args.chunk_chars, html_path, False, args.dedup)
+        started = time.perf_counter()
+        for bucket, source, identifier, _ in documents:
+            result = run_document(source, identifier, backend, args.mode, args.chunk_chars, html_path, args.memory,
+                                  args.dedup)
+            results.append({"bucket": bucket, "document": f"{os.path.basename(source)}:{identifier}", **result})
+        wall = time.perf_counter() - started
+    if stub is not None:
+        stub.stop()
+    backend.close()
+
+    measured, table = report(results, args.buckets, wall, args.memory)
+    measured["settings"] = {name: getattr(args, name) for name in
+                            ("per_bucket", "buckets", "mode", "chunk_chars", "latency", "token_latency",
+                             "entities", "relationships", "url", "dedup")}
+    print(json.dumps(measured, indent=2) if args.json else table)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(measured, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            slower = compare(measured, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"slower than baseline: {line}", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
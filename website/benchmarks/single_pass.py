@@ -0,0 +1,78 @@
+# Compares the dual-prompt and single-pass extraction modes across the wikileaks corpus.
+#
+#   python benchmarks/single_pass.py --limit 20            # needs a running model server
+#   python benchmarks/single_pass.py --estimate-only       # prompt token estimate only, no model calls
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_store import load_index
+from extraction import MODES, RUNNERS
+from llm_client import LLMError, estimate_tokens, get_backend
+from prompts import graph_prompt, narrative_prompt, single_pass_prompt
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "wikileaks_parsed.xlsx")
+
+
+def prompt_tokens(text, mode):
+    if mode == "single":
+        return estimate_tokens(single_pass_prompt(text))
+    return estimate_tokens(narrative_prompt(text)) + estimate_tokens(graph_prompt(text))
+
+
+def summarize(totals, documents):
+    print(f"{'mode':<8} {'docs':>5} {'calls':>6} {'prompt tok':>11} {'output tok':>11} {'seconds':>9} {'failed':>7}")
+    for mode in MODES:
+        t = totals[mode]
+        print(f"{mode:<8} {documents:>5} {t['calls']:>6} {t['prompt_tokens']:>11} {t['completion_tokens']:>11} "
+              f"{t['seconds']:>9.1f} {t['failed']:>7}")
+
+    dual, single = totals["dual"], totals["single"]
+    for field in ("prompt_tokens", "completion_tokens", "seconds"):
+        if dual[field]:
+            saved = 1 - single[field] / dual[field]
+            print(f"single-pass saves {saved:.0%} of {field.replace('_', ' ')}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=DEFAULT_SOURCE)
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N documents")
+    parser.add_argument("--estimate-only", action="store_true", help="count prompt tokens without calling the model")
+    parser.add_argument("--json", action="store_true", help="print the totals as JSON")
+    args = parser.parse_args()
+
+    documents = list(load_index(args.source).items())[:args.limit]
+    totals = {mode: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0, "failed": 0}
+              for mode in MODES}
+    backend = None if args.estimate_only else get_backend()
+
+    for identifier, text in documents:
+        for mode in MODES:
+            if backend is None:
+                totals[mode]["calls"] += 1 if mode == "single" else 2
+                totals[mode]["prompt_tokens"] += prompt_tokens(text, mode)
+                continue
+
+            started = time.perf_counter()
+            try:
+                usage = RUNNERS[mode](text, backend)["usage"]
+            except (LLMError, json.JSONDecodeError) as e:
+                print(f"{identifier} [{mode}] failed: {e}", file=sys.stderr)
+                totals[mode]["failed"] += 1
+                totals[mode]["seconds"] += time.perf_counter() - started
+                continue
+            for field in ("calls", "prompt_tokens", "completion_tokens", "seconds"):
+                totals[mode][field] += usage[field]
+
+    if args.json:
+        print(json.dumps({"documents": len(documents), "totals": totals}, indent=2))
+    else:
+        summarize(totals, len(documents))
+
+
+if __name__ == "__main__":
+    main()
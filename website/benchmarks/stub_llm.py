@@ -0,0 +1,154 @@
+# Deterministic stand-in for `ollama serve`, so the pipeline can be timed without a model.
+#
+#   python benchmarks/stub_llm.py --port 11500 --latency 0.5 --token-latency 0.01
+#   OLLAMA_URL=http://127.0.0.1:11500 python process_data.py "" "Some text"
+#
+# Speaks the /api/generate protocol llm_client.py uses (streaming and not). The same prompt always gets
+# the same answer: entity names are picked from the capitalised words of the prompt, seeded by its hash.
+# Prompts asking for JSON get a graph, the others a narrative in the layout the narrative prompt asks for.
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAME = re.compile(r"\b[A-Z][a-z]+(?: [A-Z0-9][a-z0-9]*)?")
+
+
+def stub_graph(prompt, entities=12, relationships=16):
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+    # The document is at the end of every prompt, so its names come last
+    names = list(dict.fromkeys(NAME.findall(prompt[-4000:])))
+    rng.shuffle(names)
+    names = names[:entities] + [f"Entity {i}" for i in range(len(names), entities)]
+    edges = [
+        {"source": rng.choice(names), "target": rng.choice(names), "description": f"relationship {i}"}
+        for i in range(relationships if len(names) > 1 else 0)
+    ]
+    return {
+        "entities": [{"name": name, "description": "stub entity"} for name in names],
+        "relationships": [edge for edge in edges if edge["source"] != edge["target"]],
+    }
+
+
+def stub_response(prompt, entities=12, relationships=16):
+    graph = stub_graph(prompt, entities, relationships)
+    if "JSON" in prompt:
+        return json.dumps(graph, indent=2)
+    lines = ["Here are the involved entities:"]
+    lines += [f"{i}. {entity['name']} ({entity['description']})" for i, entity in enumerate(graph["entities"], 1)]
+    lines += ["", "Relationships between entities:"]
+    lines += [f"* {edge['source']} and {edge['target']} are {edge['description']}." for edge in graph["relationships"]]
+    return "\n".join(lines)
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-answer is normal here, anything else is still printed
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class StubLLM:
+    # latency: seconds before the first token; token_latency: seconds per streamed piece (a word or so)
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_latency=0.0, entities=12, relationships=16):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.entities = entities
+        self.relationships = relationships
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = QuietServer((host, port), self.handler())
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                text = stub_response(payload.get("prompt", ""), stub.entities, stub.relationships)
+                pieces = re.findall(r"\S+\s*|\s+", text)
+                prompt_tokens = max(1, len(payload.get("prompt", "")) // 4)
+                time.sleep(stub.latency)
+                try:
+                    if payload.get("stream"):
+                        self.stream(pieces, prompt_tokens)
+                    else:
+                        time.sleep(stub.token_latency * len(pieces))
+                        self.send_json({"response": text, "done": True,
+                                        "prompt_eval_count": prompt_tokens, "eval_count": len(pieces)})
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client hangs up once the JSON object is complete (extraction.complete_graph)
+                    pass
+
+            def send_json(self, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self, pieces, prompt_tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def chunk(data):
+                    line = (json.dumps(data) + "\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    self.wfile.flush()
+
+                for piece in pieces:
+                    time.sleep(stub.token_latency)
+                    chunk({"response": piece, "done": False})
+                chunk({"response": "", "done": True, "prompt_eval_count": prompt_tokens, "eval_count": len(pieces)})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per streamed piece")
+    parser.add_argument("--entities", type=int, default=12)
+    parser.add_argument("--relationships", type=int, default=16)
+    args = parser.parse_args()
+
+    stub = StubLLM(args.host, args.port, args.latency, args.token_latency, args.entities, args.relationships)
+    print(f"Stub model server on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import re
+
+from entity_resolution import normalize_name as entity_key
+
+# Documents longer than this are split before extraction (~1500 llama tokens per chunk)
+DEFAULT_CHUNK_CHARS = int(os.environ.get("EXTRACTION_CHUNK_CHARS", "6000"))
+DEFAULT_OVERLAP_CHARS = int(os.environ.get("EXTRACTION_CHUNK_OVERLAP", "400"))
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def split_units(text, max_chars):
+    # Paragraphs, falling back to sentences and then to words for anything still too long
+    units = []
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            if len(sentence) <= max_chars:
+                units.append(sentence)
+                continue
+            words = sentence.split()
+            piece = []
+            size = 0
+            for word in words:
+                if piece and size + len(word) + 1 > max_chars:
+                    units.append(" ".join(piece))
+                    piece, size = [], 0
+                piece.append(word)
+                size += len(word) + 1
+            if piece:
+                units.append(" ".join(piece))
+    return units
+
+
+def split_text(text, max_chars=DEFAULT_CHUNK_CHARS, overlap_chars=DEFAULT_OVERLAP_CHARS):
+    # Packs whole paragraphs/sentences into chunks of at most max_chars. Each chunk starts with
+    # the last units of the previous one (up to overlap_chars) so relationships spanning a
+    # boundary are still seen together.
+    if len(text) <= max_chars:
+        return [text]
+
+    overlap_chars = min(overlap_chars, max_chars // 2)
+    chunks = []
+    current = []
+    size = 0
+    for unit in split_units(text, max_chars):
+        if current and size + len(unit) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            carried = []
+            carried_size = 0
+            for previous in reversed(current):
+                if carried_size + len(previous) + 1 > overlap_chars:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous) + 1
+            current, size = carried, carried_size
+        current.append(unit)
+        size += len(unit) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def relationship_ends(relationship):
+    source = relationship.get("source", relationship.get("from"))
+    target = relationship.get("target", relationship.get("to"))
+    return source, target
+
+
+def merge_graphs(graphs):
+    # Union of per-chunk graphs; entities match on their normalized name and keep the
+    # first spelling seen, identical edges (same ends and description) are kept once
+    entities = {}
+    relationships = {}
+    for graph in graphs:
+        for entity in graph.get("entities", []):
+            name = entity.get("name")
+            if not name:
+                continue
+            key = entity_key(name)
+            if key not in entities:
+                entities[key] = dict(entity)
+            elif not entities[key].get("description") and entity.get("description"):
+                entities[key]["description"] = entity["description"]
+
+        for relationship in graph.get("relationships", []):
+            source, target = relationship_ends(relationship)
+            if not source or not target:
+                continue
+            for name in (source, target):
+                entities.setdefault(entity_key(name), {"name": name})
+            description = relationship.get("description", "")
+            key = (entity_key(source), entity_key(target), entity_key(description))
+            if key not in relationships:
+                relationships[key] = {
+                    "source": entities[key[0]]["name"],
+                    "target": entities[key[1]]["name"],
+                    "description": description,
+                }
+
+    return {"entities": list(entities.values()), "relationships": list(relationships.values())}
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import Mapping
+
+# Identifier column used to pick a document out of each bundled workbook
+ID_COLUMNS = {
+    "wikileaks_parsed.xlsx": "PDF Path",
+    "news_excerpts_parsed.xlsx": "Link",
+}
+TEXT_COLUMN = "Text"
+
+CACHE_DIR_NAME = "cache"
+# Datasets uploaded through the API; ingest.py records their columns in the cache meta file
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "uploads")
+
+# Memory-mapped tables and identifier indexes already opened by this process, keyed by cache file
+loaded_tables = {}
+loaded_indexes = {}
+
+
+def cache_paths(source_path):
+    # Cached files live in a cache/ folder next to the source workbook
+    folder, name = os.path.split(os.path.abspath(source_path))
+    # Workbooks keep their original cache names; other files keep the extension, so corpus.csv and
+    # corpus.jsonl uploaded side by side do not share a cache
+    stem = os.path.splitext(name)[0] if name.lower().endswith(".xlsx") else name
+    cache_dir = os.path.join(folder, CACHE_DIR_NAME)
+    return {
+        "dir": cache_dir,
+        "table": os.path.join(cache_dir, f"{stem}.arrow"),
+        "meta": os.path.join(cache_dir, f"{stem}.meta.json"),
+        "index": os.path.join(cache_dir, f"{stem}.index.json"),
+        "index_db": os.path.join(cache_dir, f"{stem}.index.sqlite"),
+        "boilerplate": os.path.join(cache_dir, f"{stem}.boilerplate.json"),
+    }
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_signature(source_path):
+    stat = os.stat(source_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def read_meta(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_meta(meta_path, meta):
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def is_fresh(source_path, paths):
+    meta = read_meta(paths["meta"])
+    if meta is None or not os.path.exists(paths["table"]):
+        return False
+
+    signature = source_signature(source_path)
+    if meta.get("mtime_ns") == signature["mtime_ns"] and meta.get("size") == signature["size"]:
+        return True
+
+    # The file was touched (e.g. copied or re-saved), only rebuild if the content changed
+    if meta.get("sha256") == file_sha256(source_path):
+        meta.update(signature)
+        write_meta(paths["meta"], meta)
+        return True
+    return False
+
+
+# pandas and pyarrow are imported inside the functions below: looking text up in a fresh cache only
+# reads the JSON index, and pandas alone takes longer to import than the whole lookup
+
+
+def frame_to_table(data):
+    import pandas as pd
+    import pyarrow as pa
+
+    # Excel columns often mix numbers and strings, Arrow needs one type per column
+    for column in data.columns:
+        if data[column].dtype == object:
+            data[column] = data[column].map(lambda value: value if pd.isna(value) else str(value))
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+
+def build_cache(source_path):
+    import pandas as pd
+    import pyarrow as pa
+
+    paths = cache_paths(source_path)
+    os.makedirs(paths["dir"], exist_ok=True)
+
+    table = frame_to_table(pd.read_excel(source_path))
+
+    # Uncompressed Arrow IPC so the table can be memory-mapped without a copy
+    tmp_path = paths["table"] + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, paths["table"])
+
+    build_index(source_path, table, paths["index"])
+
+    meta = source_signature(source_path)
+    meta["sha256"] = file_sha256(source_path)
+    meta["rows"] = table.num_rows
+    write_meta(paths["meta"], meta)
+    return paths["table"]
+
+
+def build_index(source_path, table, index_path):
+    # identifier -> all of its Text rows joined in sheet order, the same string process_data.py used to build
+    id_column = ID_COLUMNS.get(os.path.basename(source_path))
+    if id_column is None:
+        return None
+
+    parts = {}
+    for identifier, text in zip(table[id_column].to_pylist(), table[TEXT_COLUMN].to_pylist()):
+        if identifier is None:
+            continue
+        rows = parts.setdefault(identifier, [])
+        if text is not None:
+            rows.append(text)
+    index = {identifier: " ".join(rows) for identifier, rows in parts.items()}
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def ingested_columns(source_path):
+    # (id column, text column) of a dataset added with ingest.py, None for the bundled workbooks
+    if os.path.basename(source_path) in ID_COLUMNS:
+        return None
+    meta = read_meta(cache_paths(source_path)["meta"])
+    if meta is None or not meta.get("id_column"):
+        return None
+    return meta["id_column"], meta["text_column"]
+
+
+def ensure_cache(source_path):
+    paths = cache_paths(source_path)
+    if is_fresh(source_path, paths):
+        return paths["table"]
+    columns = ingested_columns(source_path)
+    if columns is not None:
+        # Changed since it was ingested: stream it in again with the same columns
+        from ingest import ingest
+        ingest(source_path, *columns)
+        return paths["table"]
+    return build_cache(source_path)
+
+
+def load_table(source_path):
+    table_path = ensure_cache(source_path)
+    mtime_ns = os.stat(table_path).st_mtime_ns
+    cached = loaded_tables.get(table_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    import pyarrow as pa
+
+    # The buffers keep the mapping alive, so the file handle is not closed here
+    source = pa.memory_map(table_path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    loaded_tables[table_path] = (mtime_ns, table)
+    return table
+
+
+def load_frame(source_path):
+    return load_table(source_path).to_pandas()
+
+
+def id_column_for(source_path):
+    name = os.path.basename(source_path)
+    if name in ID_COLUMNS:
+        return ID_COLUMNS[name]
+    columns = ingested_columns(source_path)
+    if columns is None:
+        raise ValueError(f"No identifier column known for {name}, ingest it with ingest.py first")
+    return columns[0]
+
+
+class SQLiteIndex(Mapping):
+    # The identifier -> text index of an ingested dataset, read from SQLite on demand instead of
+    # loaded whole like the bundled workbooks' JSON index. items() streams in file order
+    def __init__(self, path):
+        self.uri = f"file:{path}?mode=ro"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+    def __getitem__(self, identifier):
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM documents WHERE identifier = ?", (identifier,)).fetchone()
+        if row is None:
+            raise KeyError(identifier)
+        return row[0]
+
+    def __iter__(self):
+        # Identifiers only, on their own cursor like items()
+        conn = sqlite3.connect(self.uri, uri=True)
+        try:
+            for (identifier,) in conn.execute("SELECT identifier FROM documents ORDER BY rowid"):
+                yield identifier
+        finally:
+            conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def items(self):
+        # Its own cursor, so other lookups can run while this is being iterated
+        conn = sqlite3.connect(self.uri, uri=True)
+        try:
+            yield from conn.execute("SELECT identifier, text FROM documents ORDER BY rowid")
+        finally:
+            conn.close()
+
+
+def lookup_rows(source_path, identifier):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = load_table(source_path)
+    id_column = id_column_for(source_path)
+    mask = pc.equal(table[id_column], pa.scalar(str(identifier)))
+    return table.filter(mask)
+
+
+def load_index(source_path):
+    ensure_cache(source_path)
+    if ingested_columns(source_path) is not None:
+        index_path = cache_paths(source_path)["index_db"]
+        mtime_ns = os.stat(index_path).st_mtime_ns
+        cached = loaded_indexes.get(index_path)
+        if cached is None or cached[0] != mtime_ns:
+            cached = loaded_indexes[index_path] = (mtime_ns, SQLiteIndex(index_path))
+        return cached[1]
+
+    index_path = cache_paths(source_path)["index"]
+    if not os.path.exists(index_path):
+        # Caches built before the index existed only need the index added
+        build_index(source_path, load_table(source_path), index_path)
+
+    mtime_ns = os.stat(index_path).st_mtime_ns
+    cached = loaded_indexes.get(index_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    loaded_indexes[index_path] = (mtime_ns, index)
+    return index
+
+
+def lookup_text(source_path, identifier):
+    id_column_for(source_path)
+    return load_index(source_path).get(str(identifier), "")
+
+
+if __name__ == "__main__":
+    # One-time ingestion: python corpus_store.py [workbook ...] (other files: ingest.py)
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    sources = sys.argv[1:] or [os.path.join(data_dir, name) for name in ID_COLUMNS]
+    for source in sources:
+        table_path = ensure_cache(source)
+        index = load_index(source)
+        print(f"{source} -> {table_path} ({len(index)} documents)")
@@ -0,0 +1,182 @@
+# Drops repeated text from a document before it is prompted: corpus-wide boilerplate (headers, footers and
+# section titles found in many documents), sentences repeated within the document, and near-duplicate
+# sentences (word-shingle MinHash + LSH from minhash.py, verified by Jaccard).
+#
+#   python dedup.py report                           # chars/tokens it removes from every bundled document
+#   python dedup.py show data/wikileaks_parsed.xlsx 47.pdf
+#
+# The wikileaks parse joins many rows per 'PDF Path' with spaces, so a "line" of the joined text can hold
+# several rows; the unit compared here is a sentence or heading within a line. Only heading-like units
+# (short, no closing punctuation) count as boilerplate: a sentence shared by several documents still
+# carries entities for each of them, it is only dropped when it repeats inside one document.
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+
+from llm_client import estimate_tokens
+from minhash import LSHIndex, MinHasher, jaccard, word_shingles
+
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.8"))
+# Sentences shorter than this are only dropped when repeated exactly
+NEAR_DUPLICATE_MIN_CHARS = 80
+BOILERPLATE_MAX_CHARS = 120
+# A heading is boilerplate once this many documents (and BOILERPLATE_MIN_SHARE of them) have it
+BOILERPLATE_MIN_DOCS = int(os.environ.get("BOILERPLATE_MIN_DOCS", "3"))
+BOILERPLATE_MIN_SHARE = 0.02
+QUOTES = " \t\"'“”‘’"
+# After sentence punctuation (not initials or "No."), and between rows the parse wrapped in quotes
+SENTENCE_END = re.compile(r"(?<=[a-z0-9)%]{2}[.!?])[\"”’']?\s+|(?<=[\"”])\s+(?=[\"“])")
+
+_boilerplate = {}
+_boilerplate_lock = threading.Lock()
+
+
+def segments(text):
+    # [(line number, sentence or heading)]; headings stuck to the end of the previous row are split off
+    units = []
+    for number, line in enumerate(text.split("\n")):
+        units += [(number, unit.strip()) for unit in SENTENCE_END.split(line) if unit.strip(QUOTES)]
+    return units
+
+
+def normalize(unit):
+    # Case, spacing, section numbering and the quotes around parsed rows
+    unit = re.sub(r"^[ivx]+\.\s+", "", unit.strip(QUOTES).lower())
+    return re.sub(r"\s+", " ", unit).strip(QUOTES)
+
+
+def heading_key(unit):
+    # Headers and footers also differ in their numbers (page 3 of 10)
+    return re.sub(r"\d+", "0", normalize(unit))
+
+
+def is_heading(unit):
+    return len(unit) <= BOILERPLATE_MAX_CHARS and not unit.rstrip(QUOTES).endswith((".", "!", "?", ",", ";", ":"))
+
+
+def find_boilerplate(documents, min_docs=BOILERPLATE_MIN_DOCS, min_share=BOILERPLATE_MIN_SHARE):
+    # documents: iterable of texts -> set of normalized headings found in enough of them
+    counts = {}
+    total = 0
+    for text in documents:
+        total += 1
+        for key in {heading_key(unit) for _, unit in segments(text or "") if is_heading(unit)}:
+            counts[key] = counts.get(key, 0) + 1
+    needed = max(min_docs, math.ceil(min_share * total))
+    return {key for key, count in counts.items() if count >= needed and key}
+
+
+def corpus_boilerplate(source_path):
+    # Found once per corpus and kept next to its cache; rebuilt when the corpus changes
+    from corpus_store import cache_paths, ensure_cache, load_index, read_meta, write_meta
+
+    ensure_cache(source_path)
+    paths = cache_paths(source_path)
+    signature = (read_meta(paths["meta"]) or {}).get("sha256")
+    with _boilerplate_lock:
+        cached = _boilerplate.get(source_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        stored = read_meta(paths["boilerplate"])
+        if stored and stored.get("sha256") == signature and stored.get("min_docs") == BOILERPLATE_MIN_DOCS:
+            lines = frozenset(stored["lines"])
+        else:
+            lines = frozenset(find_boilerplate(text for _, text in load_index(source_path).items()))
+            write_meta(paths["boilerplate"], {"sha256": signature, "min_docs": BOILERPLATE_MIN_DOCS,
+                                              "lines": sorted(lines)})
+        _boilerplate[source_path] = (signature, lines)
+        return lines
+
+
+def clean(text, boilerplate=frozenset(), threshold=DEDUP_THRESHOLD, hasher=None):
+    # Returns (text for the LLM, stats); the first copy of anything repeated is the one kept
+    hasher = hasher or MinHasher()
+    lsh = LSHIndex()
+    seen = set()
+    kept_shingles = []
+    stats = {"applied": False, "segments": 0, "boilerplate": 0, "duplicates": 0, "near_duplicates": 0,
+             "chars_before": len(text), "tokens_before": estimate_tokens(text)}
+    lines = {}
+    for number, unit in segments(text):
+        stats["segments"] += 1
+        key = normalize(unit)
+        if is_heading(unit) and heading_key(unit) in boilerplate:
+            stats["boilerplate"] += 1
+            continue
+        if key in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+        if len(unit) >= NEAR_DUPLICATE_MIN_CHARS:
+            tokens = word_shingles(re.sub(r"[^\w\s]", " ", key))
+            signature = hasher.signature(tokens)
+            if any(jaccard(tokens, kept_shingles[i]) >= threshold for i in lsh.candidates(signature)):
+                stats["near_duplicates"] += 1
+                continue
+            lsh.add(len(kept_shingles), signature)
+            kept_shingles.append(tokens)
+        lines.setdefault(number, []).append(unit)
+
+    removed = stats["boilerplate"] + stats["duplicates"] + stats["near_duplicates"]
+    cleaned = "\n\n".join(" ".join(units) for units in lines.values()) if removed and lines else text
+    stats.update(applied=cleaned is not text, chars_after=len(cleaned), tokens_after=estimate_tokens(cleaned))
+    stats["chars_removed"] = stats["chars_before"] - stats["chars_after"]
+    stats["tokens_removed"] = stats["tokens_before"] - stats["tokens_after"]
+    return cleaned, stats
+
+
+def clean_document(text, source_path=None):
+    # Corpus documents also lose their corpus' boilerplate; pasted text only its own repeats
+    boilerplate = corpus_boilerplate(source_path) if source_path else frozenset()
+    return clean(text, boilerplate)
+
+
+def describe(stats):
+    if not stats["applied"]:
+        return "Dedup: nothing repeated"
+    return (f"Dedup removed {stats['boilerplate']} boilerplate, {stats['duplicates']} duplicate and "
+            f"{stats['near_duplicates']} near-duplicate sentences of {stats['segments']} "
+            f"({stats['chars_removed']} chars, ~{stats['tokens_removed']} tokens)")
+
+
+def main():
+    from corpus_store import ID_COLUMNS, load_index, lookup_text
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="totals over every document of the workbooks")
+    report.add_argument("sources", nargs="*")
+    show = commands.add_parser("show", help="one document's cleaned text and stats")
+    show.add_argument("source")
+    show.add_argument("identifier")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        text, stats = clean_document(lookup_text(args.source, args.identifier), args.source)
+        print(text)
+        print(describe(stats), file=sys.stderr)
+        return
+
+    totals = {}
+    for source in args.sources or [os.path.join(data_dir, name) for name in ID_COLUMNS]:
+        boilerplate = corpus_boilerplate(source)
+        total = {"documents": 0, "changed": 0, "boilerplate_lines": len(boilerplate)}
+        for _, text in load_index(source).items():
+            _, stats = clean(text or "", boilerplate)
+            total["documents"] += 1
+            total["changed"] += stats["applied"]
+            for name in ("chars_before", "chars_removed", "tokens_before", "tokens_removed",
+                         "boilerplate", "duplicates", "near_duplicates"):
+                total[name] = total.get(name, 0) + stats[name]
+        total["chars_removed_share"] = round(total["chars_removed"] / max(total["chars_before"], 1), 4)
+        totals[os.path.basename(source)] = total
+    print(json.dumps(totals, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import re
+import unicodedata
+
+from minhash import LSHIndex, MinHasher, jaccard, shingles
+
+# Legal-form words that do not change which entity a name refers to
+CORPORATE_SUFFIXES = {
+    "ltd", "limited", "inc", "incorporated", "llc", "llp", "corp", "corporation", "co", "company",
+    "plc", "gmbh", "ag", "sa", "srl", "bv", "nv", "doo", "shpk", "pte", "pty", "group",
+}
+LEADING_WORDS = {"the"}
+NON_WORD = re.compile(r"[^\w]+")
+DIGITS = re.compile(r"\d+")
+
+DEFAULT_THRESHOLD = 0.7
+# Below this many distinct names a plain scan is cheaper than hashing (and numpy is never imported)
+LINEAR_SCAN_MAX = 64
+
+
+def normalize_name(name):
+    # "Vendor-1 Ltd." -> "vendor 1", "The  Ministry" -> "ministry"
+    text = unicodedata.normalize("NFKD", str(name))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = NON_WORD.sub(" ", text.casefold().replace("_", " ")).split()
+    while len(words) > 1 and words[0] in LEADING_WORDS:
+        words = words[1:]
+    while len(words) > 1 and words[-1] in CORPORATE_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
+
+
+def same_entity(key_a, key_b, threshold=DEFAULT_THRESHOLD):
+    # Numbers must agree exactly ("vendor 1" is not "vendor 2"), the rest only needs to be close
+    if DIGITS.findall(key_a) != DIGITS.findall(key_b):
+        return False
+    return jaccard(shingles(key_a), shingles(key_b)) >= threshold
+
+
+class EntityResolver:
+    # Maps every name to a canonical one. Exact matches on the normalized key are a dict hit;
+    # fuzzy matches are only checked against the few candidates the MinHash LSH index returns,
+    # so resolving n names stays close to linear. A single document rarely has more than a few dozen
+    # names, so the index is only built once there are LINEAR_SCAN_MAX of them
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=64, bands=16):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.hasher = None
+        self.index = None
+        self.canonical = {}  # normalized key -> canonical display name
+        self.keys = []       # canonical keys, positions are the ids stored in the LSH index
+
+    def _candidates(self, key):
+        if self.index is None and len(self.keys) < LINEAR_SCAN_MAX:
+            return range(len(self.keys))
+        if self.index is None:
+            self.hasher = MinHasher(self.num_perm)
+            self.index = LSHIndex(self.num_perm, self.bands)
+            for position, known in enumerate(self.keys):
+                self.index.add(position, self.hasher.signature(shingles(known)))
+        return sorted(self.index.candidates(self.hasher.signature(shingles(key))))
+
+    def resolve(self, name):
+        key = normalize_name(name)
+        if not key:
+            return str(name).strip()
+        if key in self.canonical:
+            return self.canonical[key]
+
+        for candidate in self._candidates(key):
+            candidate_key = self.keys[candidate]
+            if same_entity(key, candidate_key, self.threshold):
+                self.canonical[key] = self.canonical[candidate_key]
+                return self.canonical[key]
+
+        self.canonical[key] = str(name).strip()
+        if self.index is not None:
+            self.index.add(len(self.keys), self.hasher.signature(shingles(key)))
+        self.keys.append(key)
+        return self.canonical[key]
+
+
+def resolve_graph(graph, resolver=None):
+    # Rewrites entity names to their canonical form and merges the duplicates this creates
+    resolver = resolver or EntityResolver()
+    entities = {}
+    for entity in graph.get("entities", []):
+        name = resolver.resolve(entity["name"])
+        merged = entities.setdefault(name, {**entity, "name": name})
+        for field, value in entity.items():
+            if value and not merged.get(field):
+                merged[field] = value
+
+    relationships = []
+    seen = set()
+    for relationship in graph.get("relationships", []):
+        source = resolver.resolve(relationship["source"])
+        target = resolver.resolve(relationship["target"])
+        if source == target and relationship["source"] != relationship["target"]:
+            # Two spellings of one entity, not a real self-relationship
+            continue
+        for name in (source, target):
+            entities.setdefault(name, {"name": name})
+        description = relationship.get("description", "")
+        key = (source, target, description.casefold())
+        if key in seen:
+            continue
+        seen.add(key)
+        relationships.append({**relationship, "source": source, "target": target, "description": description})
+
+    return {"entities": list(entities.values()), "relationships": relationships}
@@ -0,0 +1,308 @@
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_client import estimate_tokens, get_backend
+from prompts import PROMPT_VERSION, graph_prompt, narrative_prompt, single_pass_prompt
+from extraction_cache import cache_key
+from chunking import DEFAULT_CHUNK_CHARS, merge_graphs, split_text
+from model_output import JsonObjectScanner, parse_graph
+from entity_resolution import resolve_graph
+from metrics import record_llm_call, span
+from job_queue import check_cancelled, in_job
+
+# "dual" sends the narrative and JSON prompts separately (the original behaviour),
+# "single" asks for the JSON once and writes the narrative from it locally
+MODES = ("dual", "single")
+
+
+def parse_graph_output(output):
+    # Tolerates prose, ``` fences and common JSON defects; raises json.JSONDecodeError otherwise
+    with span("parse json"):
+        return parse_graph(output)
+
+
+def complete_graph(backend, prompt):
+    # Streams the JSON prompt and hangs up as soon as the first object is balanced,
+    # so any chatter the model adds after the JSON is never generated (or once the job is cancelled)
+    check_cancelled()
+    started = time.perf_counter()
+    scanner = JsonObjectScanner()
+    pieces = []
+    counts = {"prompt_tokens": None, "completion_tokens": None}
+    events = backend.stream(prompt)
+    try:
+        for event in events:
+            check_cancelled()
+            pieces.append(event["text"])
+            if event.get("done"):
+                counts = {"prompt_tokens": event["prompt_tokens"], "completion_tokens": event["completion_tokens"]}
+            if scanner.feed(event["text"]) is not None:
+                break
+    finally:
+        events.close()
+    return {"text": "".join(pieces), "seconds": time.perf_counter() - started, **counts}
+
+
+def narrative_from_graph(graph):
+    # Same layout the narrative prompt asks the model for
+    lines = ["Here are the involved entities:"]
+    for number, entity in enumerate(graph.get("entities", []), start=1):
+        name = entity.get("name", "")
+        description = entity.get("description")
+        lines.append(f"{number}. {name} ({description})" if description else f"{number}. {name}")
+
+    lines.append("")
+    lines.append("Relationships between entities:")
+    for relationship in graph.get("relationships", []):
+        source = relationship.get("source", relationship.get("from"))
+        target = relationship.get("target", relationship.get("to"))
+        lines.append(f"* {source} and {target} are {relationship.get('description', 'related')}.")
+    return "\n".join(lines)
+
+
+def add_usage(usage, prompt, completion, call):
+    # call names the prompt ("narrative", "graph" or "single") in the request's metrics
+    prompt_tokens = completion["prompt_tokens"] or estimate_tokens(prompt)
+    completion_tokens = completion["completion_tokens"] or estimate_tokens(completion["text"])
+    usage["calls"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["completion_tokens"] += completion_tokens
+    usage["seconds"] += completion["seconds"]
+    record_llm_call(call, prompt, completion, prompt_tokens, completion_tokens)
+
+
+def new_usage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+
+
+def complete_text(backend, prompt):
+    # backend.complete(), except that inside a job the answer is streamed, so a cancelled job hangs up
+    # instead of waiting for the whole answer
+    if not in_job():
+        return backend.complete(prompt)
+    check_cancelled()
+    started = time.perf_counter()
+    pieces = []
+    counts = {"prompt_tokens": None, "completion_tokens": None}
+    events = backend.stream(prompt)
+    try:
+        for event in events:
+            check_cancelled()
+            pieces.append(event["text"])
+            if event.get("done"):
+                counts = {"prompt_tokens": event["prompt_tokens"], "completion_tokens": event["completion_tokens"]}
+    finally:
+        events.close()
+    return {"text": "".join(pieces), "seconds": time.perf_counter() - started, **counts}
+
+
+def run_dual(text, backend):
+    usage = new_usage()
+    prompt = narrative_prompt(text)
+    completion = complete_text(backend, prompt)
+    add_usage(usage, prompt, completion, "narrative")
+    narrative = completion["text"]
+
+    prompt_2 = graph_prompt(text)
+    completion_2 = complete_graph(backend, prompt_2)
+    add_usage(usage, prompt_2, completion_2, "graph")
+    graph = parse_graph_output(completion_2["text"])
+    return {"narrative": narrative, "graph": graph, "usage": usage}
+
+
+def run_single(text, backend):
+    usage = new_usage()
+    prompt = single_pass_prompt(text)
+    completion = complete_graph(backend, prompt)
+    add_usage(usage, prompt, completion, "single")
+    graph = parse_graph_output(completion["text"])
+    narrative = narrative_from_graph(graph) if isinstance(graph, dict) else ""
+    return {"narrative": narrative, "graph": graph, "usage": usage}
+
+
+# asyncio is imported inside the streaming functions only, it costs more start-up time than the
+# whole non-streaming path needs
+async def stream_completion(backend, prompt, on_token):
+    # Runs the blocking backend.stream() in a worker thread and hands each piece to on_token on the event loop
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    finished = object()
+    # Set when the consumer gives up (on_token raised JobCancelled), so the stream is closed at the next piece
+    stop = threading.Event()
+
+    def produce():
+        stream = backend.stream(prompt)
+        try:
+            for event in stream:
+                if stop.is_set():
+                    break
+                check_cancelled()
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, e)
+        finally:
+            stream.close()
+            loop.call_soon_threadsafe(events.put_nowait, finished)
+
+    started = loop.time()
+    # In a copy of this context, so the producer sees the job's cancel check
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    pieces = []
+    counts = {"prompt_tokens": None, "completion_tokens": None}
+    error = None
+    try:
+        while True:
+            event = await events.get()
+            if event is finished:
+                break
+            if isinstance(event, Exception):
+                error = event
+                continue
+            if event["text"]:
+                pieces.append(event["text"])
+                on_token(event["text"])
+            if event.get("done"):
+                counts = {"prompt_tokens": event["prompt_tokens"], "completion_tokens": event["completion_tokens"]}
+    except BaseException:
+        stop.set()
+        raise
+    await producer
+    if error is not None:
+        raise error
+    return {"text": "".join(pieces), "seconds": loop.time() - started, **counts}
+
+
+async def run_dual_streaming(text, backend, on_token):
+    # Both prompts go out at once; the narrative is streamed while the JSON prompt runs alongside it
+    import asyncio
+
+    usage = new_usage()
+    prompt = narrative_prompt(text)
+    prompt_2 = graph_prompt(text)
+    completion, completion_2 = await asyncio.gather(
+        stream_completion(backend, prompt, on_token),
+        asyncio.to_thread(complete_graph, backend, prompt_2),
+    )
+    add_usage(usage, prompt, completion, "narrative")
+    add_usage(usage, prompt_2, completion_2, "graph")
+    graph = parse_graph_output(completion_2["text"])
+    return {"narrative": completion["text"], "graph": graph, "usage": usage}
+
+
+async def run_single_streaming(text, backend, on_token):
+    # Nothing to stream until the JSON is back, the narrative is then sent in one piece
+    import asyncio
+
+    result = await asyncio.to_thread(run_single, text, backend)
+    on_token(result["narrative"])
+    return result
+
+
+STREAMING_RUNNERS = {
+    "dual": run_dual_streaming,
+    "single": run_single_streaming,
+}
+
+
+RUNNERS = {
+    "dual": run_dual,
+    "single": run_single,
+}
+
+
+def extract_chunked(chunks, mode, backend, cache=None, on_token=None):
+    # Map: every chunk goes through the requested mode's prompts in parallel (each one cached on its own).
+    # Reduce: the partial graphs are merged; in dual mode the model's narratives are joined in chunk order,
+    # in single mode the narrative is written from the merged graph.
+    # With on_token, the first chunk's narrative is streamed as the model writes it and every later one is
+    # sent as soon as it and the ones before it are done, so on_token is only ever called by one thread at a time.
+    usage = new_usage()
+    usage["chunks"] = len(chunks)
+    usage["failed_chunks"] = 0
+    graphs = []
+    narratives = []
+    errors = []
+    stream_first = on_token if mode == "dual" else None
+    with ThreadPoolExecutor(max_workers=min(len(chunks), backend.concurrency)) as pool:
+        # Each chunk runs in a copy of this context, so its model calls still land in the request's metrics
+        futures = [pool.submit(contextvars.copy_context().run, extract, chunk, mode, backend, cache,
+                               stream_first if number == 0 else None, 0)
+                   for number, chunk in enumerate(chunks)]
+        try:
+            for number, future in enumerate(futures):
+                try:
+                    result = future.result()
+                except json.JSONDecodeError as e:
+                    # One malformed chunk should not throw away the rest of the document
+                    usage["failed_chunks"] += 1
+                    errors.append(e)
+                    continue
+                for field in ("calls", "prompt_tokens", "completion_tokens", "seconds"):
+                    usage[field] += result["usage"][field]
+                if isinstance(result["graph"], dict):
+                    graphs.append(result["graph"])
+                if mode == "dual" and result["narrative"]:
+                    if stream_first is not None and number > 0:
+                        on_token("\n\n" + result["narrative"])
+                    narratives.append(result["narrative"])
+        except BaseException:
+            # Cancelled (or broken): chunks that have not started yet are dropped
+            for future in futures:
+                future.cancel()
+            raise
+
+    if not graphs:
+        raise errors[0] if errors else json.JSONDecodeError("No chunk returned a graph", "", 0)
+    graph = merge_graphs(graphs)
+    if mode == "dual":
+        narrative = "\n\n".join(narratives)
+    else:
+        narrative = narrative_from_graph(graph)
+        if on_token is not None:
+            on_token(narrative)
+    return {"narrative": narrative, "graph": graph, "usage": usage, "cached": False}
+
+
+def extract(text, mode="dual", backend=None, cache=None, on_token=None, chunk_chars=DEFAULT_CHUNK_CHARS):
+    # Returns {"narrative", "graph", "usage", "cached"}; only well-formed results are cached.
+    # With on_token, the narrative is streamed to it piece by piece as the model writes it.
+    # Text longer than chunk_chars is extracted chunk by chunk (0 turns chunking off).
+    if mode not in RUNNERS:
+        raise ValueError(f"Unknown extraction mode '{mode}', expected one of {MODES}")
+    backend = backend or get_backend()
+
+    if chunk_chars and len(text) > chunk_chars:
+        return with_resolved_entities(extract_chunked(split_text(text, chunk_chars), mode, backend, cache, on_token))
+
+    key = cache_key(backend.model, PROMPT_VERSION, text, mode)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached["narrative"])
+            result = {"narrative": cached["narrative"], "graph": cached["graph"], "usage": new_usage(), "cached": True}
+            return with_resolved_entities(result)
+
+    if on_token is not None:
+        import asyncio
+
+        result = asyncio.run(STREAMING_RUNNERS[mode](text, backend, on_token))
+    else:
+        result = RUNNERS[mode](text, backend)
+    result["cached"] = False
+    if cache is not None and isinstance(result["graph"], dict):
+        cache.put(key, {"narrative": result["narrative"], "graph": result["graph"]})
+    return with_resolved_entities(result)
+
+
+def with_resolved_entities(result):
+    # "Vendor 1", "vendor 1" and "Vendor-1 Ltd" become one node before anything is drawn or stored
+    if isinstance(result["graph"], dict):
+        with span("resolve entities"):
+            result["graph"] = resolve_graph(result["graph"])
+    return result
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "extractions.sqlite")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("EXTRACTION_CACHE_MB", "256")) * 1024 * 1024)
+
+
+def cache_key(model, prompt_version, text, mode="default"):
+    # Content-addressed: the same text sent to the same model with the same prompts gives the same key
+    payload = json.dumps([model, prompt_version, mode, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    # Disk-backed cache of parsed extraction results (narrative + entities/relationships),
+    # evicting least recently used entries once the stored size exceeds max_bytes
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _bump(self, name, amount=1):
+        self._conn.execute(
+            "INSERT INTO stats (name, count) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET count = count + excluded.count",
+            (name, amount),
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump("misses")
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._bump("hits")
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._bump("evictions", evicted)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT name, count FROM stats").fetchall())
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits = counts.get("hits", 0)
+        misses = counts.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counts.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM stats")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    # python extraction_cache.py [--clear]
+    cache = ExtractionCache()
+    if "--clear" in sys.argv[1:]:
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,280 @@
+# Centrality and clusters of an extracted graph, from a CSR sparse adjacency matrix.
+#
+#   python graph_analytics.py graph <id>             # a saved per-request graph (data/graphs/<id>.json)
+#   python graph_analytics.py store --top 20         # the merged graph of every document (graph_store.py)
+#   python graph_analytics.py random --nodes 50000 --edges 200000   # timing on a synthetic graph
+#
+# PageRank by power iteration, degree, betweenness by Brandes' algorithm from a sample of sources (all
+# sources of a small graph) run as sparse-matrix x dense-block BFS levels, connected components, and
+# communities by label propagation with modularity. Every step is O(edges) per iteration, so graphs with
+# 100k+ edges take seconds. annotate_graph_json() turns the results into node size (PageRank) and
+# colour (community) for network_viewer.html and the pyvis export.
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+BETWEENNESS_SAMPLES = 64
+BETWEENNESS_BATCH = 16
+# Largest communities first; the rest keep the default node colour
+PALETTE = (
+    "#e6194b", "#3cb44b", "#4363d8", "#f58231", "#911eb4", "#42d4f4", "#f032e6", "#bfef45",
+    "#fabed4", "#469990", "#dcbeff", "#9a6324", "#800000", "#aaffc3", "#808000", "#000075",
+)
+DEFAULT_COLOR = "#97c2fc"
+
+
+def adjacency(n, src, dst, weights=None):
+    # Directed CSR matrix, A[i, j] = number (or total weight) of i -> j edges; self loops are dropped
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    keep = src != dst
+    data = np.ones(keep.sum()) if weights is None else np.asarray(weights, dtype=float)[keep]
+    matrix = sparse.csr_matrix((data, (src[keep], dst[keep])), shape=(n, n))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def undirected(matrix):
+    # Symmetric 0/1 matrix: relationship direction is the model's wording, not a property of the link
+    both = (matrix + matrix.T).tocsr()
+    both.data[:] = 1.0
+    return both
+
+
+def pagerank(matrix, damping=0.85, tol=1e-9, max_iterations=200):
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out = np.asarray(matrix.sum(axis=1)).ravel()
+    dangling = out == 0
+    inverse = np.divide(1.0, out, out=np.zeros(n), where=~dangling)
+    incoming = matrix.T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iterations):
+        # Rank of nodes without outgoing edges is spread over every node
+        spread = incoming @ (rank * inverse)
+        new = damping * (spread + rank[dangling].sum() / n) + (1 - damping) / n
+        if np.abs(new - rank).sum() < tol * n:
+            return new
+        rank = new
+    return rank
+
+
+def betweenness(graph, samples=BETWEENNESS_SAMPLES, batch=BETWEENNESS_BATCH, seed=1):
+    # Normalized betweenness of an undirected 0/1 CSR graph. Brandes from `samples` random sources scaled
+    # by n / samples; each batch of sources is one dense (n, batch) block, so a BFS level is one product
+    n = graph.shape[0]
+    if n < 3:
+        return np.zeros(n)
+    rng = np.random.default_rng(seed)
+    sources = np.arange(n) if n <= samples else rng.choice(n, samples, replace=False)
+    total = np.zeros(n)
+    for start in range(0, len(sources), batch):
+        block = sources[start:start + batch]
+        columns = np.arange(len(block))
+        sigma = np.zeros((n, len(block)))
+        sigma[block, columns] = 1.0
+        level = np.full((n, len(block)), -1, dtype=np.int32)
+        level[block, columns] = 0
+        frontier = sigma.copy()
+        depth = 0
+        # Forward: number of shortest paths from each source, level by level
+        while True:
+            reached = graph @ frontier
+            new = (reached > 0) & (level < 0)
+            if not new.any():
+                break
+            depth += 1
+            level[new] = depth
+            frontier = np.where(new, reached, 0.0)
+            sigma += frontier
+        # Backward: dependencies flow from each level to the one before it
+        delta = np.zeros_like(sigma)
+        for d in range(depth, 0, -1):
+            at = level == d
+            share = np.where(at, (1.0 + delta) / np.where(at, sigma, 1.0), 0.0)
+            delta += np.where(level == d - 1, sigma * (graph @ share), 0.0)
+        delta[block, columns] = 0.0
+        total += delta.sum(axis=1)
+    # Every pair is counted from both ends in an undirected graph
+    total *= n / len(sources) / 2
+    return total / ((n - 1) * (n - 2) / 2)
+
+
+def row_argmax(matrix, default):
+    # Column of the largest entry of each row (default where a row is empty); csr_matrix.argmax loops
+    # over the rows in Python. Label propagation's votes carry tie-breaking noise, so the max is unique
+    filled = np.diff(matrix.indptr) > 0
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    largest = np.zeros(matrix.shape[0])
+    largest[filled] = np.maximum.reduceat(matrix.data, matrix.indptr[:-1][filled])
+    hits = matrix.data == largest[rows]
+    best = default.copy()
+    best[rows[hits]] = matrix.indices[hits]
+    return best
+
+
+def label_propagation(graph, max_iterations=30, seed=1):
+    # Each node takes the label most of its neighbours have; half of the nodes move per round, since
+    # updating all of them at once makes two-sided structures swap labels forever
+    n = graph.shape[0]
+    labels = np.arange(n)
+    if graph.nnz == 0:
+        return labels
+    rng = np.random.default_rng(seed)
+    coo = graph.tocoo()
+    has_neighbours = np.diff(graph.indptr) > 0
+    quiet_rounds = 0
+    for _ in range(max_iterations):
+        # The noise only breaks ties, at random
+        votes = sparse.csr_matrix((coo.data + rng.random(coo.nnz) * 1e-6, (coo.row, labels[coo.col])), shape=(n, n))
+        votes.sum_duplicates()
+        best = row_argmax(votes, labels)
+        moving = has_neighbours & (rng.random(n) < 0.5) & (best != labels)
+        labels[moving] = best[moving]
+        quiet_rounds = quiet_rounds + 1 if moving.sum() <= n * 1e-4 else 0
+        if quiet_rounds >= 2:
+            break
+    return labels
+
+
+def by_size(labels):
+    # Relabels 0 = largest group, 1 = next, ...
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(counts), dtype=np.int64)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(len(counts))
+    return rank[inverse]
+
+
+def modularity(graph, labels):
+    total = graph.sum()
+    if total == 0:
+        return 0.0
+    coo = graph.tocoo()
+    inside = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    strength = np.bincount(labels, weights=np.asarray(graph.sum(axis=1)).ravel())
+    return float(inside / total - ((strength / total) ** 2).sum())
+
+
+def analyze(n, src, dst, betweenness_samples=BETWEENNESS_SAMPLES):
+    # n nodes numbered 0..n-1, edges as parallel src/dst arrays; returns one array per measure
+    timings = {}
+    started = time.perf_counter()
+    directed = adjacency(n, src, dst)
+    graph = undirected(directed)
+    timings["matrix"] = time.perf_counter() - started
+
+    def timed(name, compute):
+        step = time.perf_counter()
+        value = compute()
+        timings[name] = time.perf_counter() - step
+        return value
+
+    rank = timed("pagerank", lambda: pagerank(directed))
+    degree = np.diff(graph.indptr)
+    between = timed("betweenness", lambda: betweenness(graph, betweenness_samples))
+    _, component = timed("components", lambda: connected_components(graph, directed=False))
+    community = timed("communities", lambda: by_size(label_propagation(graph)))
+    return {
+        "pagerank": rank,
+        "degree": degree,
+        "inDegree": np.diff(directed.T.tocsr().indptr),
+        "outDegree": np.diff(directed.indptr),
+        "betweenness": between,
+        "component": by_size(component) if n else component,
+        "community": community,
+        "modularity": timed("modularity", lambda: modularity(graph, community)),
+        "seconds": {name: round(value, 4) for name, value in timings.items()},
+    }
+
+
+def summarize(result, names, top=10):
+    n = len(result["pagerank"])
+    central = np.argsort(-result["pagerank"], kind="stable")[:top]
+    return {
+        "nodes": n,
+        "components": int(result["component"].max()) + 1 if n else 0,
+        "communities": int(result["community"].max()) + 1 if n else 0,
+        "modularity": round(result["modularity"], 4),
+        "central": [
+            {"name": names[i], "pagerank": round(float(result["pagerank"][i]), 6), "degree": int(result["degree"][i]),
+             "betweenness": round(float(result["betweenness"][i]), 6), "community": int(result["community"][i])}
+            for i in central
+        ],
+        "seconds": result["seconds"],
+    }
+
+
+def annotate_graph_json(payload):
+    # Adds size (value, PageRank relative to the average node) and colour (community) to every node of a
+    # to_graph_json() payload, plus an "analytics" summary
+    nodes = payload["nodes"]
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    pairs = [(index[edge["from"]], index[edge["to"]]) for edge in payload["edges"]
+             if edge["from"] in index and edge["to"] in index]
+    src, dst = (np.array(column, dtype=np.int64) for column in zip(*pairs)) if pairs else ([], [])
+    result = analyze(len(nodes), src, dst)
+    for i, node in enumerate(nodes):
+        community = int(result["community"][i])
+        node["value"] = round(float(result["pagerank"][i]) * len(nodes), 4)
+        node["color"] = PALETTE[community] if community < len(PALETTE) else DEFAULT_COLOR
+        node["community"] = community
+        node["degree"] = int(result["degree"][i])
+        node["betweenness"] = round(float(result["betweenness"][i]), 6)
+    payload["analytics"] = summarize(result, [node["label"] for node in nodes], top=5)
+    return payload
+
+
+def random_graph(nodes, edges, seed=1):
+    # Preferential-attachment-like degrees, so there are hubs as in extracted graphs
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, nodes + 1) ** 0.8
+    weights /= weights.sum()
+    return rng.choice(nodes, edges, p=weights), rng.integers(0, nodes, edges)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # Options shared by every subcommand, given after it (graph_analytics.py store --top 20)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--top", type=int, default=10)
+    common.add_argument("--samples", type=int, default=BETWEENNESS_SAMPLES, help="betweenness source samples")
+    commands = parser.add_subparsers(dest="command", required=True)
+    graph = commands.add_parser("graph", parents=[common], help="a graph saved by process_data.py or graph_store.py --save")
+    graph.add_argument("id")
+    store = commands.add_parser("store", parents=[common], help="the merged graph in graph.sqlite")
+    store.add_argument("--db")
+    synthetic = commands.add_parser("random", parents=[common], help="a synthetic graph, for timing")
+    synthetic.add_argument("--nodes", type=int, default=50000)
+    synthetic.add_argument("--edges", type=int, default=200000)
+    args = parser.parse_args()
+
+    if args.command == "graph":
+        from graph_json import load_graph
+
+        payload = load_graph(args.id)
+        names = [node["label"] for node in payload["nodes"]]
+        index = {node["id"]: i for i, node in enumerate(payload["nodes"])}
+        pairs = [(index[edge["from"]], index[edge["to"]]) for edge in payload["edges"]]
+    elif args.command == "store":
+        from graph_store import DEFAULT_PATH, GraphStore
+
+        names, pairs = GraphStore(args.db or DEFAULT_PATH).edge_list()
+    else:
+        names = [f"node {i}" for i in range(args.nodes)]
+        pairs = np.column_stack(random_graph(args.nodes, args.edges))
+
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    started = time.perf_counter()
+    result = analyze(len(names), pairs[:, 0], pairs[:, 1], args.samples)
+    print(f"{len(names)} nodes, {len(pairs)} edges in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    print(json.dumps(summarize(result, names, args.top), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import shutil
+import uuid
+
+# Per-request graphs, served by pages/api/analyze.ts (?graph=<id>) to public/network_viewer.html
+GRAPH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "graphs")
+GRAPH_KEEP = int(os.environ.get("GRAPH_KEEP", "500"))
+REQUEST_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Graphs with at least this many nodes get server-side positions (graph_layout.py) in --layout auto mode
+LAYOUT_MIN_NODES = int(os.environ.get("LAYOUT_MIN_NODES", "100"))
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def check_request_id(request_id):
+    # Ids end up in file names, so nothing but [A-Za-z0-9_-] is accepted
+    if not REQUEST_ID.match(request_id or ""):
+        raise ValueError(f"Invalid request id: {request_id!r}")
+    return request_id
+
+
+def to_graph_json(graph):
+    # Compact vis-network shaped payload: nodes get integer ids, edges refer to them
+    ids = {}
+    nodes = []
+
+    def node_id(name, description=None):
+        if name not in ids:
+            ids[name] = len(nodes)
+            node = {"id": ids[name], "label": name}
+            if description:
+                node["title"] = description
+            nodes.append(node)
+        return ids[name]
+
+    for entity in graph.get("entities", []):
+        node_id(entity["name"], entity.get("description"))
+
+    edges = []
+    for relationship in graph.get("relationships", []):
+        edge = {"from": node_id(relationship["source"]), "to": node_id(relationship["target"])}
+        if relationship.get("description"):
+            edge["label"] = relationship["description"]
+        edges.append(edge)
+    return {"nodes": nodes, "edges": edges}
+
+
+def use_server_layout(layout, node_count):
+    # layout is "server", "browser" or "auto" (server only once the graph is big enough to stall physics)
+    if layout == "server":
+        return True
+    if layout == "browser":
+        return False
+    return node_count >= LAYOUT_MIN_NODES
+
+
+def graph_path(request_id, view=None):
+    # Level-of-detail graphs (graph_lod.py) keep every view but the first in a <id>.views folder
+    if view is None:
+        return os.path.join(GRAPH_DIR, f"{check_request_id(request_id)}.json")
+    return os.path.join(views_dir(request_id), f"{int(view)}.json")
+
+
+def views_dir(request_id):
+    return os.path.join(GRAPH_DIR, f"{check_request_id(request_id)}.views")
+
+
+def save_graph(request_id, payload):
+    os.makedirs(GRAPH_DIR, exist_ok=True)
+    path = graph_path(request_id)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    prune_graphs()
+    return path
+
+
+def save_views(request_id, views):
+    # {view id: payload} from graph_lod.build_views; view 0 becomes the graph itself
+    folder = views_dir(request_id)
+    tmp_folder = folder + ".tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    for view, payload in views.items():
+        if view:
+            with open(os.path.join(tmp_folder, f"{int(view)}.json"), "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+    return save_graph(request_id, views[0])
+
+
+def load_graph(request_id, view=None):
+    with open(graph_path(request_id, view), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def prune_graphs(keep=GRAPH_KEEP):
+    # Oldest graphs go first once there are more than `keep`
+    try:
+        names = [name for name in os.listdir(GRAPH_DIR) if name.endswith(".json")]
+    except FileNotFoundError:
+        return
+    if len(names) <= keep:
+        return
+    paths = sorted((os.path.join(GRAPH_DIR, name) for name in names), key=os.path.getmtime)
+    for path in paths[:len(paths) - keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(path[:-len(".json")] + ".views", ignore_errors=True)
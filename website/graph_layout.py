@@ -0,0 +1,261 @@
+# Server-side graph layout, so the browser can draw large graphs with physics switched off.
+#
+# Spectral start (Koren's degree-normalized eigenvectors by power iteration, O(edges) per step)
+# followed by a Fruchterman-Reingold refinement. Repulsion is exact for small graphs; larger ones use
+# Barnes-Hut on a quadtree that splits until a cell holds LEAF_SIZE nodes, so a dense core (the
+# spectral start puts most nodes of a random graph close together) is split as finely as the sparse
+# rim. Each iteration is O(n log n) and the pairs are walked a chunk of nodes at a time, so memory stays
+# O(nodes) instead of kamada_kawai's n x n.
+import math
+
+import numpy as np
+
+EXACT_MAX_NODES = 1000
+BLOCK = 512
+THETA = 0.7
+LEAF_SIZE = 8
+MAX_DEPTH = 24
+NODE_SPACING = 120.0  # layout units -> vis-network pixels
+
+
+def edge_arrays(n, edges):
+    # Undirected, without self loops or duplicates
+    if not len(edges):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    pairs = pairs[(pairs[:, 0] != pairs[:, 1]) & (pairs.min(axis=1) >= 0) & (pairs.max(axis=1) < n)]
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def spectral_init(n, src, dst, dims=2, iterations=200, seed=1):
+    rng = np.random.RandomState(seed)
+    degree = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+    if not len(src):
+        return rng.uniform(-1, 1, size=(n, dims))
+    weight = np.maximum(degree, 1).astype(float)
+
+    def step(x):
+        # 0.5 * (I + D^-1 A) x without building A
+        spread = np.zeros_like(x)
+        np.add.at(spread, src, x[dst])
+        np.add.at(spread, dst, x[src])
+        return 0.5 * (x + spread / weight)
+
+    found = [np.ones(n) / math.sqrt(n)]
+    for _ in range(dims):
+        x = rng.uniform(-1, 1, size=n)
+        for _ in range(iterations):
+            # D-orthogonal to the trivial vector and to the ones already found
+            for other in found:
+                x -= (x * weight) @ other / ((other * weight) @ other) * other
+            x = step(x)
+            norm = np.linalg.norm(x)
+            if norm < 1e-12:
+                x = rng.uniform(-1, 1, size=n)
+                continue
+            x /= norm
+        found.append(x)
+    positions = np.column_stack(found[1:])
+    # Isolated nodes all collapse onto one point, scatter them so the refinement can pull them apart
+    positions += rng.uniform(-1e-3, 1e-3, size=positions.shape)
+    return positions
+
+
+def pair_forces(pos_a, pos_b, k, weight=None):
+    # Repulsion k^2 / d on every point of pos_a from every point of pos_b, x and y kept apart
+    # so no (a, b, 2) temporaries are built
+    dx = pos_a[:, 0, None] - pos_b[None, :, 0]
+    dy = pos_a[:, 1, None] - pos_b[None, :, 1]
+    scale = k * k / np.maximum(dx * dx + dy * dy, 1e-4)
+    if weight is not None:
+        scale *= weight
+    return np.column_stack(((dx * scale).sum(axis=1), (dy * scale).sum(axis=1)))
+
+
+def exact_repulsion(pos, k):
+    force = np.zeros_like(pos)
+    for start in range(0, len(pos), BLOCK):
+        force[start:start + BLOCK] = pair_forces(pos[start:start + BLOCK], pos, k)
+    return force
+
+
+def build_quadtree(pos, leaf_size=LEAF_SIZE, max_depth=MAX_DEPTH):
+    # Built a level at a time: cells with more than leaf_size nodes are split into their (up to) four
+    # occupied quadrants. Children of a cell are contiguous, leaf members are contiguous in tree["order"]
+    low = pos.min(axis=0)
+    side = max(float((pos.max(axis=0) - low).max()), 1e-9)
+    unit = np.minimum((pos - low) / side, 1 - 1e-12)
+    n = len(pos)
+    counts, sums, sizes = [np.array([n])], [pos.sum(axis=0, keepdims=True)], [np.array([side])]
+    child_start, child_end = [], []
+    leaf_of = np.zeros(n, dtype=np.int64)
+    active = np.arange(n) if n > leaf_size else np.zeros(0, dtype=np.int64)
+    parent = np.zeros(len(active), dtype=np.int64)
+    total = 1
+    for depth in range(1, max_depth + 1):
+        start = np.zeros(len(counts[-1]), dtype=np.int64)
+        end = np.zeros(len(counts[-1]), dtype=np.int64)
+        if not len(active):
+            child_start.append(start)
+            child_end.append(end)
+            break
+        bit = (unit[active] * (1 << depth)).astype(np.int64) & 1
+        keys, inverse, count = np.unique(parent * 4 + bit[:, 0] * 2 + bit[:, 1], return_inverse=True,
+                                         return_counts=True)
+        owner = keys // 4
+        first = np.searchsorted(owner, np.arange(len(counts[-1])), side="left")
+        last = np.searchsorted(owner, np.arange(len(counts[-1])), side="right")
+        has_children = last > first
+        start[has_children] = total + first[has_children]
+        end[has_children] = total + last[has_children]
+        child_start.append(start)
+        child_end.append(end)
+        cell_sums = np.zeros((len(keys), 2))
+        cell_sums[:, 0] = np.bincount(inverse, weights=pos[active, 0])
+        cell_sums[:, 1] = np.bincount(inverse, weights=pos[active, 1])
+        counts.append(count)
+        sums.append(cell_sums)
+        sizes.append(np.full(len(keys), side / (1 << depth)))
+        cell = total + inverse
+        total += len(keys)
+        leaf_of[active] = cell
+        split = (count[inverse] > leaf_size) if depth < max_depth else np.zeros(len(active), dtype=bool)
+        active, parent = active[split], inverse[split]
+    else:
+        child_start.append(np.zeros(len(counts[-1]), dtype=np.int64))
+        child_end.append(np.zeros(len(counts[-1]), dtype=np.int64))
+
+    count = np.concatenate(counts).astype(float)
+    order = np.argsort(leaf_of, kind="stable")
+    bounds = np.searchsorted(leaf_of[order], np.arange(total + 1))
+    return {
+        "count": count,
+        "centroid": np.concatenate(sums) / count[:, None],
+        "size": np.concatenate(sizes),
+        "child_start": np.concatenate(child_start)[:total],
+        "child_end": np.concatenate(child_end)[:total],
+        "order": order,
+        "member_start": bounds[:-1],
+        "member_end": bounds[1:],
+    }
+
+
+def expand(values, start, end):
+    # (value, item) for every item in start..end of each value
+    width = end - start
+    values = np.repeat(values, width)
+    offset = np.arange(len(values)) - np.repeat(np.cumsum(width) - width, width)
+    return values, np.repeat(start, width) + offset
+
+
+def add_repulsion(force, pos, nodes, points, k, weight=None):
+    dx = pos[nodes, 0] - points[:, 0]
+    dy = pos[nodes, 1] - points[:, 1]
+    scale = k * k / np.maximum(dx * dx + dy * dy, 1e-4)
+    if weight is not None:
+        scale *= weight
+    force[:, 0] += np.bincount(nodes, weights=dx * scale, minlength=len(force))
+    force[:, 1] += np.bincount(nodes, weights=dy * scale, minlength=len(force))
+
+
+def tree_repulsion(pos, k, theta=THETA):
+    # Barnes-Hut, walked once per leaf for all of its members: a cell whose size is below theta times its
+    # distance from the leaf (centroid distance less the leaf's radius) acts as one mass at its centroid,
+    # closer cells are opened and close leaves are summed node by node. theta < 1/sqrt(2) always opens the
+    # cells a leaf is in, so no node is pushed by its own mass
+    tree = build_quadtree(pos)
+    force = np.zeros_like(pos)
+    leaf = tree["child_end"] == tree["child_start"]
+    groups = np.flatnonzero(tree["member_end"] > tree["member_start"])
+    members = tree["count"][groups]
+    group_of, member = expand(groups, tree["member_start"][groups], tree["member_end"][groups])
+    offset = pos[tree["order"][member]] - tree["centroid"][group_of]
+    radius = np.zeros(len(leaf))
+    np.maximum.at(radius, group_of, np.sqrt((offset * offset).sum(axis=1)))
+
+    # Chunks of groups holding about BLOCK * 8 nodes
+    bounds = np.searchsorted(np.cumsum(members), np.arange(0, members.sum(), BLOCK * 8), side="right")
+    for chunk in np.split(groups, bounds[1:]):
+        sources, cells = chunk, np.zeros(len(chunk), dtype=np.int64)
+        while len(sources):
+            delta = tree["centroid"][sources] - tree["centroid"][cells]
+            reach = np.maximum(np.sqrt((delta * delta).sum(axis=1)) - radius[sources], 0)
+            far = tree["size"][cells] < theta * reach
+            near = ~far & leaf[cells]
+            opened = ~far & ~leaf[cells]
+
+            far_cells, own = expand(cells[far], tree["member_start"][sources[far]],
+                                    tree["member_end"][sources[far]])
+            add_repulsion(force, pos, tree["order"][own], tree["centroid"][far_cells], k,
+                          tree["count"][far_cells])
+
+            near_sources, others = expand(sources[near], tree["member_start"][cells[near]],
+                                          tree["member_end"][cells[near]])
+            others, own = expand(others, tree["member_start"][near_sources], tree["member_end"][near_sources])
+            # A node against itself is at distance 0 and adds nothing
+            add_repulsion(force, pos, tree["order"][own], pos[tree["order"][others]], k)
+
+            sources, cells = expand(sources[opened], tree["child_start"][cells[opened]],
+                                    tree["child_end"][cells[opened]])
+    return force
+
+
+def force_directed(pos, src, dst, iterations=None):
+    n = len(pos)
+    if iterations is None:
+        # The spectral start is already close for big graphs, fewer refinement passes are enough
+        iterations = 100 if n <= EXACT_MAX_NODES else 50
+    area = float(n)
+    k = math.sqrt(area / n)
+    # Start the refinement at roughly the final scale
+    pos = pos - pos.mean(axis=0)
+    pos = pos / max(np.abs(pos).max(), 1e-9) * math.sqrt(area) / 2
+    start_temperature = math.sqrt(area) / 10
+    repulsion = exact_repulsion if n <= EXACT_MAX_NODES else tree_repulsion
+
+    for i in range(iterations):
+        # Linear cooling: big moves first, small corrections at the end
+        temperature = start_temperature * (1 - i / iterations) + 1e-3
+        force = repulsion(pos, k)
+        if len(src):
+            delta = pos[src] - pos[dst]
+            distance = np.maximum(np.linalg.norm(delta, axis=1), 1e-4)
+            pull = delta * (distance / k)[:, None]
+            np.add.at(force, src, -pull)
+            np.add.at(force, dst, pull)
+        # Weak gravity keeps disconnected components from drifting away
+        force -= pos * (0.05 * k)
+        length = np.maximum(np.linalg.norm(force, axis=1), 1e-9)
+        pos = pos + force / length[:, None] * np.minimum(length, temperature)[:, None]
+    return pos
+
+
+def compute_layout(n, edges, iterations=None, seed=1):
+    # n nodes numbered 0..n-1, edges as (from, to) pairs; returns an (n, 2) array
+    if n == 0:
+        return np.zeros((0, 2))
+    if n == 1:
+        return np.zeros((1, 2))
+    src, dst = edge_arrays(n, edges)
+    pos = spectral_init(n, src, dst, seed=seed)
+    pos = force_directed(pos, src, dst, iterations)
+    pos -= pos.mean(axis=0)
+    return pos * NODE_SPACING
+
+
+def layout_graph_json(payload, iterations=None):
+    # Adds x/y to every node of a to_graph_json() payload; the viewer turns physics off when they are set
+    nodes = payload["nodes"]
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    edges = [
+        (index[edge["from"]], index[edge["to"]])
+        for edge in payload["edges"]
+        if edge["from"] in index and edge["to"] in index
+    ]
+    positions = compute_layout(len(nodes), edges, iterations)
+    for node, (x, y) in zip(nodes, positions):
+        node["x"] = round(float(x), 1)
+        node["y"] = round(float(y), 1)
+    payload["layout"] = "server"
+    return payload
@@ -0,0 +1,208 @@
+# Level-of-detail views of large graphs: clusters of entities are drawn as single super-nodes, and a
+# cluster is only expanded when the user drills into it in network_viewer.html.
+#
+#   python graph_lod.py store --save corpus          # the merged graph, open /network_viewer.html?id=corpus
+#   python graph_lod.py random --nodes 100000 --edges 400000 --save lod-test
+#
+# Every view holds at most LOD_NODE_BUDGET nodes (entities or clusters) and LOD_EDGE_BUDGET edges, so the
+# payload and the browser's work stay the same whatever the size of the graph. A cluster bigger than the
+# budget is split with label propagation (graph_analytics.py); when that finds more communities than fit,
+# they are packed into budget-many groups, and a community too big to make progress is cut into pieces
+# along a reverse Cuthill-McKee order so neighbours stay together. Edges between clusters are merged into
+# one edge weighted by how many relationships it stands for.
+import argparse
+import heapq
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+from graph_analytics import DEFAULT_COLOR, adjacency, by_size, label_propagation, undirected
+
+LOD_NODE_BUDGET = int(os.environ.get("LOD_NODE_BUDGET", "500"))
+LOD_EDGE_BUDGET = int(os.environ.get("LOD_EDGE_BUDGET", str(4 * LOD_NODE_BUDGET)))
+ROOT_VIEW = 0
+TITLE_NAMES = 10
+
+
+def pack(groups, bins):
+    # Largest group first into the currently smallest bin (LPT), so the bins end up about the same size
+    heap = [(0, b) for b in range(bins)]
+    packed = [[] for _ in range(bins)]
+    for group in sorted(groups, key=len, reverse=True):
+        size, b = heapq.heappop(heap)
+        packed[b].append(group)
+        heapq.heappush(heap, (size + len(group), b))
+    return [np.concatenate(parts) for parts in packed if parts]
+
+
+def cut(sub, members, pieces):
+    # Pieces along a reverse Cuthill-McKee order, which keeps neighbours next to each other
+    order = reverse_cuthill_mckee(sub, symmetric_mode=True)
+    return [members[part] for part in np.array_split(order, pieces)]
+
+
+def partition(sub, members, budget):
+    # members (global node numbers) -> at most `budget` groups, at least two; sub is their induced graph.
+    # A community holding more than half of the members is cut up, so every level at least halves the
+    # cluster (label propagation on graphs without much structure finds one giant community)
+    labels = by_size(label_propagation(sub))
+    count = int(labels.max()) + 1
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(count + 1))
+    groups = []
+    for c in range(count):
+        local = order[bounds[c]:bounds[c + 1]]
+        if 2 * len(local) > len(members):
+            pieces = max(2, min(budget // 2, -(-len(local) // budget)))
+            groups.extend(cut(sub[local][:, local], members[local], pieces))
+        else:
+            groups.append(members[local])
+    return groups if len(groups) <= budget else pack(groups, budget)
+
+
+def cluster_node(view, group, nodes, weight):
+    # A super-node: named and coloured after its most central entity, sized by the PageRank it holds
+    ranked = group[np.argsort(-weight[group], kind="stable")]
+    top = nodes[ranked[0]]
+    names = [nodes[i]["label"] for i in ranked[:TITLE_NAMES]]
+    more = f", +{len(group) - len(names)} more" if len(group) > len(names) else ""
+    return {
+        "id": f"c{view}",
+        "label": f"{top['label']} +{len(group) - 1}",
+        "title": f"{len(group)} entities: {', '.join(names)}{more}",
+        "value": round(float(weight[group].sum()), 4),
+        "color": top.get("color", DEFAULT_COLOR),
+        "shape": "diamond",
+        "cluster": view,
+        "members": len(group),
+        "top": top["label"],
+    }
+
+
+def build_views(payload, budget=LOD_NODE_BUDGET, edge_budget=LOD_EDGE_BUDGET):
+    # to_graph_json() payload (ideally annotated by graph_analytics) -> {view id: payload}; view 0 is the
+    # whole graph. Nodes already carry value/color, so a node looks the same at every level
+    budget = max(budget, 10)
+    nodes = payload["nodes"]
+    n = len(nodes)
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    edges = [edge for edge in payload["edges"] if edge["from"] in index and edge["to"] in index]
+    src = np.array([index[edge["from"]] for edge in edges], dtype=np.int64)
+    dst = np.array([index[edge["to"]] for edge in edges], dtype=np.int64)
+    graph = undirected(adjacency(n, src, dst))
+    weight = np.array([float(node.get("value", 1.0)) for node in nodes])
+    # Edges by source node, so a view only looks at the edges of its own members
+    by_source = np.argsort(src, kind="stable")
+    source_bounds = np.searchsorted(src[by_source], np.arange(n + 1))
+    inside = np.zeros(n, dtype=bool)
+    local = np.zeros(n, dtype=np.int64)
+
+    views = {}
+    next_view = ROOT_VIEW + 1
+    pending = [(ROOT_VIEW, np.arange(n), [], "All")]
+    while pending:
+        view, members, path, label = pending.pop()
+        info = {"view": view, "label": label, "path": path, "members": len(members), "budget": budget}
+
+        if len(members) <= budget:
+            # Small enough: the entities themselves, with their own relationships
+            inside[members] = True
+            edge_ids = np.concatenate([by_source[source_bounds[i]:source_bounds[i + 1]] for i in members]) \
+                if len(members) else np.zeros(0, dtype=np.int64)
+            edge_ids = edge_ids[inside[dst[edge_ids]]][:edge_budget]
+            inside[members] = False
+            views[view] = {"nodes": [nodes[i] for i in members], "edges": [edges[e] for e in edge_ids], "lod": info}
+            continue
+
+        sub = graph[members][:, members]
+        groups = partition(sub, members, budget)
+        item_nodes = []
+        item_of = np.empty(len(members), dtype=np.int64)
+        local[members] = np.arange(len(members))
+        here = path + [{"view": view, "label": label}]
+        for item, group in enumerate(groups):
+            item_of[local[group]] = item
+            if len(group) == 1:
+                item_nodes.append(nodes[group[0]])
+                continue
+            child = next_view
+            next_view += 1
+            item_nodes.append(cluster_node(child, group, nodes, weight))
+            pending.append((child, group, here, item_nodes[-1]["top"]))
+
+        # Relationships between two items become one edge, as wide as the number of relationships
+        coo = sub.tocoo()
+        a, b = item_of[coo.row], item_of[coo.col]
+        keep = a < b
+        pairs, counts = np.unique(a[keep] * len(groups) + b[keep], return_counts=True)
+        strongest = np.argsort(-counts, kind="stable")[:edge_budget]
+        view_edges = [
+            {"from": item_nodes[pairs[k] // len(groups)]["id"], "to": item_nodes[pairs[k] % len(groups)]["id"],
+             "value": int(counts[k]), "title": f"{counts[k]} relationships", "arrows": ""}
+            for k in strongest
+        ]
+        views[view] = {"nodes": item_nodes, "edges": view_edges, "lod": info}
+
+    root = views[ROOT_VIEW]
+    root["lod"]["views"] = len(views)
+    if "analytics" in payload:
+        root["analytics"] = payload["analytics"]
+    return views
+
+
+def save_lod_graph(graph_id, payload, layout="auto", budget=LOD_NODE_BUDGET):
+    # Builds and saves every view; returns the number of views. A server layout takes about a second per
+    # full view, so in auto mode only the first view gets one, the others are small enough for physics
+    from graph_json import save_views, use_server_layout
+    from graph_layout import layout_graph_json
+
+    views = build_views(payload, budget)
+    for view_id, view in views.items():
+        if layout == "server" or (view_id == ROOT_VIEW and use_server_layout(layout, len(view["nodes"]))):
+            layout_graph_json(view)
+    save_views(graph_id, views)
+    return len(views)
+
+
+def main():
+    from graph_analytics import annotate_graph_json, random_graph
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--budget", type=int, default=LOD_NODE_BUDGET, help="nodes per view")
+    common.add_argument("--save", metavar="ID", required=True, help="graph id for network_viewer.html")
+    common.add_argument("--layout", choices=("auto", "server", "browser"), default="auto")
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    store = commands.add_parser("store", parents=[common], help="the merged graph in graph.sqlite")
+    store.add_argument("--db")
+    synthetic = commands.add_parser("random", parents=[common], help="a synthetic graph, for timing")
+    synthetic.add_argument("--nodes", type=int, default=100000)
+    synthetic.add_argument("--edges", type=int, default=400000)
+    args = parser.parse_args()
+
+    if args.command == "store":
+        from graph_store import DEFAULT_PATH, GraphStore
+
+        names, pairs = GraphStore(args.db or DEFAULT_PATH).edge_list()
+    else:
+        names = [f"node {i}" for i in range(args.nodes)]
+        pairs = np.column_stack(random_graph(args.nodes, args.edges)).tolist()
+    payload = {
+        "nodes": [{"id": i, "label": name} for i, name in enumerate(names)],
+        "edges": [{"from": int(a), "to": int(b)} for a, b in pairs],
+    }
+
+    started = time.perf_counter()
+    annotate_graph_json(payload)
+    analysed = time.perf_counter()
+    count = save_lod_graph(args.save, payload, args.layout, args.budget)
+    print(f"{len(names)} nodes, {len(pairs)} edges: analytics {analysed - started:.2f}s, "
+          f"{count} views {time.perf_counter() - analysed:.2f}s", file=sys.stderr)
+    print(f"/network_viewer.html?id={args.save}")
+
+
+if __name__ == "__main__":
+    main()
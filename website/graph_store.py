@@ -0,0 +1,321 @@
+# Persistent entity/relationship graph merged across every processed document.
+#
+#   python graph_store.py merge                      # load everything batch_extract.py has produced
+#   python graph_store.py neighbors "Vendor 1" --depth 2
+#   python graph_store.py neighbors "Vendor 1" --depth 3 --save vendor-1   # open /network_viewer.html?id=vendor-1
+#   python graph_store.py stats
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from entity_resolution import DEFAULT_THRESHOLD, normalize_name, same_entity
+from minhash import LSHIndex, MinHasher, shingles
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "graph.sqlite")
+
+
+class GraphStore:
+    # Node identity goes through entity resolution: every spelling seen is kept as an alias, and new
+    # spellings are fuzzy-matched only against nodes sharing a MinHash LSH band (node_bands)
+
+    def __init__(self, path=DEFAULT_PATH, threshold=DEFAULT_THRESHOLD):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self.lsh = LSHIndex()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                description TEXT
+            );
+            CREATE TABLE IF NOT EXISTS edges (
+                id INTEGER PRIMARY KEY,
+                src INTEGER NOT NULL REFERENCES nodes(id),
+                dst INTEGER NOT NULL REFERENCES nodes(id),
+                description TEXT NOT NULL,
+                UNIQUE (src, dst, description)
+            );
+            CREATE INDEX IF NOT EXISTS edges_src ON edges (src);
+            CREATE INDEX IF NOT EXISTS edges_dst ON edges (dst);
+            CREATE TABLE IF NOT EXISTS node_sources (
+                node_id INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+                source TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                PRIMARY KEY (node_id, source, identifier)
+            );
+            CREATE INDEX IF NOT EXISTS node_sources_doc ON node_sources (source, identifier);
+            CREATE TABLE IF NOT EXISTS edge_sources (
+                edge_id INTEGER NOT NULL REFERENCES edges(id) ON DELETE CASCADE,
+                source TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                PRIMARY KEY (edge_id, source, identifier)
+            );
+            CREATE INDEX IF NOT EXISTS edge_sources_doc ON edge_sources (source, identifier);
+            CREATE TABLE IF NOT EXISTS aliases (
+                key TEXT PRIMARY KEY,
+                node_id INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS aliases_node ON aliases (node_id);
+            CREATE TABLE IF NOT EXISTS node_bands (
+                band TEXT NOT NULL,
+                node_id INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS node_bands_band ON node_bands (band);
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                merged REAL NOT NULL,
+                PRIMARY KEY (source, identifier)
+            );
+        """)
+        self._conn.commit()
+
+    def _lookup_key(self, key):
+        row = self._conn.execute("SELECT node_id FROM aliases WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            row = self._conn.execute("SELECT id FROM nodes WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _node_id(self, name, description=None):
+        key = normalize_name(name)
+        node_id = self._lookup_key(key)
+
+        if node_id is None:
+            bands = self.lsh.band_keys(self.hasher.signature(shingles(key)))
+            marks = ",".join("?" * len(bands))
+            candidates = self._conn.execute(
+                f"SELECT DISTINCT n.id, n.key FROM node_bands b JOIN nodes n ON n.id = b.node_id "
+                f"WHERE b.band IN ({marks}) ORDER BY n.id",
+                bands,
+            ).fetchall()
+            for candidate_id, candidate_key in candidates:
+                if same_entity(key, candidate_key, self.threshold):
+                    node_id = candidate_id
+                    break
+            if node_id is None:
+                node_id = self._conn.execute(
+                    "INSERT INTO nodes (key, name, description) VALUES (?, ?, ?)", (key, name, description)
+                ).lastrowid
+                self._conn.executemany("INSERT INTO node_bands VALUES (?, ?)", ((band, node_id) for band in bands))
+            self._conn.execute("INSERT OR IGNORE INTO aliases VALUES (?, ?)", (key, node_id))
+
+        if description:
+            self._conn.execute("UPDATE nodes SET description = ? WHERE id = ? AND description IS NULL",
+                               (description, node_id))
+        return node_id
+
+    def _forget_document(self, source, identifier):
+        edge_ids = [row[0] for row in self._conn.execute(
+            "SELECT edge_id FROM edge_sources WHERE source = ? AND identifier = ?", (source, identifier))]
+        node_ids = [row[0] for row in self._conn.execute(
+            "SELECT node_id FROM node_sources WHERE source = ? AND identifier = ?", (source, identifier))]
+        if not edge_ids and not node_ids:
+            return
+        self._conn.execute("DELETE FROM node_sources WHERE source = ? AND identifier = ?", (source, identifier))
+        self._conn.execute("DELETE FROM edge_sources WHERE source = ? AND identifier = ?", (source, identifier))
+
+        # Drop whatever this document contributed that no other document mentions
+        self._conn.executemany(
+            "DELETE FROM edges WHERE id = ? AND NOT EXISTS (SELECT 1 FROM edge_sources WHERE edge_id = ?)",
+            ((edge_id, edge_id) for edge_id in edge_ids),
+        )
+        self._conn.executemany(
+            "DELETE FROM nodes WHERE id = ? AND NOT EXISTS (SELECT 1 FROM node_sources WHERE node_id = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM edges WHERE src = ? OR dst = ?)",
+            ((node_id,) * 4 for node_id in node_ids),
+        )
+
+    def merge_document(self, source, identifier, graph):
+        # Re-merging a document replaces its previous contribution, so it is safe to call repeatedly. It is
+        # one transaction: if anything fails the document's previous contribution is left as it was
+        with self._lock, self._conn:
+            self._forget_document(source, identifier)
+            for entity in graph.get("entities", []):
+                node_id = self._node_id(entity["name"], entity.get("description"))
+                self._conn.execute("INSERT OR IGNORE INTO node_sources VALUES (?, ?, ?)", (node_id, source, identifier))
+
+            for relationship in graph.get("relationships", []):
+                src = self._node_id(relationship["source"])
+                dst = self._node_id(relationship["target"])
+                for node_id in (src, dst):
+                    self._conn.execute("INSERT OR IGNORE INTO node_sources VALUES (?, ?, ?)",
+                                       (node_id, source, identifier))
+                self._conn.execute("INSERT OR IGNORE INTO edges (src, dst, description) VALUES (?, ?, ?)",
+                                   (src, dst, relationship.get("description", "")))
+                edge_id = self._conn.execute(
+                    "SELECT id FROM edges WHERE src = ? AND dst = ? AND description = ?",
+                    (src, dst, relationship.get("description", "")),
+                ).fetchone()[0]
+                self._conn.execute("INSERT OR IGNORE INTO edge_sources VALUES (?, ?, ?)", (edge_id, source, identifier))
+
+            self._conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", (source, identifier, time.time()))
+
+    def find_node(self, name):
+        return self._lookup_key(normalize_name(name))
+
+    def neighborhood(self, name, depth=1, limit=500):
+        # Breadth-first over both edge directions, one indexed query per level
+        start = self.find_node(name)
+        if start is None:
+            return {"nodes": [], "edges": []}
+
+        seen = {start}
+        frontier = [start]
+        for _ in range(depth):
+            if not frontier or len(seen) >= limit:
+                break
+            marks = ",".join("?" * len(frontier))
+            rows = self._conn.execute(
+                f"SELECT dst FROM edges WHERE src IN ({marks}) UNION SELECT src FROM edges WHERE dst IN ({marks})",
+                (*frontier, *frontier),
+            ).fetchall()
+            frontier = []
+            for (node_id,) in rows:
+                if node_id not in seen and len(seen) < limit:
+                    seen.add(node_id)
+                    frontier.append(node_id)
+        return self.subgraph(seen)
+
+    def subgraph(self, node_ids):
+        node_ids = list(node_ids)
+        if not node_ids:
+            return {"nodes": [], "edges": []}
+        # Temp table keeps this fast for large id sets without hitting the SQLite variable limit
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (id INTEGER PRIMARY KEY)")
+            self._conn.execute("DELETE FROM wanted")
+            self._conn.executemany("INSERT INTO wanted VALUES (?)", ((node_id,) for node_id in node_ids))
+            nodes = self._conn.execute("""
+                SELECT n.id, n.name, n.description, GROUP_CONCAT(s.source || ':' || s.identifier, '|')
+                FROM nodes n JOIN wanted w ON w.id = n.id
+                LEFT JOIN node_sources s ON s.node_id = n.id
+                GROUP BY n.id
+            """).fetchall()
+            edges = self._conn.execute("""
+                SELECT e.id, e.src, e.dst, e.description, GROUP_CONCAT(s.source || ':' || s.identifier, '|')
+                FROM edges e
+                JOIN wanted a ON a.id = e.src
+                JOIN wanted b ON b.id = e.dst
+                LEFT JOIN edge_sources s ON s.edge_id = e.id
+                GROUP BY e.id
+            """).fetchall()
+            self._conn.commit()
+        return {
+            "nodes": [
+                {"id": node_id, "name": name, "description": description,
+                 "documents": documents.split("|") if documents else []}
+                for node_id, name, description, documents in nodes
+            ],
+            "edges": [
+                {"id": edge_id, "source": src, "target": dst, "description": description,
+                 "documents": documents.split("|") if documents else []}
+                for edge_id, src, dst, description, documents in edges
+            ],
+        }
+
+    def documents_mentioning(self, name):
+        node_id = self.find_node(name)
+        if node_id is None:
+            return []
+        return self._conn.execute(
+            "SELECT source, identifier FROM node_sources WHERE node_id = ? ORDER BY source, identifier", (node_id,)
+        ).fetchall()
+
+    def edge_list(self):
+        # (names, [(i, j), ...]) of the whole graph with nodes renumbered 0..n-1, for graph_analytics.py
+        with self._lock:
+            node_ids = [row[0] for row in self._conn.execute("SELECT id FROM nodes ORDER BY id")]
+            names = [row[0] for row in self._conn.execute("SELECT name FROM nodes ORDER BY id")]
+            index = {node_id: i for i, node_id in enumerate(node_ids)}
+            pairs = [(index[src], index[dst]) for src, dst in self._conn.execute("SELECT src, dst FROM edges")]
+        return names, pairs
+
+    def stats(self):
+        counts = {}
+        for table in ("nodes", "edges", "documents"):
+            counts[table] = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return counts
+
+    def close(self):
+        self._conn.close()
+
+
+def merge_results(store, results_path):
+    # Pulls every finished extraction out of batch_extract.py's results database
+    conn = sqlite3.connect(results_path)
+    merged = 0
+    for source, identifier, graph in conn.execute(
+        "SELECT source, identifier, graph FROM results WHERE status = 'done' AND graph IS NOT NULL"
+    ):
+        store.merge_document(source, identifier, json.loads(graph))
+        merged += 1
+    conn.close()
+    return merged
+
+
+def store_graph_json(subgraph):
+    # subgraph()/neighborhood() output in the shape network_viewer.html reads
+    return {
+        "nodes": [
+            {"id": node["id"], "label": node["name"], **({"title": node["description"]} if node["description"] else {})}
+            for node in subgraph["nodes"]
+        ],
+        "edges": [
+            {"from": edge["source"], "to": edge["target"], **({"label": edge["description"]} if edge["description"] else {})}
+            for edge in subgraph["edges"]
+        ],
+    }
+
+
+def main():
+    from batch_extract import DEFAULT_RESULTS_PATH
+    from graph_json import graph_path, save_graph
+    from graph_lod import LOD_NODE_BUDGET, save_lod_graph
+    from graph_analytics import annotate_graph_json
+    from graph_layout import layout_graph_json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="merge all batch results into the graph")
+    merge.add_argument("--results", default=DEFAULT_RESULTS_PATH)
+    neighbors = commands.add_parser("neighbors", help="print the neighbourhood of an entity as JSON")
+    neighbors.add_argument("name")
+    neighbors.add_argument("--depth", type=int, default=1)
+    neighbors.add_argument("--limit", type=int, default=500)
+    neighbors.add_argument("--save", metavar="ID",
+                           help="save it for network_viewer.html under this id, with precomputed positions")
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    store = GraphStore(args.db)
+    if args.command == "merge":
+        print(f"Merged {merge_results(store, args.results)} documents", file=sys.stderr)
+        print(json.dumps(store.stats()))
+    elif args.command == "neighbors":
+        found = store.neighborhood(args.name, args.depth, args.limit)
+        if args.save:
+            payload = annotate_graph_json(store_graph_json(found))
+            if len(payload["nodes"]) > LOD_NODE_BUDGET:
+                save_lod_graph(args.save, payload)
+                print(graph_path(args.save), file=sys.stderr)
+            else:
+                print(save_graph(args.save, layout_graph_json(payload)), file=sys.stderr)
+        else:
+            print(json.dumps(found, indent=2))
+    else:
+        print(json.dumps(store.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# Streams a user-supplied corpus (xlsx, CSV or JSON lines) into the same memory-mapped cache the bundled
+# workbooks use, with any identifier and text columns.
+#
+#   python ingest.py data/uploads/cables.csv --id-column doc_id --text-column body
+#   python ingest.py data/uploads/articles.jsonl --id-column url --text-column content --batch-rows 5000
+#   python ingest.py --list                   # uploaded datasets and their columns, as JSON
+#
+# Rows are read and written BATCH_ROWS at a time (openpyxl read-only mode, pyarrow's streaming CSV reader,
+# one JSON line at a time), so memory stays flat whatever the file size. Rows with the same identifier are
+# joined in file order, like the bundled workbooks; that index goes to SQLite instead of a JSON file so it
+# is never held in memory either. Afterwards process_data.py, batch_extract.py etc. accept the file like
+# a bundled workbook.
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from corpus_store import UPLOAD_DIR, cache_paths, file_sha256, read_meta, source_signature, write_meta
+
+BATCH_ROWS = int(os.environ.get("INGEST_BATCH_ROWS", "2000"))
+PROGRESS_SECONDS = 5.0
+
+
+def cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Numeric identifiers read back as 15.0 from Excel, the user types 15
+        return str(int(value))
+    return str(value)
+
+
+def read_xlsx(path, batch_rows):
+    # Yields (columns, [row tuples]) from the first sheet
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [cell_text(name) or f"column_{i}" for i, name in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(tuple(cell_text(value) for value in row[:len(columns)]) + (None,) * (len(columns) - len(row)))
+            if len(batch) >= batch_rows:
+                yield columns, batch
+                batch = []
+        if batch:
+            yield columns, batch
+    finally:
+        # Read-only workbooks keep the file open until closed
+        workbook.close()
+
+
+def read_csv(path, batch_rows):
+    import csv
+
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), None)
+    if not header:
+        return
+    # Every column as text, so a column that looks numeric in the first block cannot fail later ones
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=1 << 20),
+        convert_options=pacsv.ConvertOptions(column_types={name: pa.string() for name in header}),
+    )
+    pending = []
+    for batch in reader:
+        pending.extend(zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns))))
+        while len(pending) >= batch_rows:
+            yield header, pending[:batch_rows]
+            pending = pending[batch_rows:]
+    if pending:
+        yield header, pending
+
+
+def read_jsonl(path, batch_rows):
+    # Columns are the keys of the first record; later records may leave some out
+    columns = None
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: {e}") from e
+            if columns is None:
+                columns = list(record)
+            batch.append(tuple(cell_text(record.get(name)) for name in columns))
+            if len(batch) >= batch_rows:
+                yield columns, batch
+                batch = []
+    if batch:
+        yield columns, batch
+
+
+READERS = {
+    ".xlsx": read_xlsx,
+    ".csv": read_csv,
+    ".jsonl": read_jsonl,
+    ".ndjson": read_jsonl,
+}
+
+
+def open_index(path):
+    # Rows are staged in a temporary table and joined per identifier once at the end (finish_index), so an
+    # identifier with many rows is not rewritten for every one of them
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE documents (identifier TEXT PRIMARY KEY, text TEXT NOT NULL)")
+    conn.execute("CREATE TEMP TABLE rows (identifier TEXT NOT NULL, text TEXT NOT NULL)")
+    return conn
+
+
+def add_to_index(conn, rows):
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO temp.rows (identifier, text) VALUES (?, ?)", rows)
+    conn.execute("COMMIT")
+
+
+def joined_documents(conn):
+    # (first row, identifier, text): texts of one identifier joined with a space in file order, empty ones skipped
+    identifier = None
+    ordered = conn.execute("SELECT rowid, identifier, text FROM temp.rows ORDER BY identifier, rowid")
+    for row, next_identifier, text in ordered:
+        if next_identifier != identifier:
+            if identifier is not None:
+                yield first, identifier, " ".join(texts)
+            identifier, first, texts = next_identifier, row, []
+        if text:
+            texts.append(text)
+    if identifier is not None:
+        yield first, identifier, " ".join(texts)
+
+
+def finish_index(conn):
+    # Documents keep the position of their first row, which is the order SQLiteIndex.items() reads them in
+    conn.execute("CREATE INDEX temp.rows_by_identifier ON rows (identifier)")
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO documents (rowid, identifier, text) VALUES (?, ?, ?)", joined_documents(conn))
+    conn.execute("COMMIT")
+    conn.execute("DROP TABLE temp.rows")
+    return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def ingest(source_path, id_column, text_column, batch_rows=BATCH_ROWS, progress=None):
+    import pyarrow as pa
+
+    extension = os.path.splitext(source_path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported file type {extension or source_path}, expected one of {sorted(READERS)}")
+    paths = cache_paths(source_path)
+    os.makedirs(paths["dir"], exist_ok=True)
+    table_tmp = paths["table"] + ".tmp"
+    index_tmp = paths["index_db"] + ".tmp"
+    if os.path.exists(index_tmp):
+        os.remove(index_tmp)
+
+    started = time.perf_counter()
+    last_report = started
+    rows = 0
+    writer = None
+    sink = None
+    index = open_index(index_tmp)
+    try:
+        for columns, batch in READERS[extension](source_path, batch_rows):
+            if writer is None:
+                missing = [name for name in (id_column, text_column) if name not in columns]
+                if missing:
+                    raise ValueError(f"Column(s) {', '.join(missing)} not found, the file has: {', '.join(columns)}")
+                id_at, text_at = columns.index(id_column), columns.index(text_column)
+                schema = pa.schema([(name, pa.string()) for name in columns])
+                sink = pa.OSFile(table_tmp, "wb")
+                writer = pa.ipc.new_file(sink, schema)
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(values, type=pa.string()) for values in zip(*batch)], schema=schema
+            ))
+            add_to_index(index, [(row[id_at], row[text_at] or "") for row in batch if row[id_at] is not None])
+            rows += len(batch)
+            if progress is not None and time.perf_counter() - last_report >= PROGRESS_SECONDS:
+                last_report = time.perf_counter()
+                progress(rows, last_report - started)
+        if writer is None:
+            raise ValueError(f"{source_path} has no rows")
+        documents = finish_index(index)
+    finally:
+        index.close()
+        if writer is not None:
+            writer.close()
+            sink.close()
+
+    os.replace(table_tmp, paths["table"])
+    os.replace(index_tmp, paths["index_db"])
+    seconds = time.perf_counter() - started
+    meta = source_signature(source_path)
+    meta.update({
+        "sha256": file_sha256(source_path),
+        "rows": rows,
+        "documents": documents,
+        "id_column": id_column,
+        "text_column": text_column,
+    })
+    write_meta(paths["meta"], meta)
+    return {"source": source_path, "rows": rows, "documents": documents, "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else 0.0}
+
+
+def list_datasets(folder=UPLOAD_DIR):
+    datasets = []
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        meta = read_meta(cache_paths(os.path.join(folder, name))["meta"])
+        if meta and meta.get("id_column"):
+            datasets.append({"name": name, "idColumn": meta["id_column"], "textColumn": meta["text_column"],
+                             "rows": meta.get("rows"), "documents": meta.get("documents")})
+    return datasets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", nargs="?", help="xlsx, csv or jsonl file")
+    parser.add_argument("--id-column", help="column naming the document each row belongs to")
+    parser.add_argument("--text-column", help="column with the text")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--list", action="store_true", help="print the ingested datasets in data/uploads as JSON")
+    args = parser.parse_args()
+
+    if args.list:
+        print(json.dumps(list_datasets()))
+        return
+    if not (args.source and args.id_column and args.text_column):
+        parser.error("source, --id-column and --text-column are required")
+
+    def progress(rows, seconds):
+        print(f"{rows} rows, {rows / seconds:.0f} rows/s", file=sys.stderr)
+
+    try:
+        stats = ingest(args.source, args.id_column, args.text_column, args.batch_rows, progress)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+# Analyze jobs in a local SQLite queue, shared by every process_data.py --serve worker.
+#
+#   python job_queue.py list                 # latest jobs and their status
+#   python job_queue.py stats
+#
+# submit() returns a job id straight away. A request identical to one that is still queued or running
+# joins that job instead of starting another model call. Each worker runs one job at a time, and no
+# more than JOB_CONCURRENCY jobs run at once across all workers, so the model server is never flooded.
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "jobs.sqlite")
+DEFAULT_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", os.environ.get("LLM_CONCURRENCY", "2")))
+KEEP_SECONDS = float(os.environ.get("JOB_KEEP_HOURS", "24")) * 3600
+ACTIVE = ("queued", "running")
+FLUSH_SECONDS = 0.2
+# A running job looks for a cancel request at most this often
+CANCEL_POLL_SECONDS = 0.5
+
+_cancel_check = contextvars.ContextVar("cancel_check", default=None)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@contextmanager
+def cancellable(check):
+    # check() raises JobCancelled once the job is cancelled; threads started with a copy of this
+    # context (the chunks of a document) see it too
+    token = _cancel_check.set(check)
+    try:
+        yield
+    finally:
+        _cancel_check.reset(token)
+
+
+def check_cancelled():
+    # Called between stages and for every streamed piece; does nothing outside a job
+    check = _cancel_check.get()
+    if check is not None:
+        check()
+
+
+def in_job():
+    return _cancel_check.get() is not None
+
+
+def job_key(params):
+    # Requests that would produce the same result coalesce; the request id is not part of it
+    fields = [params.get(name) for name in ("filePath", "userInput", "mode", "layout", "chunkChars")]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    def __init__(self, path=DEFAULT_PATH, concurrency=DEFAULT_CONCURRENCY):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        # Autocommit, transactions are opened explicitly with BEGIN IMMEDIATE where several
+        # processes could race (submitting and claiming)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                subscribers INTEGER NOT NULL DEFAULT 1,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                narrative TEXT NOT NULL DEFAULT '',
+                result TEXT,
+                error TEXT,
+                worker INTEGER,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (key) WHERE status IN ('queued', 'running');
+        """)
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = work()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def submit(self, params):
+        key = job_key(params)
+
+        def work():
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running')", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE jobs SET subscribers = subscribers + 1 WHERE id = ?", (row[0],))
+                return {"id": row[0], "coalesced": True}
+            # The job id doubles as the request id the graph JSON is saved under
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (id, key, params, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, key, json.dumps(params, ensure_ascii=False), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished < ?",
+                (time.time() - KEEP_SECONDS,),
+            )
+            return {"id": job_id, "coalesced": False}
+
+        submitted = self._transaction(work)
+        return {**self.status(submitted["id"]), "coalesced": submitted["coalesced"]}
+
+    def claim(self, worker=None):
+        # Oldest queued job, or None when nothing is queued or the concurrency limit is reached
+        worker = worker or os.getpid()
+
+        def work():
+            running = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            if running >= self.concurrency:
+                return None
+            row = self._conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started = ? WHERE id = ?",
+                (worker, time.time(), row[0]),
+            )
+            return {"id": row[0], "params": json.loads(row[1])}
+
+        return self._transaction(work)
+
+    def recover(self):
+        # Jobs left running by a worker that has since died go back to the queue
+        def work():
+            rows = self._conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall()
+            dead = [job_id for job_id, worker in rows if worker is None or not pid_alive(worker)]
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'queued', worker = NULL, narrative = '' WHERE id = ?",
+                ((job_id,) for job_id in dead),
+            )
+            return len(dead)
+
+        return self._transaction(work)
+
+    def append_narrative(self, job_id, text):
+        # Returns True once the job has been cancelled, so the runner can stop
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET narrative = narrative || ? WHERE id = ?", (text, job_id))
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def cancel_check(self, job_id):
+        # For cancellable(): one query per CANCEL_POLL_SECONDS however often it is called, from any thread
+        state = {"checked": 0.0, "cancelled": False}
+        lock = threading.Lock()
+
+        def check():
+            with lock:
+                if not state["cancelled"] and time.monotonic() - state["checked"] >= CANCEL_POLL_SECONDS:
+                    state["cancelled"] = self.cancel_requested(job_id)
+                    state["checked"] = time.monotonic()
+                cancelled = state["cancelled"]
+            if cancelled:
+                raise JobCancelled(job_id)
+
+        return check
+
+    def narrative_writer(self, job_id):
+        # on_token callback for extract(): buffers tokens and writes them every FLUSH_SECONDS
+        pending = []
+        last_flush = [time.monotonic()]
+
+        def flush():
+            text = "".join(pending)
+            pending.clear()
+            last_flush[0] = time.monotonic()
+            if self.append_narrative(job_id, text):
+                raise JobCancelled(job_id)
+
+        def on_token(text):
+            pending.append(text)
+            if time.monotonic() - last_flush[0] >= FLUSH_SECONDS:
+                flush()
+
+        on_token.flush = flush
+        return on_token
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ? AND status = 'running'",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 time.time(), job_id),
+            )
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "done", result=result)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "error", error=error)
+
+    def cancel(self, job_id):
+        # A coalesced job keeps running while anyone else is still waiting for it
+        def work():
+            row = self._conn.execute("SELECT status, subscribers FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[0] not in ACTIVE:
+                return
+            if row[1] > 1:
+                self._conn.execute("UPDATE jobs SET subscribers = subscribers - 1 WHERE id = ?", (job_id,))
+            elif row[0] == "queued":
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', subscribers = 0, finished = ? WHERE id = ?",
+                    (time.time(), job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1, subscribers = 0 WHERE id = ?", (job_id,)
+                )
+
+        self._transaction(work)
+        return self.status(job_id)
+
+    def cancelled(self, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+
+    def status(self, job_id, since=0):
+        # since: characters of the narrative the client already has, only the rest is returned
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, substr(narrative, ? + 1), length(narrative), result, error, created "
+                "FROM jobs WHERE id = ?",
+                (since, job_id),
+            ).fetchone()
+            if row is None:
+                return None
+            status, narrative, length, result, error, created = row
+            position = None
+            if status == "queued":
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (created,)
+                ).fetchone()[0]
+        return {
+            "id": job_id,
+            "status": status,
+            "queuePosition": position,
+            "narrative": narrative,
+            "narrativeLength": length,
+            "result": json.loads(result) if result else None,
+            "error": error,
+        }
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def latest(self, limit=20):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, subscribers, created, started, finished, error FROM jobs "
+                "ORDER BY created DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"id": job_id, "status": status, "subscribers": subscribers, "created": created,
+             "started": started, "finished": finished, "error": error}
+            for job_id, status, subscribers, created, started, finished, error in rows
+        ]
+
+    def close(self):
+        self._conn.close()
+
+
+def run_job(queue, handle, job):
+    on_token = queue.narrative_writer(job["id"])
+    try:
+        with cancellable(queue.cancel_check(job["id"])):
+            result = handle(job, on_token)
+    except JobCancelled:
+        queue.cancelled(job["id"])
+        return
+    except Exception as e:
+        queue.fail(job["id"], getattr(e, "line", None) or str(e))
+        return
+    try:
+        on_token.flush()
+    except JobCancelled:
+        # Too late to stop, the result is kept
+        pass
+    queue.complete(job["id"], result)
+
+
+def run_jobs(queue, handle, stop=None, idle_seconds=0.5, wake=None):
+    # Worker loop: claim a job, run handle(job, on_token), record the outcome. handle returns the result
+    # dict or raises; JobCancelled means the job was cancelled while running.
+    # wake (a threading.Event) cuts the idle wait short, e.g. right after a submit
+    stop = stop or threading.Event()
+    wake = wake or threading.Event()
+    recovered = False
+    while not stop.is_set():
+        try:
+            if not recovered:
+                queue.recover()
+                recovered = True
+            job = queue.claim()
+            if job is not None:
+                run_job(queue, handle, job)
+                continue
+        except Exception as e:
+            # Usually "database is locked" while other workers write; the loop must outlive it, or queued
+            # jobs would wait forever
+            print(f"Job runner: {type(e).__name__}: {e}", file=sys.stderr)
+        wake.wait(idle_seconds)
+        wake.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    latest = commands.add_parser("list", help="latest jobs, newest first")
+    latest.add_argument("--limit", type=int, default=20)
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+    if args.command == "list":
+        print(json.dumps(queue.latest(args.limit), indent=2))
+    else:
+        print(json.dumps(queue.counts()))
+
+
+if __name__ == "__main__":
+    main()
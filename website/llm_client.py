@@ -0,0 +1,266 @@
+import codecs
+import http.client
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+# Backend selection, all overridable from the environment
+DEFAULT_MODEL = os.environ.get("LLM_MODEL", "llama3.2")
+DEFAULT_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
+DEFAULT_BACKEND = os.environ.get("LLM_BACKEND", "http")
+DEFAULT_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "2"))
+DEFAULT_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "600"))
+# How long the model server should keep the model loaded between requests
+DEFAULT_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "30m")
+
+
+class LLMError(Exception):
+    pass
+
+
+def estimate_tokens(text):
+    # Rough llama-style estimate (~4 characters per token) for when the backend reports no counts
+    return (len(text) + 3) // 4
+
+
+# Errors raised when a pooled keep-alive connection was closed by the server in the meantime
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class OllamaHTTPBackend:
+    # Talks to a running `ollama serve` (or anything speaking its /api/generate protocol)
+    # over a small pool of keep-alive connections, so the model stays loaded between prompts
+
+    def __init__(self, base_url=DEFAULT_URL, model=DEFAULT_MODEL, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, keep_alive=DEFAULT_KEEP_ALIVE):
+        url = urlparse(base_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported model server URL: {base_url}")
+        self.base_url = base_url
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._scheme = url.scheme
+        self._host = url.hostname
+        self._port = url.port or (443 if url.scheme == "https" else 80)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def _connect(self):
+        if self._scheme == "https":
+            return http.client.HTTPSConnection(self._host, self._port, timeout=self.timeout)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _checkin(self, conn, reusable):
+        if reusable:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def _post(self, conn, path, payload):
+        body = json.dumps(payload).encode("utf-8")
+        conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+        return conn.getresponse()
+
+    def _open(self, path, payload):
+        # Returns (connection, response); retries once on a fresh connection if the pooled one went stale
+        conn = self._checkout()
+        try:
+            try:
+                response = self._post(conn, path, payload)
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                conn = self._connect()
+                response = self._post(conn, path, payload)
+        except (OSError, http.client.HTTPException) as e:
+            self._checkin(conn, False)
+            raise LLMError(f"Could not reach model server at {self.base_url}: {e}") from e
+
+        if response.status != 200:
+            detail = response.read().decode("utf-8", errors="replace")
+            self._checkin(conn, not response.will_close)
+            raise LLMError(f"Model server returned {response.status}: {detail}")
+        return conn, response
+
+    def complete(self, prompt, **options):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload["options"] = options
+
+        started = time.perf_counter()
+        conn, response = self._open("/api/generate", payload)
+        try:
+            data = json.loads(response.read().decode("utf-8"))
+        except (OSError, http.client.HTTPException, json.JSONDecodeError) as e:
+            self._checkin(conn, False)
+            raise LLMError(f"Invalid response from model server: {e}") from e
+        self._checkin(conn, not response.will_close)
+
+        return {
+            "text": data.get("response", ""),
+            "prompt_tokens": data.get("prompt_eval_count"),
+            "completion_tokens": data.get("eval_count"),
+            "seconds": time.perf_counter() - started,
+        }
+
+    def generate(self, prompt, **options):
+        return self.complete(prompt, **options)["text"]
+
+    def stream(self, prompt, **options):
+        # Yields {"text": piece} as the model produces them, then a final {"text": "", "done": True, ...counts}
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload["options"] = options
+
+        conn, response = self._open("/api/generate", payload)
+        reusable = False
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line.decode("utf-8"))
+                if "error" in data:
+                    raise LLMError(f"Model server error: {data['error']}")
+                if data.get("done"):
+                    response.read()
+                    reusable = not response.will_close
+                    yield {
+                        "text": data.get("response", ""),
+                        "done": True,
+                        "prompt_tokens": data.get("prompt_eval_count"),
+                        "completion_tokens": data.get("eval_count"),
+                    }
+                    return
+                yield {"text": data.get("response", "")}
+            raise LLMError("Model server closed the stream early")
+        except (OSError, http.client.HTTPException, json.JSONDecodeError) as e:
+            raise LLMError(f"Invalid streaming response from model server: {e}") from e
+        finally:
+            self._checkin(conn, reusable)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class SubprocessBackend:
+    # The original behaviour: one `ollama run` process per prompt
+
+    def __init__(self, model=DEFAULT_MODEL, concurrency=DEFAULT_CONCURRENCY):
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.command = ["ollama", "run", model]
+        self.env = os.environ.copy()
+        self.env['PYTHONIOENCODING'] = 'utf-8'
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def complete(self, prompt, **options):
+        started = time.perf_counter()
+        with self._slots:
+            result = subprocess.run(self.command, input=prompt, capture_output=True, text=True,
+                                    check=True, env=self.env)
+        return {
+            "text": result.stdout,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "seconds": time.perf_counter() - started,
+        }
+
+    def generate(self, prompt, **options):
+        return self.complete(prompt, **options)["text"]
+
+    def stream(self, prompt, **options):
+        with self._slots:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, env=self.env)
+            # Drain stderr on the side so a chatty progress bar cannot block the pipe
+            errors = []
+            drain = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+            drain.start()
+            try:
+                process.stdin.write(prompt.encode("utf-8"))
+                process.stdin.close()
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                pieces = []
+                for chunk in iter(lambda: process.stdout.read1(4096), b""):
+                    text = decoder.decode(chunk)
+                    if text:
+                        pieces.append(text)
+                        yield {"text": text}
+                returncode = process.wait()
+                drain.join()
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+        stderr = b"".join(errors).decode("utf-8", errors="replace")
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.command, "".join(pieces), stderr)
+        yield {"text": decoder.decode(b"", final=True), "done": True, "prompt_tokens": None, "completion_tokens": None}
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "http": OllamaHTTPBackend,
+    "subprocess": SubprocessBackend,
+}
+
+# One shared backend per process so every caller reuses the same connection pool
+_shared_backend = None
+_shared_lock = threading.Lock()
+
+
+def get_backend(name=None, **kwargs):
+    global _shared_backend
+    if name is not None or kwargs:
+        return create_backend(name, **kwargs)
+    with _shared_lock:
+        if _shared_backend is None:
+            _shared_backend = create_backend(DEFAULT_BACKEND)
+        return _shared_backend
+
+
+def create_backend(name=None, **kwargs):
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
@@ -0,0 +1,283 @@
+# Per-request stage timings and process-wide counters in Prometheus text format.
+#
+#   python metrics.py                # print the counters (what GET /api/metrics returns)
+#   python metrics.py --port 9464    # serve them on http://127.0.0.1:9464/metrics for a scraper
+#   python metrics.py --reset
+#
+# A request runs inside start_trace(); span(name) blocks and model calls (record_llm_call) are added
+# to that trace, which ends up as the "metrics" field of the response. record_trace() then adds it to
+# counters kept in SQLite, so every worker process of the API pool adds to the same numbers.
+import argparse
+import contextvars
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from llm_client import estimate_tokens
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "metrics.sqlite")
+BUCKETS = (0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, math.inf)
+
+# name -> (type, help), in the order they are printed
+FAMILIES = {
+    "analyze_requests_total": ("counter", "Analyze requests by outcome"),
+    "analyze_seconds": ("histogram", "End-to-end time of an analyze request"),
+    "analyze_stage_seconds": ("histogram", "Time spent in each stage of a request"),
+    "llm_calls_total": ("counter", "Model calls by prompt"),
+    "llm_call_seconds": ("histogram", "Time of a model call, from request to last token"),
+    "llm_prompt_chars_total": ("counter", "Characters sent to the model"),
+    "llm_response_chars_total": ("counter", "Characters received from the model"),
+    "llm_prompt_tokens_total": ("counter", "Prompt tokens as counted by the model server (estimated if missing)"),
+    "llm_completion_tokens_total": ("counter", "Completion tokens as counted by the model server (estimated if missing)"),
+    "dedup_removed_chars_total": ("counter", "Repeated characters dropped before prompting (dedup.py)"),
+    "dedup_removed_tokens_total": ("counter", "Estimated tokens dropped before prompting (dedup.py)"),
+}
+
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.calls = []
+        self.fields = {}
+        # Chunks of one document are extracted on several threads at once
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages.append({"name": name, "seconds": seconds})
+
+    def add_call(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def summary(self):
+        # Stages can nest (e.g. "parse json" runs inside "extract"), so they do not add up to the total
+        with self._lock:
+            return {
+                "totalSeconds": time.perf_counter() - self.started,
+                "stages": list(self.stages),
+                "llmCalls": list(self.calls),
+                "promptChars": sum(call["promptChars"] for call in self.calls),
+                "responseChars": sum(call["responseChars"] for call in self.calls),
+                "promptTokens": sum(call["promptTokens"] for call in self.calls),
+                "completionTokens": sum(call["completionTokens"] for call in self.calls),
+                **self.fields,
+            }
+
+
+@contextmanager
+def start_trace():
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def begin_trace():
+    # For scripts that are one request from start to finish, instead of a with start_trace() block
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    # Times the block into the current trace; does nothing outside start_trace()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current.get()
+        if trace is not None:
+            trace.add_stage(name, time.perf_counter() - started)
+
+
+def record_llm_call(call, prompt, completion, prompt_tokens=None, completion_tokens=None):
+    # completion: what backend.complete() returns; token counts default to the server's, or an estimate
+    trace = _current.get()
+    if trace is not None:
+        if prompt_tokens is None:
+            prompt_tokens = completion.get("prompt_tokens") or estimate_tokens(prompt)
+        if completion_tokens is None:
+            completion_tokens = completion.get("completion_tokens") or estimate_tokens(completion["text"])
+        trace.add_call({
+            "call": call,
+            "seconds": completion["seconds"],
+            "promptChars": len(prompt),
+            "responseChars": len(completion["text"]),
+            "promptTokens": prompt_tokens,
+            "completionTokens": completion_tokens,
+        })
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_text(labels):
+    return ",".join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+
+class MetricsStore:
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # One row per series; le is only set for histogram buckets (and sorts them numerically)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                le REAL NOT NULL DEFAULT -1,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels, le)
+            );
+        """)
+
+    def _add(self, rows, name, labels, value, le=-1):
+        rows.append((name, label_text(labels), le, value))
+
+    def _observe(self, rows, name, labels, seconds):
+        for le in BUCKETS:
+            self._add(rows, name + "_bucket", labels, 1 if seconds <= le else 0, le)
+        self._add(rows, name + "_sum", labels, seconds)
+        self._add(rows, name + "_count", labels, 1)
+
+    def record(self, summary, source, status):
+        rows = []
+        self._add(rows, "analyze_requests_total", {"source": source, "status": status}, 1)
+        self._observe(rows, "analyze_seconds", {"source": source}, summary["totalSeconds"])
+        for stage in summary["stages"]:
+            self._observe(rows, "analyze_stage_seconds", {"source": source, "stage": stage["name"]}, stage["seconds"])
+        for call in summary["llmCalls"]:
+            labels = {"source": source, "call": call["call"]}
+            self._add(rows, "llm_calls_total", labels, 1)
+            self._observe(rows, "llm_call_seconds", labels, call["seconds"])
+            self._add(rows, "llm_prompt_chars_total", labels, call["promptChars"])
+            self._add(rows, "llm_response_chars_total", labels, call["responseChars"])
+            self._add(rows, "llm_prompt_tokens_total", labels, call["promptTokens"])
+            self._add(rows, "llm_completion_tokens_total", labels, call["completionTokens"])
+        if "dedupCharsRemoved" in summary:
+            self._add(rows, "dedup_removed_chars_total", {"source": source}, summary["dedupCharsRemoved"])
+            self._add(rows, "dedup_removed_tokens_total", {"source": source}, summary["dedupTokensRemoved"])
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO samples (name, labels, le, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value",
+                    rows,
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def render(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT name, labels, le, value FROM samples ORDER BY name, labels, le").fetchall()
+        lines = []
+        for family, (kind, help_text) in FAMILIES.items():
+            names = (family + "_bucket", family + "_sum", family + "_count") if kind == "histogram" else (family,)
+            series = [row for name in names for row in rows if row[0] == name]
+            if not series:
+                continue
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, le, value in series:
+                if le != -1:
+                    bound = "+Inf" if math.isinf(le) else repr(le)
+                    labels = f'{labels},le="{bound}"' if labels else f'le="{bound}"'
+                lines.append(f"{name}{{{labels}}} {value:g}" if labels else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM samples")
+
+    def close(self):
+        self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricsStore()
+        return _store
+
+
+def record_trace(trace, source, status):
+    # Metrics must never fail the request they describe
+    try:
+        get_store().record(trace.summary(), source, status)
+    except Exception as e:
+        print(f"Could not record metrics: {e}", file=sys.stderr)
+
+
+def serve(port, store):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = store.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving metrics on http://127.0.0.1:{port}/metrics", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    parser.add_argument("--port", type=int, help="serve /metrics on this local port instead of printing once")
+    parser.add_argument("--reset", action="store_true", help="set every counter back to zero")
+    args = parser.parse_args()
+
+    store = MetricsStore(args.db)
+    if args.reset:
+        store.reset()
+    elif args.port:
+        serve(args.port, store)
+    else:
+        sys.stdout.write(store.render())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import hashlib
+import zlib
+from collections import defaultdict
+
+# (a * h + b) mod p with a, b < 2^32 and 32-bit h never overflows 64 bits
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text, size=3):
+    # Character n-grams, padded so short strings and word boundaries still count
+    text = f" {text} "
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def word_shingles(text, size=3):
+    # Word n-grams, for comparing sentences rather than names
+    words = text.split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    # numpy is imported here rather than at module level: shingles() and jaccard() are used on paths
+    # that never hash anything and should not pay for the import
+    def __init__(self, num_perm=64, seed=1):
+        import numpy as np
+
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, tokens):
+        import numpy as np
+
+        if not tokens:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # crc32 rather than hash() so signatures are stable between runs and can be stored
+        hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                             dtype=np.uint64, count=len(tokens))
+        permuted = (np.outer(hashes, self.a) + self.b) % np.uint64(MERSENNE_PRIME) & np.uint64(MAX_HASH)
+        return permuted.min(axis=0)
+
+
+class LSHIndex:
+    # Banded locality-sensitive hashing: items sharing any band of their signature become candidates,
+    # so each lookup touches a handful of buckets instead of every item
+
+    def __init__(self, num_perm=64, bands=16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = defaultdict(list)
+
+    def band_keys(self, signature):
+        return [
+            f"{band}:{hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(self.bands)
+        ]
+
+    def add(self, item, signature):
+        for key in self.band_keys(signature):
+            self.buckets[key].append(item)
+
+    def candidates(self, signature):
+        found = set()
+        for key in self.band_keys(signature):
+            found.update(self.buckets.get(key, ()))
+        return found
@@ -0,0 +1,311 @@
+import json
+import re
+
+# Key names the model has been seen using, most common first
+ENTITY_LIST_KEYS = ("entities", "nodes", "entity_list")
+RELATIONSHIP_LIST_KEYS = ("relationships", "relations", "edges", "links")
+NAME_KEYS = ("name", "entity", "label", "id", "title")
+SOURCE_KEYS = ("source", "from", "entity1", "entity_1", "source_entity", "subject", "head")
+TARGET_KEYS = ("target", "to", "entity2", "entity_2", "target_entity", "object", "tail")
+DESCRIPTION_KEYS = ("description", "relationship", "relation", "label", "type", "predicate")
+
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+LINE_COMMENT = re.compile(r"//[^\n]*")
+
+
+class JsonObjectScanner:
+    # Finds the first balanced {...} or [{...}, ...] in text fed to it piece by piece, ignoring brackets
+    # inside strings, so a streamed response can be cut off as soon as the whole top-level value is complete.
+    # A "[" only starts the value when an object or array follows it, so prose like "[1]" is skipped
+
+    def __init__(self):
+        self.buffer = []
+        self.started = False
+        self.opening = None
+        self.in_string = False
+        self.escaped = False
+        self.closers = []
+        self.complete = False
+
+    def feed(self, text):
+        # Returns the object text once it is balanced, None while it is still open
+        if self.complete:
+            return "".join(self.buffer)
+        for char in text:
+            if not self.started:
+                if self.opening is not None:
+                    if char.isspace():
+                        self.opening += char
+                        continue
+                    if char in "{[":
+                        # The array is the value: replay its opening bracket
+                        self.started = True
+                        self.buffer.append(self.opening)
+                        self.closers.append("]")
+                    self.opening = None
+                if not self.started:
+                    if char == "[":
+                        self.opening = char
+                        continue
+                    if char != "{":
+                        continue
+                    self.started = True
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.closers.append("}" if char == "{" else "]")
+            elif char in "}]":
+                if self.closers:
+                    self.closers.pop()
+                if not self.closers:
+                    self.complete = True
+                    return "".join(self.buffer)
+        return None
+
+    def partial(self):
+        # What has been seen so far, with any open string/brackets closed (for truncated output)
+        if not self.started:
+            return None
+        text = "".join(self.buffer)
+        if self.in_string:
+            text += '"'
+        text = text.rstrip().rstrip(",")
+        return text + "".join(reversed(self.closers))
+
+
+def find_json_object(text):
+    scanner = JsonObjectScanner()
+    found = scanner.feed(text)
+    if found is not None:
+        return found
+    return scanner.partial()
+
+
+def outside_strings(text, fix):
+    # Applies fix() to everything that is not inside a double-quoted string
+    parts = []
+    start = 0
+    index = 0
+    while index < len(text):
+        if text[index] == '"':
+            end = index + 1
+            while end < len(text) and text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            parts.append(fix(text[start:index]))
+            parts.append(text[index:end + 1])
+            start = index = end + 1
+        else:
+            index += 1
+    parts.append(fix(text[start:]))
+    return "".join(parts)
+
+
+def repair_segment(segment):
+    segment = LINE_COMMENT.sub("", segment)
+    segment = re.sub(r"\bTrue\b", "true", segment)
+    segment = re.sub(r"\bFalse\b", "false", segment)
+    return re.sub(r"\bNone\b", "null", segment)
+
+
+def repair(text):
+    # Fixes the defects llama models produce most: smart quotes, // comments, trailing commas
+    # and Python literals (string contents are left alone)
+    text = text.translate(SMART_QUOTES)
+    text = outside_strings(text, repair_segment)
+    return outside_strings(text, lambda segment: TRAILING_COMMA.sub(r"\1", segment))
+
+
+def single_to_double_quotes(text):
+    out = []
+    quote = None
+    escaped = False
+    for char in text:
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(char)
+            elif char == "\\":
+                escaped = True
+                out.append(char)
+            elif char == quote:
+                quote = None
+                out.append('"')
+            elif char == '"' and quote == "'":
+                out.append('\\"')
+            else:
+                out.append(char)
+        elif char in "\"'":
+            quote = char
+            out.append('"')
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def parse_model_json(output):
+    # Raises json.JSONDecodeError (like json.loads) if nothing usable can be recovered
+    candidate = find_json_object(output)
+    if candidate is None:
+        raise json.JSONDecodeError("No JSON object or array found in model output", output, 0)
+
+    attempts = (candidate, repair(candidate), single_to_double_quotes(repair(candidate)))
+    error = None
+    for attempt in attempts:
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError as e:
+            error = e
+    raise error
+
+
+def first_value(item, keys):
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def first_list(data, keys):
+    for key in keys:
+        value = data.get(key)
+        if isinstance(value, list):
+            return value
+    return []
+
+
+def is_entity_item(item):
+    if isinstance(item, str):
+        return True
+    return isinstance(item, dict) and first_value(item, NAME_KEYS) is not None and \
+        first_value(item, SOURCE_KEYS) is None and first_value(item, TARGET_KEYS) is None
+
+
+def normalize_graph(data):
+    # Always returns {"entities": [{"name", ...}], "relationships": [{"source", "target", "description"}]}
+    if isinstance(data, list):
+        if len(data) == 1 and isinstance(data[0], dict) and \
+                first_list(data[0], ENTITY_LIST_KEYS + RELATIONSHIP_LIST_KEYS):
+            # The whole graph wrapped in an array
+            data = data[0]
+        else:
+            # A bare list: names or entity objects are entities, everything else a relationship
+            entity_items = [item for item in data if is_entity_item(item)]
+            data = {"entities": entity_items, "relationships": [item for item in data if not is_entity_item(item)]}
+    if not isinstance(data, dict):
+        return {"entities": [], "relationships": []}
+
+    entities = []
+    seen = set()
+
+    def add_entity(name, extra=None):
+        if isinstance(name, dict):
+            name = first_value(name, NAME_KEYS) or ""
+        name = str(name).strip()
+        if not name or name in seen:
+            return name
+        seen.add(name)
+        entity = {"name": name}
+        if extra and extra.get("description"):
+            entity["description"] = extra["description"]
+        if extra and extra.get("type"):
+            entity["type"] = extra["type"]
+        entities.append(entity)
+        return name
+
+    for item in first_list(data, ENTITY_LIST_KEYS):
+        if isinstance(item, dict):
+            name = first_value(item, NAME_KEYS)
+            if name is not None:
+                add_entity(name, item)
+        elif isinstance(item, str):
+            add_entity(item)
+
+    relationships = []
+    for item in first_list(data, RELATIONSHIP_LIST_KEYS):
+        if isinstance(item, (list, tuple)) and len(item) >= 2:
+            values = [str(value) for value in item]
+            source, target = values[0], values[1]
+            description = values[2] if len(values) > 2 else ""
+        elif isinstance(item, dict):
+            source = first_value(item, SOURCE_KEYS)
+            target = first_value(item, TARGET_KEYS)
+            description = first_value(item, DESCRIPTION_KEYS)
+            if source is None or target is None:
+                # Unknown key names: fall back to position (first = source, second = target, third = description)
+                values = list(item.values())
+                if len(values) < 2:
+                    continue
+                source, target = values[0], values[1]
+                description = values[2] if len(values) > 2 else description
+        else:
+            continue
+
+        source = add_entity(source)
+        target = add_entity(target)
+        if not source or not target:
+            continue
+        relationships.append({"source": source, "target": target, "description": str(description or "")})
+
+    return {"entities": entities, "relationships": relationships}
+
+
+def parse_graph(output):
+    return normalize_graph(parse_model_json(output))
+
+
+# Model outputs seen in practice -> (entities, relationships) they must parse to; `python model_output.py`
+# checks them after a change to the parser
+SAMPLES = [
+    ('{"entities": [{"name": "A"}, {"name": "B"}], "relationships": [{"source": "A", "target": "B"}]}', 2, 1),
+    ('Sure! ```json\n{"nodes": ["A", "B"], "edges": [{"from": "A", "to": "B", "label": "pays"}],}\n``` Done.', 2, 1),
+    ("{'entities': ['A'], 'relationships': [['A', 'B', 'owns']], 'note': None}", 2, 1),
+    ('{"entities": [{"name": "A"}], "relationships": [{"source": "A", "target": "B", "description": "pa', 2, 1),
+    ('[{"name": "A", "type": "person"}, {"name": "B"}, {"source": "A", "target": "B"}]', 2, 1),
+    ('Here you go:\n[\n  {"entity1": "A", "entity2": "B", "relation": "met"}\n] and more [text]', 2, 1),
+    ('See [1] for details. [["A", "B", "owns"], ["B", "C", "pays"]]', 3, 2),
+    ('[{"entities": [{"name": "A"}, {"name": "B"}], "relationships": []}]', 2, 0),
+]
+
+
+def check_samples():
+    failures = []
+    for output, entities, relationships in SAMPLES:
+        # Fed in small pieces like a stream, then parsed like extraction.complete_graph's result
+        scanner = JsonObjectScanner()
+        streamed = ""
+        for start in range(0, len(output), 7):
+            streamed += output[start:start + 7]
+            if scanner.feed(output[start:start + 7]) is not None:
+                break
+        try:
+            graph = parse_graph(streamed)
+        except json.JSONDecodeError as e:
+            failures.append(f"{output[:60]!r}: {e}")
+            continue
+        found = (len(graph["entities"]), len(graph["relationships"]))
+        if found != (entities, relationships):
+            failures.append(f"{output[:60]!r}: {found}, expected {(entities, relationships)}")
+    return failures
+
+
+if __name__ == "__main__":
+    import sys
+
+    problems = check_samples()
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    print(f"{len(SAMPLES) - len(problems)}/{len(SAMPLES)} samples parse as expected")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,360 @@
+# Local NER pre-pass with the fine-tuned BERT token classifier from test_methods/nlp (PER/ORG labels).
+#
+# Long documents are tagged first and only the sentences naming at least two entities go to the LLM:
+# a relationship needs two ends, so the rest of the text mostly costs prompt tokens and latency.
+#
+#   python ner.py "Vendor 1 pays Vendor 2. The weather was fine."   # tag a text and show what is kept
+#   python ner.py --corpus --backend int8 --out data/cache/entities.jsonl  # tag every document, report tokens/sec
+#
+# Backends: "torch" (float32), "int8" (dynamic int8 quantization of the Linear layers, usually about 2x
+# faster on CPU for almost the same labels) and "onnx" (ONNX Runtime; the model is exported to
+# model.onnx next to the checkpoint the first time). torch, transformers and onnxruntime are optional
+# and only imported when the tagger is first used.
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from entity_resolution import normalize_name
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODEL_DIR = os.environ.get("NER_MODEL_DIR", os.path.join(REPO_DIR, "test_methods", "nlp", "results"))
+DEFAULT_TOKENIZER = os.environ.get("NER_TOKENIZER", "bert-base-uncased")
+DEFAULT_BATCH_SIZE = int(os.environ.get("NER_BATCH_SIZE", "16"))
+DEFAULT_BACKEND = os.environ.get("NER_BACKEND", "torch")
+BACKENDS = ("torch", "int8", "onnx")
+# Documents shorter than this go to the LLM untouched, filtering them saves too little
+DEFAULT_MIN_CHARS = int(os.environ.get("NER_MIN_CHARS", "2000"))
+MAX_LENGTH = 512
+STRIDE = 64
+
+# The label ids used in training.py, for checkpoints saved without id2label in their config
+TRAINING_LABELS = {0: "O", 1: "B-PER", 2: "I-PER", 3: "B-ORG", 4: "I-ORG"}
+
+SENTENCE_BREAK = re.compile(r"\n\s*\n|(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+class NERTagger:
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR, tokenizer_name=DEFAULT_TOKENIZER, batch_size=DEFAULT_BATCH_SIZE,
+                 backend=DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown NER backend {backend!r}, expected one of {BACKENDS}")
+        self.model_dir = model_dir
+        self.tokenizer_name = tokenizer_name
+        self.batch_size = batch_size
+        self.backend = backend
+        self.model = None
+        self.session = None
+        self.tokenizer = None
+        self.id2label = None
+        self.stats = {"documents": 0, "windows": 0, "tokens": 0, "padded_tokens": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.tokenizer is not None:
+                return
+            from transformers import BertForTokenClassification, BertTokenizerFast
+
+            model = BertForTokenClassification.from_pretrained(self.model_dir)
+            model.eval()
+            labels = {int(i): label for i, label in model.config.id2label.items()}
+            # Checkpoints saved without labels only have the generic LABEL_n names
+            if all(label.startswith("LABEL_") for label in labels.values()):
+                labels = TRAINING_LABELS
+            if self.backend == "int8":
+                import torch
+
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif self.backend == "onnx":
+                self.session = onnx_session(model, os.path.join(self.model_dir, "model.onnx"))
+            self.model = model
+            self.id2label = labels
+            self.tokenizer = BertTokenizerFast.from_pretrained(self.tokenizer_name)
+
+    def windows(self, texts):
+        # Every text as windows of at most MAX_LENGTH tokens, overlapping by STRIDE so an entity cut
+        # at one window edge is seen whole in the next
+        encoded = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=MAX_LENGTH,
+            stride=STRIDE,
+            return_overflowing_tokens=True,
+            return_offsets_mapping=True,
+        )
+        for i, doc in enumerate(encoded["overflow_to_sample_mapping"]):
+            yield {
+                "doc": doc,
+                "input_ids": encoded["input_ids"][i],
+                "attention_mask": encoded["attention_mask"][i],
+                "offsets": encoded["offset_mapping"][i],
+                "word_ids": encoded.word_ids(i),
+            }
+
+    def logits(self, features):
+        if self.session is not None:
+            return self.session.run(["logits"], {
+                "input_ids": features["input_ids"].astype("int64"),
+                "attention_mask": features["attention_mask"].astype("int64"),
+            })[0]
+        import torch
+
+        with torch.inference_mode():
+            return self.model(**features).logits.numpy()
+
+    def predict(self, windows):
+        # Length buckets: windows are batched in order of length, so each batch is padded (dynamically,
+        # to its own longest window) by a few tokens at most instead of up to MAX_LENGTH
+        tensors = "np" if self.session is not None else "pt"
+        ordered = sorted(windows, key=lambda window: len(window["input_ids"]))
+        started = time.perf_counter()
+        for start in range(0, len(ordered), self.batch_size):
+            batch = ordered[start:start + self.batch_size]
+            features = self.tokenizer.pad(
+                [{"input_ids": w["input_ids"], "attention_mask": w["attention_mask"]} for w in batch],
+                return_tensors=tensors,
+            )
+            with self._lock:
+                logits = self.logits(features)
+            for window, labels in zip(batch, logits.argmax(axis=-1).tolist()):
+                window["labels"] = labels[:len(window["input_ids"])]
+            self.stats["tokens"] += sum(len(window["input_ids"]) for window in batch)
+            self.stats["padded_tokens"] += features["input_ids"].shape[0] * features["input_ids"].shape[1]
+        self.stats["windows"] += len(windows)
+        self.stats["seconds"] += time.perf_counter() - started
+
+    def throughput(self):
+        seconds = self.stats["seconds"]
+        return {
+            **self.stats,
+            "backend": self.backend,
+            "tokens_per_second": self.stats["tokens"] / seconds if seconds else 0.0,
+            "padding_overhead": self.stats["padded_tokens"] / self.stats["tokens"] - 1 if self.stats["tokens"] else 0.0,
+        }
+
+    def tag(self, texts):
+        # [[{"text", "label", "start", "end"}, ...] per text], character offsets into that text
+        self.load()
+        windows = list(self.windows(texts))
+        self.predict(windows)
+        self.stats["documents"] += len(texts)
+
+        # One label per token, keyed by its character span. Where windows overlap, the window in
+        # which the token sits further from an edge (so has more context) wins
+        tokens = [{} for _ in texts]
+        for window in windows:
+            length = len(window["input_ids"])
+            previous_word = None
+            for position, ((start, end), word, label) in enumerate(
+                zip(window["offsets"], window["word_ids"], window["labels"])
+            ):
+                if word is None or start == end:
+                    continue
+                continuation = word == previous_word
+                previous_word = word
+                context = min(position, length - position)
+                known = tokens[window["doc"]].get(start)
+                if known is None or context > known[3]:
+                    tokens[window["doc"]][start] = (end, self.id2label.get(label, "O"), continuation, context)
+
+        return [entity_spans(text, found) for text, found in zip(texts, tokens)]
+
+
+def onnx_session(model, path):
+    import onnxruntime
+
+    if not os.path.exists(path):
+        export_onnx(model, path)
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def export_onnx(model, path):
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    sample = torch.ones((1, 8), dtype=torch.long)
+    tmp_path = path + ".tmp"
+    torch.onnx.export(
+        LogitsOnly(model), (sample, sample), tmp_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={name: {0: "batch", 1: "tokens"} for name in ("input_ids", "attention_mask", "logits")},
+        opset_version=14,
+    )
+    os.replace(tmp_path, path)
+
+
+def entity_spans(text, tokens):
+    # BIO decoding over the token labels; the pieces of one word follow the label of its first piece
+    spans = []
+    current = None
+    for start in sorted(tokens):
+        end, label, continuation, _ = tokens[start]
+        if continuation:
+            if current is not None:
+                current["end"] = end
+            continue
+        kind = label[2:] if label != "O" else None
+        if kind is None:
+            current = None
+            continue
+        if label.startswith("I-") and current is not None and current["label"] == kind:
+            current["end"] = end
+            continue
+        current = {"label": kind, "start": start, "end": end}
+        spans.append(current)
+    for span in spans:
+        span["text"] = text[span["start"]:span["end"]]
+    return spans
+
+
+def sentence_spans(text):
+    spans = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(text):
+        if text[start:match.start()].strip():
+            spans.append((start, match.start()))
+        start = match.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def select_sentences(text, entities, min_entities=2):
+    # Sentences naming at least min_entities different entities, in document order
+    kept = []
+    spans = sentence_spans(text)
+    entities = sorted(entities, key=lambda entity: entity["start"])
+    i = 0
+    for start, end in spans:
+        names = set()
+        while i < len(entities) and entities[i]["start"] < end:
+            if entities[i]["start"] >= start:
+                names.add(normalize_name(entities[i]["text"]))
+            i += 1
+        if len(names) >= min_entities:
+            kept.append(text[start:end].strip())
+    return kept, len(spans)
+
+
+shared = {}
+
+
+def get_tagger():
+    if "tagger" not in shared:
+        shared["tagger"] = NERTagger()
+    return shared["tagger"]
+
+
+def prefilter(text, tagger=None, min_entities=2, min_chars=DEFAULT_MIN_CHARS):
+    # Returns (text for the LLM, stats). Short texts, texts where nothing qualifies and any failure to
+    # load the model fall back to the full text, the pre-pass is only ever an optimization
+    stats = {"applied": False, "chars_before": len(text), "chars_after": len(text)}
+    if len(text) < min_chars:
+        return text, stats
+    try:
+        entities = (tagger or get_tagger()).tag([text])[0]
+    except (ImportError, OSError) as e:
+        print(f"NER pre-pass skipped: {e}", file=sys.stderr)
+        return text, stats
+    kept, total = select_sentences(text, entities, min_entities)
+    stats.update(sentences=total, sentences_kept=len(kept), entities=len(entities))
+    if not kept:
+        return text, stats
+    filtered = " ".join(kept)
+    stats.update(applied=True, chars_after=len(filtered))
+    return filtered, stats
+
+
+def describe(stats):
+    if not stats["applied"]:
+        return "NER pre-pass: full text kept"
+    return (f"NER pre-pass kept {stats['sentences_kept']}/{stats['sentences']} sentences "
+            f"({stats['chars_before']} -> {stats['chars_after']} chars)")
+
+
+def tag_corpus(tagger, sources, out=None, limit=None, batch_documents=64):
+    # Tags every document of the workbooks, batch_documents at a time; entities go to out as JSON lines
+    from corpus_store import load_index
+
+    def documents():
+        count = 0
+        for source in sources:
+            for identifier, text in load_index(source).items():
+                if limit is not None and count >= limit:
+                    return
+                if text:
+                    count += 1
+                    yield os.path.basename(source), identifier, text
+
+    pending = []
+
+    def flush():
+        found = tagger.tag([text for _, _, text in pending])
+        for (source, identifier, _), entities in zip(pending, found):
+            if out is not None:
+                out.write(json.dumps({"source": source, "identifier": identifier, "entities": entities},
+                                     ensure_ascii=False) + "\n")
+        pending.clear()
+        report = tagger.throughput()
+        print(f"{report['documents']} documents, {report['tokens']} tokens, "
+              f"{report['tokens_per_second']:.0f} tokens/s", file=sys.stderr)
+
+    for document in documents():
+        pending.append(document)
+        if len(pending) >= batch_documents:
+            flush()
+    if pending:
+        flush()
+    return tagger.throughput()
+
+
+def main():
+    from corpus_store import ID_COLUMNS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("text", nargs="*", help="text to tag (read from stdin if empty)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--corpus", action="store_true", help="tag every document in the bundled workbooks")
+    parser.add_argument("--limit", type=int, default=None, help="with --corpus, stop after N documents")
+    parser.add_argument("--out", help="with --corpus, write the entities of each document to this JSON lines file")
+    args = parser.parse_args()
+
+    tagger = NERTagger(batch_size=args.batch_size, backend=args.backend)
+    if args.corpus:
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        sources = [os.path.join(data_dir, name) for name in ID_COLUMNS]
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as out:
+                report = tag_corpus(tagger, sources, out, args.limit)
+        else:
+            report = tag_corpus(tagger, sources, limit=args.limit)
+        print(json.dumps(report, indent=2))
+        return
+
+    sample = " ".join(args.text) or sys.stdin.read()
+    found = tagger.tag([sample])[0]
+    for entity in found:
+        print(f"{entity['label']:<4} {entity['text']}")
+    filtered, stats = prefilter(sample, tagger, min_chars=0)
+    print(describe(stats), file=sys.stderr)
+    print(json.dumps(tagger.throughput()), file=sys.stderr)
+    print(filtered)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,38 @@
 import type { NextApiRequest, NextApiResponse } from 'next';
-import { spawn } from 'child_process';
+import { randomUUID } from 'crypto';
+import { promises as fs } from 'fs';
 import path from 'path';
+import { filePathFor, pythonWorkers, type AnalyzeParams } from '@/lib/pythonWorkers';
 
-const analyzeData = (req: NextApiRequest, res: NextApiResponse) => {
+// Same rule as graph_json.py, ids become file names
+const REQUEST_ID = /^[A-Za-z0-9_-]{1,64}$/;
+
+// GET /api/analyze?graph=<id> returns the graph JSON written by process_data.py for that request;
+// &view=<n> one of the cluster views of a level-of-detail graph (graph_lod.py)
+const sendGraph = async (graphId: string, view: string, res: NextApiResponse) => {
+  if (!REQUEST_ID.test(graphId) || (view && !/^\d{1,9}$/.test(view))) {
+    return res.status(400).json({ error: 'Invalid graph id' });
+  }
+  const file = view && view !== '0'
+    ? path.resolve('data', 'graphs', `${graphId}.views`, `${Number(view)}.json`)
+    : path.resolve('data', 'graphs', `${graphId}.json`);
   try {
-    const { selectedOption, userInput } = req.body;
+    const graph = await fs.readFile(file, 'utf-8');
+    res.setHeader('Content-Type', 'application/json; charset=utf-8');
+    res.setHeader('Cache-Control', 'private, max-age=3600');
+    return res.status(200).send(graph);
+  } catch {
+    return res.status(404).json({ error: 'Graph not found' });
+  }
+};
+
+const analyzeData = async (req: NextApiRequest, res: NextApiResponse) => {
+  if (req.method === 'GET') {
+    return sendGraph(String(req.query.graph ?? ''), String(req.query.view ?? ''), res);
+  }
+
+  try {
+    const { selectedOption, userInput, singlePass, stream, layout } = req.body;
 
     // Check if required fields are present
     if (!selectedOption || !userInput) {
@@ -12,45 +40,59 @@ const analyzeData = (req: NextApiRequest, res: NextApiResponse) => {
     }
 
     // Set the file paths based on the selected option and user input
-    let filePath = '';
-    if (selectedOption === 'wikileaks_parsed.xlsx') {
-      filePath = path.resolve('data', 'wikileaks_parsed.xlsx');
-    } else if (selectedOption === 'news_excerpts_parsed.xlsx') {
-      filePath = path.resolve('data', 'news_excerpts_parsed.xlsx');
-    } else if (selectedOption === 'test') {
-      // Handle text input directly
-      console.log(userInput); // You can process this directly in Python or elsewhere
-      filePath = ""
-      
-    } else {
+    const filePath = filePathFor(selectedOption);
+    if (filePath === null) {
       return res.status(400).json({ error: 'Invalid option selected' });
     }
 
-    // Run the Python script with the provided file and user input
-    const pythonCmd = process.platform === "win32" ? "python" : "python3";
-    const pythonProcess = spawn(pythonCmd, ['process_data.py', filePath, userInput]);
-
-    let result = '';
-    pythonProcess.stdout.on('data', (data) => {
-      result += data.toString();
-    });
-
-    pythonProcess.stderr.on('data', (data) => {
-      console.error('stderr: ' + data.toString());
-    });
-
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        return res.status(500).json({ error: 'Error executing Python script' });
-      }
+    // Handled by a warm `process_data.py --serve` worker instead of a new Python process per request.
+    // Each request gets its own graph file, so concurrent users never overwrite each other
+    const requestId = randomUUID();
+    const params: AnalyzeParams = {
+      filePath,
+      userInput,
+      requestId,
+      // single: one model call instead of two, the narrative is written from the extracted JSON
+      mode: singlePass ? 'single' : 'dual',
+      stream: Boolean(stream),
+    };
+    if (layout === 'server' || layout === 'browser') {
+      // Otherwise process_data.py picks server-side positions only for large graphs
+      params.layout = layout;
+    }
 
-      // Assuming the network HTML is saved in the public directory
-      const networkFilePath = '/entity_network.html'; // Correct path for static file in Next.js
+    if (stream) {
+      // Line-delimited JSON events: narrative tokens as they arrive, then the final result
+      res.writeHead(200, {
+        'Content-Type': 'application/x-ndjson; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+      });
+      const final = await pythonWorkers.analyze(params, (event) => {
+        res.write(JSON.stringify(event) + '\n');
+      });
+      res.write(JSON.stringify(final) + '\n');
+      res.end();
+      return;
+    }
 
-      res.status(200).json({
-        result,
-        networkFile: networkFilePath,
+    const final = await pythonWorkers.analyze(params);
+    if (final.workerFailed) {
+      return res.status(500).json({ error: final.error });
+    }
+    if (final.type === 'error') {
+      // Same text the one-shot script printed, the page matches on it
+      return res.status(200).json({
+        result: `${final.error}\n${JSON.stringify({ result: null, networkFile: null, error: final.message })}`,
       });
+    }
+    // The static viewer loads this request's graph JSON from GET /api/analyze?graph=<id>
+    res.status(200).json({
+      result: final.result,
+      networkFile: final.networkFile,
+      graphId: requestId,
+      // Stage timings, prompt/response sizes and token counts of this request (metrics.py)
+      metrics: final.metrics,
     });
   } catch (error) {
     console.error(error);
@@ -58,4 +100,11 @@ const analyzeData = (req: NextApiRequest, res: NextApiResponse) => {
   }
 };
 
+// Streamed responses can be larger than the default 4MB limit
+export const config = {
+  api: {
+    responseLimit: false,
+  },
+};
+
 export default analyzeData;
@@ -0,0 +1,78 @@
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { execFile } from 'child_process';
+import { createWriteStream, promises as fs } from 'fs';
+import path from 'path';
+import { pipeline } from 'stream/promises';
+import { DATASET_NAME } from '@/lib/pythonWorkers';
+
+// Uploaded corpora (ingest.py):
+//   GET  /api/datasets                                          [{name, idColumn, textColumn, rows, documents}]
+//   POST /api/datasets?name=cables.csv&idColumn=doc_id&textColumn=body   raw file as the request body
+// The upload is streamed to data/uploads/ and then streamed into the cache, so neither step holds the
+// whole file in memory. Analyze it with selectedOption 'upload:<name>'.
+const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
+const UPLOAD_DIR = path.resolve('data', 'uploads');
+// Ingesting a large corpus takes a while, but not forever
+const INGEST_TIMEOUT_MS = 30 * 60 * 1000;
+
+const runIngest = (args: string[]) =>
+  new Promise<{ stdout: string; error: string | null }>((resolve) => {
+    execFile(pythonCmd, ['ingest.py', ...args], { timeout: INGEST_TIMEOUT_MS, maxBuffer: 1 << 20 },
+      (error, stdout, stderr) => {
+        // ingest.py reports bad columns or files as "Error: ..." on stderr
+        const message = stderr.split('\n').find((line) => line.startsWith('Error: '));
+        resolve({ stdout, error: error ? (message ?? error.message) : null });
+      });
+  });
+
+const upload = async (req: NextApiRequest, res: NextApiResponse) => {
+  const name = String(req.query.name ?? '');
+  const idColumn = String(req.query.idColumn ?? '');
+  const textColumn = String(req.query.textColumn ?? '');
+  if (!DATASET_NAME.test(name) || !idColumn || !textColumn) {
+    return res.status(400).json({ error: 'name (.xlsx, .csv or .jsonl), idColumn and textColumn are required' });
+  }
+
+  await fs.mkdir(UPLOAD_DIR, { recursive: true });
+  const target = path.join(UPLOAD_DIR, name);
+  const partial = `${target}.part`;
+  try {
+    await pipeline(req, createWriteStream(partial));
+    await fs.rename(partial, target);
+  } catch (error) {
+    await fs.rm(partial, { force: true });
+    console.error(error);
+    return res.status(500).json({ error: 'Upload failed' });
+  }
+
+  const { stdout, error } = await runIngest([target, '--id-column', idColumn, '--text-column', textColumn]);
+  if (error) {
+    await fs.rm(target, { force: true });
+    return res.status(400).json({ error });
+  }
+  const stats = JSON.parse(stdout);
+  return res.status(201).json({ name, selectedOption: `upload:${name}`, ...stats, source: undefined });
+};
+
+const datasets = async (req: NextApiRequest, res: NextApiResponse) => {
+  if (req.method === 'POST') {
+    return upload(req, res);
+  }
+  if (req.method !== 'GET') {
+    return res.status(405).json({ error: 'Method Not Allowed' });
+  }
+  const { stdout, error } = await runIngest(['--list']);
+  if (error) {
+    return res.status(500).json({ error });
+  }
+  return res.status(200).json(JSON.parse(stdout));
+};
+
+// The body is the file itself, streamed to disk instead of parsed
+export const config = {
+  api: {
+    bodyParser: false,
+  },
+};
+
+export default datasets;
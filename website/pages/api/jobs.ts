@@ -0,0 +1,125 @@
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { filePathFor, pythonWorkers, type JobParams } from '@/lib/pythonWorkers';
+
+// Analyze requests as queued jobs (job_queue.py):
+//   POST   /api/jobs                 {selectedOption, userInput, singlePass?, layout?} -> {jobId, status, coalesced}
+//   GET    /api/jobs?id=<id>         current status, narrative so far and the result once done
+//   GET    /api/jobs?id=<id>&stream=1  line-delimited events until the job finishes (same events as /api/analyze)
+//   DELETE /api/jobs?id=<id>         cancel; a job other clients also wait for keeps running for them
+const POLL_MS = 250;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const submit = async (req: NextApiRequest, res: NextApiResponse) => {
+  const { selectedOption, userInput, singlePass, layout } = req.body;
+  if (!selectedOption || !userInput) {
+    return res.status(400).json({ error: 'Missing required fields' });
+  }
+  const filePath = filePathFor(selectedOption);
+  if (filePath === null) {
+    return res.status(400).json({ error: 'Invalid option selected' });
+  }
+
+  const params: JobParams = { filePath, userInput, mode: singlePass ? 'single' : 'dual' };
+  if (layout === 'server' || layout === 'browser') {
+    params.layout = layout;
+  }
+  const reply = await pythonWorkers.submitJob(params);
+  if (reply.type === 'error') {
+    return res.status(500).json({ error: reply.error });
+  }
+  const job = reply.job as { id: string; status: string; queuePosition: number | null; coalesced: boolean };
+  return res.status(202).json({
+    jobId: job.id,
+    status: job.status,
+    queuePosition: job.queuePosition,
+    coalesced: job.coalesced,
+  });
+};
+
+const streamJob = async (jobId: string, req: NextApiRequest, res: NextApiResponse) => {
+  res.writeHead(200, {
+    'Content-Type': 'application/x-ndjson; charset=utf-8',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+  });
+  let closed = false;
+  req.on('close', () => {
+    closed = true;
+  });
+
+  const send = (event: object) => res.write(JSON.stringify(event) + '\n');
+  let since = 0;
+  let lastStatus = '';
+  while (!closed) {
+    const reply = await pythonWorkers.jobStatus(jobId, since);
+    if (reply.type === 'error') {
+      send({ type: 'error', error: reply.error });
+      break;
+    }
+    const job = reply.job as {
+      status: string;
+      queuePosition: number | null;
+      narrative: string;
+      narrativeLength: number;
+      result: Record<string, unknown> | null;
+      error: string | null;
+    };
+    if (job.status !== lastStatus) {
+      lastStatus = job.status;
+      send({ type: 'status', status: job.status, queuePosition: job.queuePosition });
+    }
+    if (job.narrative) {
+      send({ type: 'token', text: job.narrative });
+      since = job.narrativeLength;
+    }
+    if (job.status === 'done') {
+      send({ type: 'result', ...job.result });
+      break;
+    }
+    if (job.status === 'error') {
+      send({ type: 'error', error: job.error });
+      break;
+    }
+    if (job.status === 'cancelled') {
+      break;
+    }
+    await sleep(POLL_MS);
+  }
+  res.end();
+};
+
+const jobs = async (req: NextApiRequest, res: NextApiResponse) => {
+  try {
+    if (req.method === 'POST') {
+      return await submit(req, res);
+    }
+
+    const jobId = String(req.query.id ?? '');
+    if (!jobId) {
+      return res.status(400).json({ error: 'Missing job id' });
+    }
+    if (req.method === 'GET' && req.query.stream) {
+      return await streamJob(jobId, req, res);
+    }
+    if (req.method === 'GET' || req.method === 'DELETE') {
+      const reply = req.method === 'GET' ? await pythonWorkers.jobStatus(jobId) : await pythonWorkers.cancelJob(jobId);
+      if (reply.type === 'error') {
+        return res.status(reply.error === 'Job not found' ? 404 : 500).json({ error: reply.error });
+      }
+      return res.status(200).json(reply.job);
+    }
+    return res.status(405).json({ error: 'Method Not Allowed' });
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({ error: 'An error occurred while processing the request.' });
+  }
+};
+
+export const config = {
+  api: {
+    responseLimit: false,
+  },
+};
+
+export default jobs;
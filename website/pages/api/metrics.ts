@@ -0,0 +1,26 @@
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { pythonWorkers } from '@/lib/pythonWorkers';
+
+// GET /api/metrics: stage timings, model calls and token counts of every analyze request, in Prometheus
+// text format. The counters live in data/cache/metrics.sqlite, shared by all the Python workers; a warm
+// worker of the pool renders them, so a scrape does not start a Python process.
+const metrics = async (req: NextApiRequest, res: NextApiResponse) => {
+  if (req.method !== 'GET') {
+    return res.status(405).json({ error: 'Method Not Allowed' });
+  }
+  try {
+    const reply = await pythonWorkers.metrics();
+    if (reply.type === 'error') {
+      console.error('metrics: ' + (reply.message || reply.error));
+      return res.status(500).json({ error: 'Could not read metrics' });
+    }
+    res.setHeader('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+    res.setHeader('Cache-Control', 'no-store');
+    return res.status(200).send(reply.text as string);
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({ error: 'Could not read metrics' });
+  }
+};
+
+export default metrics;
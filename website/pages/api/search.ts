@@ -0,0 +1,39 @@
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { pythonWorkers } from '@/lib/pythonWorkers';
+
+// Picks documents by content instead of by identifier (search_index.py):
+//   GET /api/search?q=arms+shipment&limit=10   [{selectedOption, identifier, score, snippet}]
+// selectedOption and identifier are what /api/analyze takes as selectedOption and userInput.
+const MAX_LIMIT = 50;
+
+type SearchResult = { source: string; identifier: string; uploaded: boolean; score: number; snippet: string };
+
+const search = async (req: NextApiRequest, res: NextApiResponse) => {
+  if (req.method !== 'GET') {
+    return res.status(405).json({ error: 'Method Not Allowed' });
+  }
+  const query = String(req.query.q ?? '').trim();
+  if (!query) {
+    return res.status(200).json([]);
+  }
+  const limit = Math.min(MAX_LIMIT, Math.max(1, Number(req.query.limit) || 10));
+
+  try {
+    const reply = await pythonWorkers.search(query, limit);
+    if (reply.type === 'error') {
+      return res.status(500).json({ error: reply.error });
+    }
+    const results = (reply.results as SearchResult[]).map((result) => ({
+      selectedOption: result.uploaded ? `upload:${result.source}` : result.source,
+      identifier: result.identifier,
+      score: result.score,
+      snippet: result.snippet,
+    }));
+    return res.status(200).json(results);
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({ error: 'An error occurred while processing the request.' });
+  }
+};
+
+export default search;
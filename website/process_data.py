@@ -1,229 +1,522 @@
-import pandas as pd
+import time
+
+# Startup profile (--profile-startup): (phase, seconds) in the order they ran
+STARTED = time.perf_counter()
+timings = []
+
+import argparse
 import subprocess
 import json
-from pyvis.network import Network
-import openpyxl
-import sys 
-from contextlib import redirect_stdout
+import sys
+import threading
+from contextlib import contextmanager, redirect_stdout
 import os
+# Only what every request needs is imported here. corpus_store (pandas/pyarrow), graph_store and
+# graph_layout (numpy) and pyvis are imported on the paths that use them, so free text starts fast
+from llm_client import LLMError, get_backend
+from extraction_cache import ExtractionCache
+from extraction import MODES, extract
+from chunking import DEFAULT_CHUNK_CHARS
+from graph_json import check_request_id, new_request_id, save_graph, to_graph_json, use_server_layout
+from job_queue import JobCancelled, check_cancelled
+from metrics import current_trace, get_store, record_trace, start_trace
 
-env = os.environ.copy()
-env['PYTHONIOENCODING'] = 'utf-8'
+timings.append(("import core modules", time.perf_counter() - STARTED))
 
-# Step 1: Read Excel File
-file_path = sys.argv[1]
-user_input = sys.argv[2]
-
-#initialise response
-response = {
-    "result": None,
-    "networkFile": None,
-    "error": None
-}
-
-
-#text_data = data['Text']
-
-if "wikileaks_parsed.xlsx" in file_path:
-  data = pd.read_excel(file_path)
-  filtered_data = data[data['PDF Path'] == user_input]
-  combined_data = " ".join(filtered_data['Text'].dropna())
-elif "news_excerpts_parsed.xlsx" in file_path:
-    data = pd.read_excel(file_path)
-    filtered_data = data[data['Link'] == user_input]
-    combined_data = " ".join(filtered_data['Text'].dropna())
-else:
-    combined_data= user_input
-
-if combined_data=="":
-  print("Error: Selected data not found")
-  response = {
+# One static viewer page for every request; it loads the graph JSON for ?id= from the analyze API
+VIEWER_URL = '/network_viewer.html'
+LAYOUTS = ("auto", "server", "browser")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Opened once per process, so a --serve worker keeps them warm between requests
+shared = {}
+
+
+@contextmanager
+def phase(name):
+    # Inside a request the time goes to its metrics trace, before the first one to the startup profile.
+    # Every stage starts by checking whether its job was cancelled (no-op outside a job)
+    check_cancelled()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = current_trace()
+        if trace is not None:
+            trace.add_stage(name, time.perf_counter() - start)
+        else:
+            timings.append((name, time.perf_counter() - start))
+
+
+def report_timings(response=None):
+    # response: a finished request, whose stages are listed after the start-up ones
+    stages = timings + [(stage["name"], stage["seconds"]) for stage in (response or {}).get("metrics", {}).get("stages", [])]
+    width = max(len(name) for name, _ in stages)
+    print("Startup profile (seconds):", file=sys.stderr)
+    for name, seconds in stages:
+        print(f"  {name:<{width}}  {seconds:8.3f}", file=sys.stderr)
+    print(f"  {'total':<{width}}  {time.perf_counter() - STARTED:8.3f}", file=sys.stderr)
+
+
+class AnalysisError(Exception):
+    # line is what gets printed for the frontend to match on, message goes into the JSON "error" field
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.message = message
+        self.line = line or message
+
+
+def error_response(message):
+    return {
         "result": None,
         "networkFile": None,
-        "error": "Selected data not found"
+        "error": message
     }
-  print(json.dumps(response))
-  sys.exit()  # Exit the program if data is invalid
-
-
-# Step 2: Use Ollama to Extract Entities and Relationships
-command = ["ollama", "run", "llama3.2"]
-prompt = f"""
-Please analyze the following text and summarize the involved entities and the relationships between them in a clear, narrative form. For each entity, provide a brief description of what it is. Then, summarize how the entities are related to each other in terms of their interactions or associations.
-
-Output should be structured in the following way:
-
-Here are the involved entities:
-1. Entity Name (Description of what the entity is, role, or type of entity)
-2. Entity Name (Description of what the entity is, role, or type of entity)
-...
-
-Relationships between entities:
-* Entity 1 and Entity 2 are [description of the relationship].
-* Entity 1 and Entity 3 are [description of the relationship].
-...
-
-The text to analyze is:
-{combined_data}
-"""
-
-prompt_2 = f"""
-Please summarize all the relationships between the entities in the following text into a JSON format. 
-For each relationship, include:
-- 'source' (the first entity)
-- 'target' (the related entity)
-- 'description' 'relationship' (a **concise** but **detailed** description)
-
-Provide **only** the JSON output with no additional text, and ensure that the relationships and entities are correctly structured as shown in the example. Do not include any other explanation or output.
-Example structure (do not copy it directly):
-{{
-  "entities": [
-    {{
-      "name": "Entity 1"
-    }},
-    {{
-      "name": "Entity 2"
-    }},
-    {{
-      "name": "Entity 3"
-    }}
-  ], 
-  "relationships": [
-    {{
-      "source": "Entity 1", 
-      "target": "Entity 2", 
-      "description": "relationship description"
-    }},
-    {{
-      "source": "Entity 2", 
-      "target": "Entity 3", 
-      "description": "another relationship description"
-    }}
-  ]
-}}
-{combined_data}
-"""
-
-try:
-    # Run the first subprocess for entity extraction
-    result = subprocess.run(command, input=prompt, capture_output=True, text=True, check=True, env=env)
-    output = result.stdout
-    print(output)
-
-    # Run the second subprocess for JSON output with relationships
-    result_2 = subprocess.run(command, input=prompt_2, capture_output=True, text=True, check=True, env=env)
-    output_2 = result_2.stdout
-    output_2 = output_2.strip()
-    output_2 = output_2.strip("`")
-    output_2 = output_2.strip(",")
-    #print(output_2)
-   
-    
-    # Convert the JSON output to a Python dictionary
-    output_2_dict = json.loads(output_2)
-
-    # Step 3: Parse and Create Network Graph from Relationships
-    if isinstance(output_2_dict, dict):
-        entities = output_2_dict.get('entities', [])
-        relationships = output_2_dict.get('relationships', [])
-
-        #print(f"Entities: {entities}")
-        #print(f"Relationships: {relationships}")
-
-        # Initialize a Directed Graph with better spacing
-        net = Network(notebook=True, height="750px", width="100%", directed=True, cdn_resources='in_line')
-        
-        net.barnes_hut()
-        net.toggle_physics(True)
-
-        # Add nodes for entities
-        entity_names = set(entity['name'] for entity in entities)  # Track existing nodes
-        for entity in entities:
-            net.add_node(entity['name'])
-        if relationships:
-          first_relationship = relationships[0]  # Check the first relationship to get key names dynamically
-          keys = list(first_relationship.keys())
-
-          # Assign the first key as source_key, second key as target_key, and third key as description_key
-          if len(keys) >= 3:
-              source_key = keys[0]  # First key is source
-              target_key = keys[1]  # Second key is target
-              description = keys[2]  # Third key is description
-          else:
-              # If there are less than 3 keys, print an error message
-              print("Error: Expected at least 3 keys in the relationship, found fewer.")
-              sys.exit()  # Exit the program if the structure is incorrect
-
-        # Add edges for relationships
-        for relationship in relationships:
-            from_node = relationship[source_key]
-            to_node = relationship[target_key]
-
-            # Add missing nodes dynamically
-            if from_node not in entity_names:
-                net.add_node(from_node)
-                entity_names.add(from_node)
-            if to_node not in entity_names:
-                net.add_node(to_node)
-                entity_names.add(to_node)
-
-            # Add the edge
-            net.add_edge(from_node, to_node, title=relationship[description], label=relationship[description])
-
-        # Show the network
-        # Save the generated HTML in the public directory
-        try:
-          with open(os.devnull, 'w') as fnull:
+
+
+def describe_error(e):
+    if isinstance(e, subprocess.CalledProcessError):
+        return f"Error in subprocess: {e.stderr}"
+    if isinstance(e, LLMError):
+        return f"Model server error: {e}"
+    if isinstance(e, FileNotFoundError):
+        return f"File not found: {e}"
+    if isinstance(e, ModuleNotFoundError):
+        return f"Module not found: {e}"
+    if isinstance(e, json.JSONDecodeError):
+        return f"JSON Decode Error: {e}"
+    return f"An unexpected error occurred: {e}"
+
+
+def is_corpus(file_path):
+    if not file_path:
+        return False
+    with phase("import corpus_store"):
+        from corpus_store import ID_COLUMNS, ingested_columns
+    return os.path.basename(file_path) in ID_COLUMNS or ingested_columns(file_path) is not None
+
+
+# Step 1: Read Excel File
+def resolve_text(file_path, user_input):
+    # Documents are read from the memory-mapped cache built by corpus_store.py, or by ingest.py for
+    # uploaded datasets; without a file the input is the text itself
+    if is_corpus(file_path):
+        from corpus_store import lookup_text
+        return lookup_text(file_path, user_input)
+    return user_input
+
+
+# Standalone HTML export (--html), the website itself uses the JSON graph and network_viewer.html
+def build_network(output_2_dict, network_file, payload=None):
+    from pyvis.network import Network
+
+    entities = output_2_dict.get('entities', [])
+    relationships = output_2_dict.get('relationships', [])
+
+    # Initialize a Directed Graph with better spacing
+    net = Network(notebook=True, height="750px", width="100%", directed=True, cdn_resources='in_line')
+
+    net.barnes_hut()
+    net.toggle_physics(True)
+
+    # Size and colour from graph_analytics.py when the JSON graph has them
+    styles = {}
+    for node in (payload or {}).get('nodes', []):
+        if 'value' in node:
+            styles[node['label']] = {'value': node['value'], 'color': node['color']}
+
+    # Add nodes for entities
+    entity_names = set(entity['name'] for entity in entities)  # Track existing nodes
+    for entity in entities:
+        net.add_node(entity['name'], **styles.get(entity['name'], {}))
+
+    # Add edges for relationships
+    for relationship in relationships:
+        # Relationships are normalized to source/target/description by model_output.py
+        from_node = relationship['source']
+        to_node = relationship['target']
+
+        # Add missing nodes dynamically
+        if from_node not in entity_names:
+            net.add_node(from_node, **styles.get(from_node, {}))
+            entity_names.add(from_node)
+        if to_node not in entity_names:
+            net.add_node(to_node, **styles.get(to_node, {}))
+            entity_names.add(to_node)
+
+        # Add the edge
+        net.add_edge(from_node, to_node, title=relationship['description'], label=relationship['description'])
+
+    try:
+        with open(os.devnull, 'w') as fnull:
             with redirect_stdout(fnull):
-                net.show('public/entity_network.html')
-          #net.show('public/entity_network.html')
-        except Exception as e:
-            response = {
-        "result": None,
-        "networkFile": None,
-        "error": str(e)  # Send error message
-    }
-        
-        sys.exit()
+                net.show(network_file)
+    except Exception as e:
+        raise AnalysisError(str(e))
 
-except subprocess.CalledProcessError as e:
-    print("Error in subprocess:", e.stderr)
-    response = {  # Initialize response here for subprocess errors
-        "result": None,
-        "networkFile": None,
-        "error": f"Error in subprocess: {e.stderr}"
-    }
-    print(json.dumps(response))
 
-except FileNotFoundError as e:
-    print(f"File not found: {e}")
-    response = {  # Initialize response here for file not found errors
-        "result": None,
-        "networkFile": None,
-        "error": f"File not found: {e}"
-    }
-    print(json.dumps(response))
-except ModuleNotFoundError as e:
-    print(f"Module not found: {e}")
-    response = {  # Initialize response here for module not found errors
-        "result": None,
-        "networkFile": None,
-        "error": f"Module not found: {e}"
-    }
-    print(json.dumps(response))
-except json.JSONDecodeError as e:
-    print(f"JSON Decode Error: {e}")
-    response = {  # Initialize response here for JSON decode errors
-        "result": None,
-        "networkFile": None,
-        "error": f"JSON Decode Error: {e}"
-    }
-    print(json.dumps(response))
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
-    response = {  # Initialize response here for unexpected errors
-        "result": None,
-        "networkFile": None,
-        "error": f"An unexpected error occurred: {e}"
+def shared_cache():
+    if "cache" not in shared:
+        with phase("open extraction cache"):
+            shared["cache"] = ExtractionCache()
+    return shared["cache"]
+
+
+def shared_graph_store():
+    if "graph" not in shared:
+        with phase("open graph store"):
+            from graph_store import GraphStore
+            shared["graph"] = GraphStore()
+    return shared["graph"]
+
+
+def shared_search_index():
+    if "search" not in shared:
+        with phase("open search index"):
+            from search_index import SearchIndex
+            shared["search"] = SearchIndex()
+    return shared["search"]
+
+
+def analyze(file_path, user_input, mode="dual", on_token=None, chunk_chars=DEFAULT_CHUNK_CHARS,
+            request_id=None, html_file=None, layout="auto", ner_filter=False, dedup=True):
+    # Stage timings, prompt/response sizes and token counts of this request come back as "metrics"
+    # and are added to the counters GET /api/metrics serves (metrics.py)
+    with start_trace() as trace:
+        trace.set(mode=mode)
+        status = "error"
+        try:
+            response = analyze_traced(file_path, user_input, mode, on_token, chunk_chars, request_id, html_file,
+                                      layout, ner_filter, dedup, trace)
+            status = "ok"
+        except JobCancelled:
+            status = "cancelled"
+            raise
+        finally:
+            record_trace(trace, "process_data", status)
+    response["metrics"] = trace.summary()
+    return response
+
+
+def analyze_traced(file_path, user_input, mode, on_token, chunk_chars, request_id, html_file, layout, ner_filter,
+                   dedup, trace):
+    try:
+        request_id = check_request_id(request_id) if request_id else new_request_id()
+    except ValueError as e:
+        raise AnalysisError(str(e))
+    with phase("read text"):
+        combined_data = resolve_text(file_path, user_input)
+    if combined_data == "":
+        raise AnalysisError("Selected data not found", "Error: Selected data not found")
+    trace.set(documentChars=len(combined_data))
+    if dedup:
+        # Boilerplate headings and repeated sentences would be paid for in both prompts
+        with phase("dedup"):
+            from dedup import clean_document, describe as describe_dedup
+            combined_data, dedup_stats = clean_document(combined_data, file_path if is_corpus(file_path) else None)
+        trace.set(dedupCharsRemoved=dedup_stats["chars_removed"], dedupTokensRemoved=dedup_stats["tokens_removed"])
+        print(describe_dedup(dedup_stats), file=sys.stderr)
+    if ner_filter:
+        # Long documents: only sentences naming two or more entities are sent to the model
+        with phase("ner prefilter"):
+            from ner import describe, prefilter
+            combined_data, ner_stats = prefilter(combined_data)
+        print(describe(ner_stats), file=sys.stderr)
+
+    # Step 2: Use Ollama to Extract Entities and Relationships
+    # (LLM_BACKEND=subprocess falls back to spawning `ollama run` per prompt)
+    backend = get_backend()
+
+    # Results are cached by (model, prompt version, mode, text), so repeated documents skip the model entirely
+    cache = shared_cache()
+
+    try:
+        with phase("extract"):
+            extraction = extract(combined_data, mode=mode, backend=backend, cache=cache, on_token=on_token,
+                                 chunk_chars=chunk_chars)
+        output = extraction["narrative"]
+        output_2_dict = extraction["graph"]
+        trace.set(cached=extraction["cached"], chunks=extraction["usage"].get("chunks", 1))
+
+        # Step 3: Save the graph as JSON under this request's id
+        network_file = None
+        if isinstance(output_2_dict, dict):
+            if file_path:
+                # Keep every analysed document in the cross-document graph, with provenance
+                graph_store = shared_graph_store()
+                with phase("merge into graph store"):
+                    graph_store.merge_document(os.path.basename(file_path), user_input, output_2_dict)
+            payload = to_graph_json(output_2_dict)
+            trace.set(nodes=len(payload["nodes"]), edges=len(payload["edges"]))
+            with phase("graph analytics"):
+                # Node size from PageRank, colour from community
+                from graph_analytics import annotate_graph_json
+                annotate_graph_json(payload)
+            from graph_lod import LOD_NODE_BUDGET
+            if len(payload["nodes"]) > LOD_NODE_BUDGET:
+                # Too big to draw at once: clusters the viewer expands on demand (graph_lod.py)
+                with phase("level of detail"):
+                    from graph_lod import save_lod_graph
+                    trace.set(views=save_lod_graph(request_id, payload, layout))
+            else:
+                if use_server_layout(layout, len(payload["nodes"])):
+                    # Positions are saved with the graph, the viewer then draws it once with physics off
+                    with phase("layout"):
+                        from graph_layout import layout_graph_json
+                        layout_graph_json(payload)
+                with phase("save graph"):
+                    save_graph(request_id, payload)
+            network_file = f"{VIEWER_URL}?id={request_id}"
+            if html_file:
+                with phase("render html"):
+                    build_network(output_2_dict, html_file, payload)
+    except (AnalysisError, JobCancelled):
+        raise
+    except Exception as e:
+        raise AnalysisError(describe_error(e)) from e
+
+    return {
+        "result": output,
+        "networkFile": network_file,
+        "graphId": request_id,
+        "error": None
     }
-    print(json.dumps(response))
+
+
+def emit(event):
+    # One JSON object per line, flushed so the API route can forward it immediately
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def run_streaming(args):
+    try:
+        response = analyze(args.file_path, args.user_input, args.mode,
+                           on_token=lambda text: emit({"type": "token", "text": text}),
+                           chunk_chars=args.chunk_chars, request_id=args.request_id, html_file=args.html,
+                           layout=args.layout, ner_filter=args.ner_filter, dedup=args.dedup)
+    except AnalysisError as e:
+        emit({"type": "error", "error": e.line})
+        return None
+    emit({"type": "result", **response})
+    return response
+
+
+def run(args):
+    try:
+        response = analyze(args.file_path, args.user_input, args.mode, chunk_chars=args.chunk_chars,
+                           request_id=args.request_id, html_file=args.html, layout=args.layout,
+                           ner_filter=args.ner_filter, dedup=args.dedup)
+    except AnalysisError as e:
+        print(e.line)
+        print(json.dumps(error_response(e.message)))
+        return None
+    print(response["result"])
+    return response
+
+
+def warm_up():
+    # Load the corpus indexes and open the caches before the first request instead of during it
+    with phase("import corpus_store"):
+        from corpus_store import ID_COLUMNS, load_index
+    for name in ID_COLUMNS:
+        try:
+            with phase(f"load {name} index"):
+                load_index(os.path.join(DATA_DIR, name))
+        except Exception as e:
+            print(f"Could not preload {name}: {e}", file=sys.stderr)
+    shared_cache()
+    shared_graph_store()
+    try:
+        with phase("update search index"):
+            shared_search_index().update()
+    except Exception as e:
+        print(f"Could not update the search index: {e}", file=sys.stderr)
+
+
+def request_options(params, args):
+    mode = params.get("mode") or args.mode
+    layout = params.get("layout") or args.layout
+    if mode not in MODES or layout not in LAYOUTS:
+        raise ValueError(f"Unsupported request (mode={mode}, layout={layout})")
+    return mode, layout
+
+
+def run_job(job, on_token, args):
+    # Called by job_queue.run_jobs for each claimed job; the job id is also the graph id
+    params = job["params"]
+    mode, layout = request_options(params, args)
+    return analyze(params.get("filePath") or "", params.get("userInput") or "", mode, on_token=on_token,
+                   chunk_chars=params.get("chunkChars", args.chunk_chars), request_id=job["id"], layout=layout,
+                   ner_filter=args.ner_filter, dedup=args.dedup)
+
+
+def start_job_runner(args):
+    # Background thread taking jobs off the shared queue while the main thread keeps answering requests
+    from job_queue import JobQueue, run_jobs
+
+    queue = JobQueue()
+    wake = threading.Event()
+    runner = threading.Thread(target=run_jobs, args=(queue, lambda job, on_token: run_job(job, on_token, args)),
+                              kwargs={"wake": wake}, daemon=True)
+    runner.start()
+    return queue, wake
+
+
+def serve(args):
+    # Persistent worker for the API's pool (see src/lib/pythonWorkers.ts), line-delimited JSON over stdin/stdout:
+    #   -> {"id": 1, "method": "analyze", "params": {"filePath": "...", "userInput": "...", "mode": "dual",
+    #                                                 "requestId": "...", "layout": "auto", "stream": true}}
+    #   <- {"id": 1, "type": "token", "text": "..."}   (only when stream is set)
+    #   <- {"id": 1, "type": "result", ...}  or  {"id": 1, "type": "error", "error": "...", "message": "..."}
+    # Jobs (job_queue.py) answer straight away, a background thread in every worker runs them:
+    #   -> {"id": 2, "method": "submit", "params": {same as analyze}}   <- {"id": 2, "type": "result", "job": {...}}
+    #   -> {"id": 3, "method": "status", "params": {"jobId": "...", "since": 0}}
+    #   -> {"id": 4, "method": "cancel", "params": {"jobId": "..."}}
+    # Picking documents by content (search_index.py):
+    #   -> {"id": 5, "method": "search", "params": {"query": "...", "limit": 10, "source": "..."}}
+    #   <- {"id": 5, "type": "result", "results": [{"source", "identifier", "uploaded", "score", "snippet"}]}
+    # Counters in Prometheus text format (metrics.py), for GET /api/metrics:
+    #   -> {"id": 6, "method": "metrics"}   <- {"id": 6, "type": "result", "text": "..."}
+    # One request at a time per worker; the pool runs several workers for concurrency.
+    out = sys.stdout
+    # Anything a library prints must not end up in the protocol stream
+    sys.stdout = sys.stderr
+
+    def send(event):
+        out.write(json.dumps(event) + "\n")
+        out.flush()
+
+    def send_error(call_id, error, message=None):
+        send({"id": call_id, "type": "error", "error": error, "message": message or error})
+
+    warm_up()
+    queue, wake = start_job_runner(args)
+    send({"type": "ready", "pid": os.getpid()})
+    if args.profile_startup:
+        report_timings()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            send_error(None, f"Bad request: {e}")
+            continue
+        call_id = message.get("id")
+        method = message.get("method")
+        params = message.get("params") or {}
+
+        if method == "ping":
+            send({"id": call_id, "type": "result", "pid": os.getpid()})
+            continue
+        if method == "shutdown":
+            send({"id": call_id, "type": "result"})
+            break
+        if method in ("status", "cancel"):
+            job = queue.status(params.get("jobId"), params.get("since") or 0) if method == "status" \
+                else queue.cancel(params.get("jobId"))
+            if job is None:
+                send_error(call_id, "Job not found")
+            else:
+                send({"id": call_id, "type": "result", "job": job})
+            continue
+        if method == "metrics":
+            try:
+                text = get_store().render()
+            except Exception as e:
+                send_error(call_id, describe_error(e))
+            else:
+                send({"id": call_id, "type": "result", "text": text})
+            continue
+        if method == "search":
+            try:
+                index = shared_search_index()
+                index.refresh()
+                results = index.search(params.get("query") or "", int(params.get("limit") or 10), params.get("source"))
+            except Exception as e:
+                send_error(call_id, describe_error(e))
+            else:
+                send({"id": call_id, "type": "result", "results": results})
+            continue
+        if method not in ("analyze", "submit"):
+            send_error(call_id, f"Unsupported request: {method}")
+            continue
+        try:
+            mode, layout = request_options(params, args)
+        except ValueError as e:
+            send_error(call_id, str(e))
+            continue
+
+        if method == "submit":
+            job = queue.submit({
+                "filePath": params.get("filePath") or "",
+                "userInput": params.get("userInput") or "",
+                "mode": mode,
+                "layout": layout,
+                "chunkChars": params.get("chunkChars", args.chunk_chars),
+            })
+            wake.set()
+            send({"id": call_id, "type": "result", "job": job})
+            continue
+
+        on_token = None
+        if params.get("stream"):
+            on_token = lambda text: send({"id": call_id, "type": "token", "text": text})
+        try:
+            response = analyze(params.get("filePath") or "", params.get("userInput") or "", mode,
+                               on_token=on_token, chunk_chars=params.get("chunkChars", args.chunk_chars),
+                               request_id=params.get("requestId"), layout=layout, ner_filter=args.ner_filter,
+                               dedup=args.dedup)
+        except AnalysisError as e:
+            send_error(call_id, e.line, e.message)
+            continue
+        except Exception as e:
+            # A bug in one request must not take the warm worker down with it
+            send_error(call_id, describe_error(e))
+            continue
+        send({"id": call_id, "type": "result", **response})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path", nargs="?")
+    parser.add_argument("user_input", nargs="?")
+    parser.add_argument("--mode", choices=MODES, default=os.environ.get("EXTRACTION_MODE", "dual"),
+                        help="dual: separate narrative and JSON prompts, single: one JSON prompt, narrative built locally")
+    parser.add_argument("--single-pass", dest="mode", action="store_const", const="single")
+    parser.add_argument("--stream", action="store_true",
+                        help="write line-delimited JSON events, streaming the narrative as it is generated")
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS,
+                        help="split longer documents into chunks extracted in parallel (0 disables chunking)")
+    parser.add_argument("--request-id", help="id the graph JSON is saved under (generated if missing)")
+    parser.add_argument("--layout", choices=LAYOUTS, default=os.environ.get("GRAPH_LAYOUT", "auto"),
+                        help="server: compute node positions here, browser: let vis-network physics place them, "
+                             "auto: server for graphs of LAYOUT_MIN_NODES nodes or more")
+    parser.add_argument("--ner-filter", action="store_true", default=os.environ.get("NER_PREFILTER") == "1",
+                        help="tag long documents with the local BERT NER model first and only send sentences "
+                             "naming two or more entities to the LLM")
+    parser.add_argument("--keep-duplicates", dest="dedup", action="store_false",
+                        default=os.environ.get("DEDUP", "1") != "0",
+                        help="send the text as is, without dropping boilerplate headings and repeated sentences "
+                             "first (dedup.py)")
+    parser.add_argument("--html", help="also write a standalone pyvis HTML file to this path")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print import and phase timings to stderr")
+    parser.add_argument("--serve", action="store_true",
+                        help="stay running and answer line-delimited JSON requests on stdin (used by the API worker pool)")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+    elif args.file_path is None or args.user_input is None:
+        parser.error("file_path and user_input are required unless --serve is given")
+    else:
+        response = run_streaming(args) if args.stream else run(args)
+        if args.profile_startup:
+            report_timings(response)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Prompt templates shared by every extraction path.
+# Bump PROMPT_VERSION whenever a template or the output parsing changes so cached extractions are not reused.
+PROMPT_VERSION = "2"
+
+
+def narrative_prompt(text):
+    return f"""
+Please analyze the following text and summarize the involved entities and the relationships between them in a clear, narrative form. For each entity, provide a brief description of what it is. Then, summarize how the entities are related to each other in terms of their interactions or associations.
+
+Output should be structured in the following way:
+
+Here are the involved entities:
+1. Entity Name (Description of what the entity is, role, or type of entity)
+2. Entity Name (Description of what the entity is, role, or type of entity)
+...
+
+Relationships between entities:
+* Entity 1 and Entity 2 are [description of the relationship].
+* Entity 1 and Entity 3 are [description of the relationship].
+...
+
+The text to analyze is:
+{text}
+"""
+
+
+def graph_prompt(text):
+    return f"""
+Please summarize all the relationships between the entities in the following text into a JSON format. 
+For each relationship, include:
+- 'source' (the first entity)
+- 'target' (the related entity)
+- 'description' 'relationship' (a **concise** but **detailed** description)
+
+Provide **only** the JSON output with no additional text, and ensure that the relationships and entities are correctly structured as shown in the example. Do not include any other explanation or output.
+Example structure (do not copy it directly):
+{{
+  "entities": [
+    {{
+      "name": "Entity 1"
+    }},
+    {{
+      "name": "Entity 2"
+    }},
+    {{
+      "name": "Entity 3"
+    }}
+  ], 
+  "relationships": [
+    {{
+      "source": "Entity 1", 
+      "target": "Entity 2", 
+      "description": "relationship description"
+    }},
+    {{
+      "source": "Entity 2", 
+      "target": "Entity 3", 
+      "description": "another relationship description"
+    }}
+  ]
+}}
+{text}
+"""
+
+
+def single_pass_prompt(text):
+    return f"""
+Please analyze the following text and extract the involved entities and the relationships between them into a JSON format.
+For each entity, include:
+- 'name' (the entity name)
+- 'description' (a brief description of what the entity is, its role, or type of entity)
+For each relationship, include:
+- 'source' (the first entity)
+- 'target' (the related entity)
+- 'description' (a **concise** but **detailed** description of the relationship)
+
+Provide **only** the JSON output with no additional text, and ensure that the relationships and entities are correctly structured as shown in the example. Do not include any other explanation or output.
+Example structure (do not copy it directly):
+{{
+  "entities": [
+    {{
+      "name": "Entity 1",
+      "description": "what Entity 1 is"
+    }},
+    {{
+      "name": "Entity 2",
+      "description": "what Entity 2 is"
+    }}
+  ],
+  "relationships": [
+    {{
+      "source": "Entity 1",
+      "target": "Entity 2",
+      "description": "relationship description"
+    }}
+  ]
+}}
+{text}
+"""
@@ -0,0 +1,244 @@
+# Full-text search over the documents of every corpus (bundled workbooks and ingest.py uploads).
+#
+#   python search_index.py update                      # index new or changed documents
+#   python search_index.py search "arms shipment kosovo" --limit 5
+#   python search_index.py stats
+#
+# SQLite FTS5 with BM25 ranking. Only sources whose cache changed since the last update are read again,
+# and within those only documents whose text changed are re-indexed. Queries match every word (the last
+# one as a prefix, so results can follow typing); "quoted words" match as a phrase.
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from corpus_store import ID_COLUMNS, UPLOAD_DIR, cache_paths, ensure_cache, load_index, read_meta
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "search.sqlite")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# A running worker checks the sources for changes at most this often
+REFRESH_SECONDS = float(os.environ.get("SEARCH_REFRESH_SECONDS", "30"))
+QUERY_TERM = re.compile(r'"([^"]+)"|(\w+)', re.UNICODE)
+
+
+def corpus_sources():
+    # (path, uploaded) of every corpus there is to search
+    sources = [(os.path.join(DATA_DIR, name), False) for name in ID_COLUMNS]
+    if os.path.isdir(UPLOAD_DIR):
+        for name in sorted(os.listdir(UPLOAD_DIR)):
+            meta = read_meta(cache_paths(os.path.join(UPLOAD_DIR, name))["meta"])
+            if meta and meta.get("id_column"):
+                sources.append((os.path.join(UPLOAD_DIR, name), True))
+    return sources
+
+
+def source_signature(path):
+    # Changes whenever the cache is rebuilt from a changed file
+    ensure_cache(path)
+    meta = read_meta(cache_paths(path)["meta"]) or {}
+    return f"{meta.get('sha256')}:{meta.get('rows')}:{meta.get('id_column')}:{meta.get('text_column')}"
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def match_query(query):
+    # User input -> FTS5 query: every word must match, quoted words as a phrase, the last word as a prefix.
+    # Quoting each term keeps FTS5 operators and punctuation in the input from being parsed as syntax
+    terms = []
+    for phrase, word in QUERY_TERM.findall(query):
+        terms.append('"' + (phrase or word).replace('"', "") + '"')
+    if not terms:
+        return None
+    if not query.rstrip().endswith('"') and not query.endswith(" "):
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+                text,
+                source UNINDEXED,
+                identifier UNINDEXED,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                doc INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                chars INTEGER NOT NULL,
+                UNIQUE (source, identifier)
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                uploaded INTEGER NOT NULL,
+                signature TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+        """)
+
+    def _index_source(self, path, uploaded, signature):
+        # One transaction per source: the write lock is taken before anything is read, so two worker
+        # processes never both insert the same new document, and readers never see a source half indexed
+        source = os.path.basename(path)
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            # Another process has been indexing for longer than the timeout, the next update retries
+            return None
+        stored = self._conn.execute("SELECT signature FROM sources WHERE source = ?", (source,)).fetchone()
+        if stored is not None and stored[0] == signature:
+            # Indexed by another process since this one looked
+            self._conn.execute("COMMIT")
+            return None
+        known = {
+            identifier: (doc, digest)
+            for identifier, doc, digest in self._conn.execute(
+                "SELECT identifier, doc, hash FROM entries WHERE source = ?", (source,)
+            )
+        }
+        counts = {"added": 0, "changed": 0, "removed": 0}
+        for identifier, text in load_index(path).items():
+            text = text or ""
+            digest = text_hash(text)
+            entry = known.pop(identifier, None)
+            if entry is not None and entry[1] == digest:
+                continue
+            if entry is not None:
+                self._conn.execute("DELETE FROM documents WHERE rowid = ?", (entry[0],))
+                self._conn.execute("DELETE FROM entries WHERE doc = ?", (entry[0],))
+                counts["changed"] += 1
+            else:
+                counts["added"] += 1
+            doc = self._conn.execute(
+                "INSERT INTO entries (source, identifier, hash, chars) VALUES (?, ?, ?, ?)",
+                (source, identifier, digest, len(text)),
+            ).lastrowid
+            self._conn.execute(
+                "INSERT INTO documents (rowid, text, source, identifier) VALUES (?, ?, ?, ?)",
+                (doc, text, source, identifier),
+            )
+        # Whatever was not seen again is gone from the source
+        for doc, _ in known.values():
+            self._conn.execute("DELETE FROM documents WHERE rowid = ?", (doc,))
+            self._conn.execute("DELETE FROM entries WHERE doc = ?", (doc,))
+        counts["removed"] = len(known)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sources (source, uploaded, signature, updated) VALUES (?, ?, ?, ?)",
+            (source, int(uploaded), signature, time.time()),
+        )
+        self._conn.execute("COMMIT")
+        return counts
+
+    def update(self, sources=None):
+        # Re-reads the sources whose signature changed; returns {source: {"added", "changed", "removed"}}
+        prune = sources is None
+        sources = corpus_sources() if sources is None else sources
+        updated = {}
+        with self._lock:
+            stored = dict(self._conn.execute("SELECT source, signature FROM sources"))
+            if prune:
+                # Uploads deleted since the last update
+                gone = set(stored) - {os.path.basename(path) for path, _ in sources}
+                with self._conn:
+                    for source in gone:
+                        self._conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+                        removed = self._conn.execute("DELETE FROM entries WHERE source = ?", (source,)).rowcount
+                        self._conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+                        updated[source] = {"added": 0, "changed": 0, "removed": removed}
+            for path, uploaded in sources:
+                signature = source_signature(path)
+                if stored.get(os.path.basename(path)) == signature:
+                    continue
+                try:
+                    counts = self._index_source(path, uploaded, signature)
+                except BaseException:
+                    if self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                    raise
+                if counts is not None:
+                    updated[os.path.basename(path)] = counts
+            self._checked = time.monotonic()
+        return updated
+
+    def refresh(self):
+        # Cheap enough to call before every search: at most one source check per REFRESH_SECONDS
+        if time.monotonic() - self._checked >= REFRESH_SECONDS:
+            self.update()
+
+    def search(self, query, limit=10, source=None):
+        match = match_query(query)
+        if match is None:
+            return []
+        sql = ("SELECT source, identifier, rank, snippet(documents, 0, '[', ']', '…', 16) "
+               "FROM documents WHERE documents MATCH ?")
+        params = [match]
+        if source:
+            sql += " AND source = ?"
+            params.append(source)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            uploaded = dict(self._conn.execute("SELECT source, uploaded FROM sources"))
+        # bm25() is lower for better matches, the score is flipped so higher is better
+        return [
+            {"source": found_source, "identifier": identifier, "uploaded": bool(uploaded.get(found_source)),
+             "score": round(-rank, 4), "snippet": snippet}
+            for found_source, identifier, rank, snippet in rows
+        ]
+
+    def stats(self):
+        with self._lock:
+            documents = dict(self._conn.execute("SELECT source, COUNT(*) FROM entries GROUP BY source"))
+        return {"documents": documents, "total": sum(documents.values())}
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("update", help="index new and changed documents")
+    search = commands.add_parser("search", help="ranked matches as JSON")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=10)
+    search.add_argument("--source", help="only this workbook or uploaded file")
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    if args.command == "update":
+        started = time.perf_counter()
+        updated = index.update()
+        print(json.dumps({"updated": updated, "seconds": round(time.perf_counter() - started, 3)}))
+    elif args.command == "search":
+        index.update()
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit, args.source)
+        print(f"{len(results)} results in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(index.stats()))
+
+
+if __name__ == "__main__":
+    main()
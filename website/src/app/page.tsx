@@ -1,6 +1,11 @@
 'use client';
-import React, { useState } from 'react';
-import axios from 'axios';
+import React, { useEffect, useRef, useState } from 'react';
+
+type Dataset = { name: string; idColumn: string; textColumn: string; documents: number | null };
+type SearchResult = { selectedOption: string; identifier: string; score: number; snippet: string };
+
+// Wait for a pause in typing before searching
+const SEARCH_DELAY_MS = 200;
 
 const Home: React.FC = () => {
   const [selectedOption, setSelectedOption] = useState<string>('wikileaks_parsed.xlsx');
@@ -10,6 +15,45 @@ const Home: React.FC = () => {
   const [result, setResult] = useState<string | null>(null); // To display result from the backend
   const [networkFilePath, setNetworkFilePath] = useState<string | null>(null); // To hold the network file path
   const [jsonDecodeError, setJsonDecodeError] = useState<boolean>(false); // To check for the specific JSON error
+  const [jobId, setJobId] = useState<string | null>(null); // Queued analysis, so it can be cancelled
+  const following = useRef<AbortController | null>(null); // Stops reading the job's events on cancel
+  const [datasets, setDatasets] = useState<Dataset[]>([]); // Corpora uploaded through /api/datasets
+  const [searchQuery, setSearchQuery] = useState<string>(''); // Words to find a document by
+  const [searchResults, setSearchResults] = useState<SearchResult[]>([]);
+
+  useEffect(() => {
+    fetch('/api/datasets')
+      .then((response) => (response.ok ? response.json() : []))
+      .then(setDatasets)
+      .catch(() => setDatasets([]));
+  }, []);
+
+  useEffect(() => {
+    if (!searchQuery.trim()) {
+      setSearchResults([]);
+      return;
+    }
+    // Typing on cancels the previous search, so an older answer cannot overwrite a newer one
+    const controller = new AbortController();
+    const timer = setTimeout(() => {
+      fetch(`/api/search?q=${encodeURIComponent(searchQuery)}&limit=10`, { signal: controller.signal })
+        .then((response) => (response.ok ? response.json() : []))
+        .then(setSearchResults)
+        .catch(() => {});
+    }, SEARCH_DELAY_MS);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchQuery]);
+
+  const pickSearchResult = (picked: SearchResult) => {
+    setSelectedOption(picked.selectedOption);
+    setUserInput(picked.identifier);
+    setSearchResults([]);
+  };
+
+  const uploaded = datasets.find((dataset) => `upload:${dataset.name}` === selectedOption);
 
   const handleOptionChange = (e: React.ChangeEvent<HTMLSelectElement>) => {
     setSelectedOption(e.target.value);
@@ -20,6 +64,20 @@ const Home: React.FC = () => {
     setUserInput(e.target.value); // Update the filename the user enters
   };
   
+  const handleError = (error: string) => {
+    console.log(error)
+    if (error.includes('JSON Decode Error:')) {
+      // If specific error found, set state to indicate the error
+      setJsonDecodeError(true);
+    } else if (error.includes('Error: Selected data not found')) {
+      setMessage('Error processing data, selected data not found.');
+    } else if (error.includes('Error: Expected at least 3 keys')) {
+      setMessage('Error processing data, please try again later.');
+    } else {
+      setMessage('Error processing the request');
+    }
+  };
+
   const handleSubmit = async () => {
     if (!userInput) {
       alert('Please fill in the input.');
@@ -33,41 +91,116 @@ const Home: React.FC = () => {
 
     try {
       const form = { selectedOption, userInput };
-      
-      // Call the backend API
-      const response = await axios.post('/api/analyze', form);
-      console.log(response.data)
-      console.log(response.data.error)
-      console.log(response.data.result)
-      if (response.data.result.includes('JSON Decode Error:')) {
-        // If specific error found, set state to indicate the error
-        setJsonDecodeError(true);
-       
+
+      // Queue the analysis; an identical request already in progress is shared instead of run twice
+      const submitted = await fetch('/api/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(form),
+      });
+      if (!submitted.ok) {
+        throw new Error(`Request failed with status ${submitted.status}`);
+      }
+      const job = await submitted.json();
+      setJobId(job.jobId);
+
+      // Follow the job and show the narrative while it is still being generated
+      following.current = new AbortController();
+      const response = await fetch(`/api/jobs?id=${encodeURIComponent(job.jobId)}&stream=1`, {
+        signal: following.current.signal,
+      });
+      if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`);
       }
-      if (response.data.result.includes('Error: Selected data not found')) {
-        setMessage('Error processing data, selected data not found.');
-        
-        
-      }else if(response.data.result.includes('Error: Expected at least 3 keys')){
-        setMessage('Error processing data, please try again later.');
-      } 
-       else {
-        setMessage('Data processed successfully!');
-        setResult(response.data.result); // Set the result data
-        setNetworkFilePath(response.data.networkFile); // Set the file path for entity-network.html
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      let streamed = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop() ?? '';
+
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event = JSON.parse(line);
+          if (event.type === 'status') {
+            if (event.status === 'queued') {
+              setMessage(event.queuePosition ? `Waiting in queue (${event.queuePosition} ahead)...` : 'Waiting in queue...');
+            } else if (event.status === 'running') {
+              setMessage(null);
+            } else if (event.status === 'cancelled') {
+              setMessage('Request cancelled.');
+            }
+          } else if (event.type === 'token') {
+            streamed += event.text;
+            setResult(streamed);
+          } else if (event.type === 'error') {
+            handleError(event.error);
+          } else if (event.type === 'result') {
+            setMessage('Data processed successfully!');
+            setResult(event.result); // Set the result data
+            setNetworkFilePath(event.networkFile); // Set the file path for entity-network.html
+          }
+        }
       }
     } catch (error) {
-      setMessage('Error processing the request');
-      console.error(error);
+      if (following.current?.signal.aborted) {
+        setMessage('Request cancelled.');
+      } else {
+        setMessage('Error processing the request');
+        console.error(error);
+      }
     } finally {
       setLoading(false);
+      setJobId(null);
+      following.current = null;
+    }
+  };
+
+  const handleCancel = async () => {
+    if (jobId) {
+      // Other users waiting on the same job keep it running, this page just stops following it
+      await fetch(`/api/jobs?id=${encodeURIComponent(jobId)}`, { method: 'DELETE' });
+      following.current?.abort();
     }
   };
 
   return (
     <div className="container mx-auto p-8 bg-gray-50 rounded-lg shadow-md max-w-2xl mt-5">
       <h1 className="text-3xl font-semibold text-center text-gray-800 mb-6">Data Upload and Processing</h1>
-      
+
+      <div className="mb-4">
+        <label htmlFor="search" className="block text-lg font-medium text-gray-700">Find a document by content:</label>
+        <input
+          type="search"
+          id="search"
+          value={searchQuery}
+          onChange={(e) => setSearchQuery(e.target.value)}
+          placeholder='e.g. arms shipment or "prime minister"'
+          className="w-full p-3 mt-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-2 focus:ring-blue-400 text-black"
+        />
+        {searchResults.length > 0 && (
+          <ul className="mt-2 border border-gray-300 rounded-md divide-y divide-gray-200 bg-white">
+            {searchResults.map((found) => (
+              <li key={`${found.selectedOption}/${found.identifier}`}>
+                <button
+                  onClick={() => pickSearchResult(found)}
+                  className="w-full text-left p-3 hover:bg-blue-50"
+                >
+                  <p className="text-sm font-medium text-gray-800 truncate">{found.identifier}</p>
+                  <p className="text-xs text-gray-500">{found.selectedOption.replace(/^upload:/, '')}</p>
+                  <p className="text-sm text-gray-700">{found.snippet}</p>
+                </button>
+              </li>
+            ))}
+          </ul>
+        )}
+      </div>
+
       <div className="mb-4">
         <label htmlFor="option" className="block text-lg font-medium text-gray-700">Select Option:</label>
         <select
@@ -79,6 +212,11 @@ const Home: React.FC = () => {
           <option value="wikileaks_parsed.xlsx" className="text-black">wikileaks_parsed.xlsx</option>
           <option value="news_excerpts_parsed.xlsx" className="text-black">news_excerpts_parsed.xlsx</option>
           <option value="test" className="text-black">Upload your own text</option>
+          {datasets.map((dataset) => (
+            <option key={dataset.name} value={`upload:${dataset.name}`} className="text-black">
+              {dataset.name}
+            </option>
+          ))}
         </select>
       </div>
 
@@ -106,6 +244,18 @@ const Home: React.FC = () => {
           />
         </div>
       )}
+      {uploaded && (
+        <div className="mb-4">
+          <label htmlFor="userInput" className="block text-lg font-medium text-gray-700">Enter {uploaded.idColumn}:</label>
+          <input
+            type="text"
+            id="userInput"
+            value={userInput}
+            onChange={handleUserInputChange}
+            className="w-full p-3 mt-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-2 focus:ring-blue-400  text-black"
+          />
+        </div>
+      )}
       {selectedOption === 'test' && (
         <div className="mb-4">
           <label htmlFor="userInput" className="block text-lg font-medium text-gray-700">Enter Text:</label>
@@ -130,6 +280,14 @@ const Home: React.FC = () => {
           )}
           {loading ? 'Processing...' : 'Submit'}
         </button>
+        {loading && jobId && (
+          <button
+            onClick={handleCancel}
+            className="p-3 bg-gray-600 text-white font-semibold rounded-md shadow-md hover:bg-gray-700"
+          >
+            Cancel
+          </button>
+        )}
       </div>
 
 
@@ -0,0 +1,224 @@
+import { spawn, type ChildProcessWithoutNullStreams } from 'child_process';
+import path from 'path';
+import readline from 'readline';
+
+// Pool of long-running `process_data.py --serve` workers. Each keeps the interpreter, the corpus
+// indexes, the caches and the model connection warm, so a request no longer pays for a cold start.
+// Requests go to an idle worker or wait in line; a worker that dies is replaced on the next request.
+
+export type WorkerEvent = {
+  type: 'token' | 'result' | 'error';
+  [key: string]: unknown;
+};
+
+export type AnalyzeParams = {
+  filePath: string;
+  userInput: string;
+  requestId: string;
+  mode?: 'dual' | 'single';
+  layout?: 'auto' | 'server' | 'browser';
+  stream?: boolean;
+};
+
+export type JobParams = Omit<AnalyzeParams, 'requestId' | 'stream'>;
+
+type Job = {
+  method: string;
+  params: object;
+  onEvent: (event: WorkerEvent) => void;
+  resolve: (event: WorkerEvent) => void;
+};
+
+// Uploaded dataset file names (data/uploads/, see ingest.py); also what POST /api/datasets accepts
+export const DATASET_NAME = /^[A-Za-z0-9][A-Za-z0-9_.-]{0,100}\.(xlsx|csv|jsonl|ndjson)$/;
+
+// selectedOption from the form -> the file_path process_data.py expects ('' for pasted text), null if unknown.
+// 'upload:<name>' picks an uploaded dataset
+export const filePathFor = (selectedOption: string) => {
+  if (selectedOption === 'wikileaks_parsed.xlsx' || selectedOption === 'news_excerpts_parsed.xlsx') {
+    return path.resolve('data', selectedOption);
+  }
+  if (selectedOption === 'test') {
+    return '';
+  }
+  if (selectedOption.startsWith('upload:') && DATASET_NAME.test(selectedOption.slice('upload:'.length))) {
+    return path.resolve('data', 'uploads', selectedOption.slice('upload:'.length));
+  }
+  return null;
+};
+
+const POOL_SIZE = Math.max(1, Number(process.env.PYTHON_WORKERS ?? 2));
+const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
+
+// What the API used to answer when the spawned script exited with an error
+const workerFailure = (message: string): WorkerEvent => ({
+  type: 'error',
+  error: 'Error executing Python script',
+  message,
+  workerFailed: true,
+});
+
+class PythonWorker {
+  private child: ChildProcessWithoutNullStreams;
+  private current: { id: number; job: Job } | null = null;
+  private nextId = 1;
+  ready: Promise<void>;
+  alive = true;
+
+  constructor(
+    private onIdle: (worker: PythonWorker) => void,
+    private onExit: () => void,
+  ) {
+    this.child = spawn(pythonCmd, ['process_data.py', '--serve']);
+    const lines = readline.createInterface({ input: this.child.stdout });
+
+    let markReady: () => void;
+    this.ready = new Promise((resolve) => {
+      markReady = resolve;
+    });
+
+    lines.on('line', (line) => {
+      let event: WorkerEvent & { id?: number };
+      try {
+        event = JSON.parse(line);
+      } catch {
+        console.error('worker: unexpected output ' + line);
+        return;
+      }
+      if ((event.type as string) === 'ready') {
+        markReady();
+        return;
+      }
+      if (!this.current || event.id !== this.current.id) {
+        return;
+      }
+      const { id: _id, ...payload } = event;
+      if (event.type === 'token') {
+        this.current.job.onEvent(payload as WorkerEvent);
+        return;
+      }
+      const { job } = this.current;
+      this.current = null;
+      job.resolve(payload as WorkerEvent);
+      this.onIdle(this);
+    });
+
+    this.child.stderr.on('data', (data) => {
+      console.error('stderr: ' + data.toString());
+    });
+
+    const fail = (reason: string) => {
+      if (!this.alive) {
+        return;
+      }
+      this.alive = false;
+      markReady();
+      if (this.current) {
+        const { job } = this.current;
+        this.current = null;
+        job.resolve(workerFailure(reason));
+      }
+      this.onExit();
+    };
+    this.child.on('exit', (code) => fail(`worker exited with code ${code}`));
+    this.child.on('error', (error) => fail(`worker failed: ${error.message}`));
+  }
+
+  run(job: Job) {
+    const id = this.nextId++;
+    this.current = { id, job };
+    this.child.stdin.write(JSON.stringify({ id, method: job.method, params: job.params }) + '\n');
+  }
+}
+
+class WorkerPool {
+  private workers: PythonWorker[] = [];
+  private idle: PythonWorker[] = [];
+  private waiting: Job[] = [];
+
+  private release = (worker: PythonWorker) => {
+    const job = this.waiting.shift();
+    if (job) {
+      worker.run(job);
+    } else {
+      this.idle.push(worker);
+    }
+  };
+
+  // A dead worker is only replaced right away when requests are waiting, otherwise on the next request
+  private replace = () => {
+    if (this.waiting.length) {
+      this.fill();
+    }
+  };
+
+  private async start() {
+    const worker = new PythonWorker(this.release, this.replace);
+    this.workers.push(worker);
+    await worker.ready;
+    if (worker.alive) {
+      this.release(worker);
+      return;
+    }
+    // Failed to start (missing interpreter, import error...): fail waiting jobs instead of leaving them hanging
+    if (!this.workers.some((other) => other.alive)) {
+      for (const job of this.waiting.splice(0)) {
+        job.resolve(workerFailure('no Python worker could start'));
+      }
+    }
+  }
+
+  private fill() {
+    this.workers = this.workers.filter((worker) => worker.alive);
+    this.idle = this.idle.filter((worker) => worker.alive);
+    while (this.workers.length < POOL_SIZE) {
+      this.start();
+    }
+  }
+
+  // Resolves with the final 'result' or 'error' event; 'token' events go to onEvent as they arrive
+  call(method: string, params: object, onEvent: (event: WorkerEvent) => void = () => {}) {
+    return new Promise<WorkerEvent>((resolve) => {
+      this.fill();
+      const job = { method, params, onEvent, resolve };
+      const worker = this.idle.pop();
+      if (worker) {
+        worker.run(job);
+      } else {
+        this.waiting.push(job);
+      }
+    });
+  }
+
+  analyze(params: AnalyzeParams, onEvent?: (event: WorkerEvent) => void) {
+    return this.call('analyze', params, onEvent);
+  }
+
+  // Job queue (job_queue.py): submit answers at once with the job, which any worker's runner thread picks up
+  submitJob(params: JobParams) {
+    return this.call('submit', params);
+  }
+
+  jobStatus(jobId: string, since = 0) {
+    return this.call('status', { jobId, since });
+  }
+
+  cancelJob(jobId: string) {
+    return this.call('cancel', { jobId });
+  }
+
+  // Ranked documents of every corpus matching the query (search_index.py)
+  search(query: string, limit = 10, source?: string) {
+    return this.call('search', { query, limit, source });
+  }
+
+  // Prometheus text of the counters every worker adds to (metrics.py)
+  metrics() {
+    return this.call('metrics', {});
+  }
+}
+
+// Kept on globalThis so dev-mode hot reloads do not start a new set of workers each time
+const globalPool = globalThis as unknown as { pythonWorkers?: WorkerPool };
+
+export const pythonWorkers = globalPool.pythonWorkers ?? (globalPool.pythonWorkers = new WorkerPool());